@@ -7,3 +7,7 @@ from django.apps import AppConfig
 
 class Consommations(AppConfig):
     name = 'consommations'
+
+    def ready(self):
+        # Mise à jour des places prises lors des modifications de consommations
+        from consommations import signals
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2019-2021 Ivan LUCAS.
+#  Noethysweb, application de gestion multi-activités.
+#  Distribué sous licence GNU GPL.
+
+import threading
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from core.models import Consommation
+from consommations.utils import utils_places
+
+# Journées (IDactivite, date) dont les places prises sont à recalculer à la validation de la transaction
+EN_ATTENTE = threading.local()
+
+
+@receiver(post_save, sender=Consommation)
+def Actualiser_places(sender, instance, **kwargs):
+    # Les enregistrements groupés (bulk_create, bulk_update...) appellent directement utils_places
+    utils_places.Actualiser([(instance.activite_id, instance.date)])
+
+
+@receiver(post_delete, sender=Consommation)
+def Actualiser_places_suppression(sender, instance, **kwargs):
+    # Une suppression en cascade (inscription, famille, individu...) supprime de nombreuses consommations :
+    # chaque journée n'est recalculée qu'une fois, après la validation de la transaction
+    if not hasattr(EN_ATTENTE, "cles"):
+        EN_ATTENTE.cles = set()
+    EN_ATTENTE.cles.add((instance.activite_id, instance.date))
+    transaction.on_commit(Actualiser_places_en_attente)
+
+
+def Actualiser_places_en_attente():
+    # Le premier appel traite toutes les journées en attente, les suivants ne trouvent plus rien
+    cles, EN_ATTENTE.cles = getattr(EN_ATTENTE, "cles", set()), set()
+    if cles:
+        utils_places.Actualiser(cles)
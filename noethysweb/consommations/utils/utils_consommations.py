@@ -10,3 +10,22 @@ def Get_label_etat(etat="reservation"):
         if code == etat:
             return label
     return ""
+
+
+def Indexer_inscriptions(liste_inscriptions=[]):
+    """ Indexe en un seul passage les individus, familles et différences entre inscriptions multiples d'une liste d'inscriptions """
+    individus, familles, keys_individus, differences, inscriptions_by_individu = {}, {}, {}, {}, {}
+    for inscription in liste_inscriptions:
+        individus.setdefault(inscription.individu_id, inscription.individu)
+        familles.setdefault(inscription.famille_id, inscription.famille)
+        keys_individus[(inscription.individu_id, inscription.famille_id)] = None
+        # Valeurs distinctes des inscriptions d'un individu à une même activité
+        dict_differences = differences.setdefault((inscription.individu_id, inscription.activite_id), {"groupe": {}, "famille": {}, "categorie_tarif": {}})
+        dict_differences["groupe"][inscription.groupe_id] = None
+        dict_differences["famille"][inscription.famille_id] = None
+        dict_differences["categorie_tarif"][inscription.categorie_tarif_id] = None
+        inscriptions_by_individu.setdefault((inscription.individu, inscription.famille_id), []).append(inscription)
+    return {
+        "individus": individus, "familles": familles, "keys_individus": list(keys_individus.keys()),
+        "differences": differences, "inscriptions_by_individu": inscriptions_by_individu,
+    }
@@ -3,12 +3,20 @@
 #  Noethysweb, application de gestion multi-activités.
 #  Distribué sous licence GNU GPL.
 
-import logging, uuid, json, time
+import logging, uuid, time
 logger = logging.getLogger(__name__)
-from django.forms.models import model_to_dict
-from core.models import Inscription, Activite, Consommation
+from core.models import Inscription, Consommation
+from core.utils import utils_cache
 from consommations.views.grille import Get_periode, Get_generic_data, Save_grille, Facturation
 
+# Champs de la consommation repris dans le dict de la grille (identiques à ceux de model_to_dict)
+CHAMPS_CONSO = [(champ.name, champ.attname) for champ in Consommation._meta.concrete_fields if champ.editable]
+
+
+def Get_dict_conso(conso=None):
+    """ Convertit une consommation en dict de la grille """
+    return {nom: getattr(conso, attname) for nom, attname in CHAMPS_CONSO}
+
 
 class Grille_virtuelle():
     """ Exemple d'utilisation :
@@ -19,13 +27,17 @@ class Grille_virtuelle():
     grille.Supprimer(criteres={"unite": 1})
     grille.Enregistrer()
     """
-    def __init__(self, request=None, idfamille=None, idindividu=None, idactivite=None, date_min=None, date_max=None):
+    def __init__(self, request=None, idfamille=None, idindividu=None, idactivite=None, date_min=None, date_max=None, inscriptions=None):
+        """ Préciser idfamille et idindividu OU une liste d'inscriptions de l'activité pour un traitement par lot """
         self.request = request
         self.chrono = time.time()
         self.conso_supprimees = []
 
+        if inscriptions is None:
+            inscriptions = Inscription.objects.select_related('individu', 'activite', 'groupe', 'famille', 'categorie_tarif').filter(famille__pk=idfamille, individu__pk=idindividu, activite__pk=idactivite)
+
         self.data_initial = {
-            "mode": "individu",
+            "mode": "individu" if idfamille else "lot",
             "idfamille": idfamille,
             "memos": {},
             "prestations": {},
@@ -33,28 +45,23 @@ class Grille_virtuelle():
             "options": {},
             "periode": {'mode': 'jour', 'selections': {'jour': None}, 'periodes': ['%s;%s' % (date_min, date_max)]},
             "selection_individus": [idindividu,],
-            "selection_activite": Activite.objects.get(pk=idactivite),
+            "selection_activite": utils_cache.Get_activite(idactivite),
             "dict_suppressions": {"consommations": [], "prestations": [], "memos": []},
-            "liste_inscriptions": Inscription.objects.select_related('individu', 'activite', 'groupe', 'famille', 'categorie_tarif').filter(famille__pk=idfamille, individu__pk=idindividu, activite__pk=idactivite),
+            "liste_inscriptions": inscriptions,
         }
 
         # Récupération de la période
         self.data_initial = Get_periode(self.data_initial)
 
-        # Incorpore les données génériques
-        self.data_initial.update(Get_generic_data(self.data_initial))
-
-        # Incorpore les prestations initiales
-        self.data_initial["prestations"] = json.loads(self.data_initial["dict_prestations_json"])
+        # Incorpore les données génériques (dont les prestations initiales)
+        self.data_initial.update(Get_generic_data(self.data_initial, navigateur=False))
 
         # Incorpore les événements
         dict_evenements = {}
-        for evenement in json.loads(self.data_initial["liste_evenements_json"]):
-            key_evenement = "%s_%s_%s" % (evenement["fields"]["date"], evenement["fields"]["unite"], evenement["fields"]["groupe"])
+        for evenement in self.data_initial["liste_evenements"]:
+            key_evenement = "%s_%s_%s" % (evenement.date, evenement.unite_id, evenement.groupe_id)
             dict_evenements.setdefault(key_evenement, [])
-            dict_evenement = evenement["fields"]
-            dict_evenement["pk"] = evenement["pk"]
-            dict_evenements[key_evenement].append(dict_evenement)
+            dict_evenements[key_evenement].append({"pk": evenement.pk})
 
         # Création des cases
         self.dict_cases = {}
@@ -88,7 +95,7 @@ class Grille_virtuelle():
             if conso.evenement:
                 key_case = "event_%s_%d" % (key_case, conso.evenement_id)
 
-            dict_conso = model_to_dict(conso)
+            dict_conso = Get_dict_conso(conso)
             dict_conso["pk"] = conso.idconso
             dict_conso["key_case"] = key_case
             dict_conso["famille"] = conso.inscription.famille_id
@@ -122,7 +129,7 @@ class Grille_virtuelle():
                 # Création d'une nouvelle conso
                 key_conso = "%s_%s" % (dict_case["date"], dict_case["inscription"])
                 conso = Consommation()
-                dict_conso = model_to_dict(conso)
+                dict_conso = Get_dict_conso(conso)
                 dict_conso.update(dict_case)
                 dict_conso["pk"] = uuid.uuid4()
                 dict_conso["key_case"] = key_case
@@ -206,12 +213,14 @@ class Grille_virtuelle():
         facturation = Facturation(donnees=self.data_initial)
         donnees_retour = facturation.Facturer()
 
-        # Modifie le IDprestation des consommations
+        # Modifie le IDprestation des consommations (indexées par case pour ne pas les parcourir pour chaque case)
+        dict_conso_cases = {}
+        for liste_conso in self.data_initial["consommations"].values():
+            for dict_conso in liste_conso:
+                dict_conso_cases.setdefault(dict_conso["key_case"], []).append(dict_conso)
         for key_case, idprestation in donnees_retour["modifications_idprestation"].items():
-            for key_conso, liste_conso in self.data_initial["consommations"].items():
-                for dict_conso in liste_conso:
-                    if dict_conso["key_case"] == key_case:
-                        dict_conso["prestation"] = idprestation
+            for dict_conso in dict_conso_cases.get(key_case, []):
+                dict_conso["prestation"] = idprestation
 
         # Ajoute les nouvelles prestations
         self.data_initial["prestations"].update(donnees_retour["nouvelles_prestations"])
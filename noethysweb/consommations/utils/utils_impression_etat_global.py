@@ -9,7 +9,7 @@ from reportlab.platypus import Paragraph, Spacer, Table, TableStyle
 from reportlab.lib.styles import ParagraphStyle
 from reportlab.lib.pagesizes import A4, portrait, landscape
 from reportlab.lib import colors
-from core.utils import utils_dates, utils_impression, utils_infos_individus, utils_dictionnaires
+from core.utils import utils_dates, utils_impression, utils_infos_individus, utils_dictionnaires, utils_resolveur_formule
 from core.models import Evenement, Regime, Vacance, Activite, Quotient, TarifLigne, Consommation, Famille, Individu
 
 
@@ -17,6 +17,22 @@ from core.models import Evenement, Regime, Vacance, Activite, Quotient, TarifLig
 REGEX_UNITES = re.compile(r"unite[0-9]+")
 
 
+def SI(condition=None, alors=None, sinon=datetime.timedelta(minutes=0)):
+    if condition:
+        return alors
+    else:
+        return sinon
+
+
+def HEURE(texte=""):
+    """ Convertit un texte du type '9h', '7h30' ou '07:30' en durée """
+    return utils_dates.HeureStrEnDelta(texte)
+
+
+# Fonctions utilisables dans les formules
+FONCTIONS_FORMULE = {"SI": SI, "HEURE": HEURE}
+
+
 class Unite():
     def __init__(self, IDunite=None, heure_debut=None, heure_fin=None, etat=None, quantite=1):
         # Mémorisation des variables de l'unité
@@ -723,28 +739,17 @@ class Impression(utils_impression.Impression):
     def Calcule_formule(self, formule="", date=None, debut=None, fin=None):
         debut = utils_dates.TimeEnDelta(debut)
         fin = utils_dates.TimeEnDelta(fin)
-        duree = fin - debut
-
-        def SI(condition=None, alors=None, sinon=datetime.timedelta(minutes=0)):
-            if condition:
-                return alors
-            else:
-                return sinon
 
-        # Remplacements
-        remplacements = [("\n", ""), ("ET", "and"), ("OU", "or")]
-        for expression, remplacement in remplacements:
-            formule = formule.replace(expression, remplacement)
+        # La formule n'est analysée qu'une seule fois pour tout l'état
+        expression = utils_resolveur_formule.CompilerExpression(formule, FONCTIONS_FORMULE)
 
-        # Unités
-        dict_unites_date = self.dict_unites.get(date)
-        for code_unite in REGEX_UNITES.findall(formule):
-            unite = dict_unites_date.get(code_unite, None)
-            setattr(self, code_unite, unite)
-            formule = formule.replace(code_unite, "self.%s" % code_unite)
+        # Valeurs des variables : unités absentes de la date = None
+        dict_unites_date = self.dict_unites.get(date, {})
+        valeurs = {variable: dict_unites_date.get(variable, None) for variable in expression.variables if REGEX_UNITES.fullmatch(variable)}
+        valeurs.update(debut=debut, fin=fin, duree=fin - debut)
 
         # Calcul de la formule
-        resultat = eval(formule)
+        resultat = expression.Evaluer(valeurs)
         if resultat == None :
             resultat = datetime.timedelta(minutes=0)
         if type(resultat) == int:
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2019-2021 Ivan LUCAS.
+#  Noethysweb, application de gestion multi-activités.
+#  Distribué sous licence GNU GPL.
+
+import logging
+logger = logging.getLogger(__name__)
+from django.db import transaction
+from django.db.models import Q, Sum, Case, When, F, IntegerField
+from core.models import Consommation, PlacesPrises, Activite
+
+# Etats des consommations qui occupent une place
+ETATS_PLACES = ("reservation", "present", "attente")
+
+# Nombre maximal de dates recalculées par requête
+TAILLE_PAQUET = 200
+
+# Une consommation sans quantité occupe une place
+QUANTITE_PLACES = Case(When(Q(quantite__isnull=True) | Q(quantite=0), then=1), default=F("quantite"), output_field=IntegerField())
+
+
+def Get_cles(consommations=None):
+    """ Renvoie les couples (IDactivite, date) concernés par une liste ou un queryset de consommations """
+    if hasattr(consommations, "values_list"):
+        return set(consommations.values_list("activite_id", "date"))
+    return {(conso.activite_id, conso.date) for conso in consommations}
+
+
+def Actualiser(cles=None):
+    """ Recalcule les places prises pour des couples (IDactivite, date) """
+    dict_dates = {}
+    for idactivite, date in cles:
+        if idactivite and date:
+            dict_dates.setdefault(idactivite, set()).add(date)
+
+    for idactivite, toutes_dates in dict_dates.items():
+        toutes_dates = sorted(toutes_dates, key=str)
+        for index in range(0, len(toutes_dates), TAILLE_PAQUET):
+            Actualiser_dates(idactivite, toutes_dates[index:index + TAILLE_PAQUET])
+
+
+def Actualiser_dates(idactivite=None, dates=[]):
+    """ Recalcule les places prises d'une activité pour quelques dates """
+    with transaction.atomic():
+        # Verrouillage de l'activité pour que deux enregistrements simultanés ne se croisent pas
+        Activite.objects.select_for_update().filter(pk=idactivite).first()
+        PlacesPrises.objects.filter(activite_id=idactivite, date__in=dates).delete()
+        liste_places = Consommation.objects.filter(activite_id=idactivite, date__in=dates, etat__in=ETATS_PLACES, unite__isnull=False).values("date", "unite", "groupe", "evenement").annotate(places=Sum(QUANTITE_PLACES), attente=Sum(QUANTITE_PLACES, filter=Q(etat="attente")))
+        PlacesPrises.objects.bulk_create([PlacesPrises(activite_id=idactivite, date=p["date"], unite_id=p["unite"], groupe_id=p["groupe"], evenement_id=p["evenement"], places=p["places"], attente=p["attente"] or 0) for p in liste_places], batch_size=500)
+
+
+def Actualiser_consommations(consommations=None):
+    """ Recalcule les places prises des journées d'une liste ou d'un queryset de consommations """
+    Actualiser(Get_cles(consommations))
+
+
+def Reconstruire(activite=None):
+    """ Recalcule toutes les places prises, éventuellement pour une seule activité """
+    consommations = Consommation.objects.filter(etat__in=ETATS_PLACES)
+    if activite:
+        consommations = consommations.filter(activite=activite)
+    cles = set(consommations.values_list("activite_id", "date").distinct())
+    # Suppression des journées qui n'ont plus de consommations
+    places_obsoletes = PlacesPrises.objects.filter(activite=activite) if activite else PlacesPrises.objects.all()
+    cles.update(places_obsoletes.values_list("activite_id", "date").distinct())
+    Actualiser(cles)
+    return len(cles)
+
+
+def Get_places_prises(activites=[], conditions_periodes=Q(), attente=True):
+    """ Renvoie les places prises des activités par journée : [(date, IDunite, IDgroupe, IDevenement, places), ...] """
+    for date, idunite, idgroupe, idevenement, places, places_attente in PlacesPrises.objects.filter(conditions_periodes, activite__in=activites).values_list("date", "unite_id", "groupe_id", "evenement_id", "places", "attente"):
+        if not attente:
+            places -= places_attente
+        if places:
+            yield date, idunite, idgroupe, idevenement, places
+
+
+def Get_dict_places(activite=None, conditions_periodes=Q(), consommations_exclues=None):
+    """ Renvoie le dict des places prises {date_unite_groupe[_evenement]: places}, sans les consommations exclues """
+    dict_places = {}
+
+    def Ajouter(date, idunite, idgroupe, idevenement, quantite):
+        for groupe in {idgroupe or 0, 0}:
+            key = "%s_%d_%d" % (date, idunite, groupe)
+            dict_places[key] = dict_places.get(key, 0) + quantite
+            if idevenement:
+                key += "_%d" % idevenement
+                dict_places[key] = dict_places.get(key, 0) + quantite
+
+    for p in PlacesPrises.objects.filter(conditions_periodes, activite=activite).values_list("date", "unite_id", "groupe_id", "evenement_id", "places"):
+        Ajouter(*p)
+
+    # Retire les consommations déjà affichées dans la grille (elles sont comptées côté navigateur)
+    for conso in consommations_exclues or []:
+        if conso.activite_id == getattr(activite, "pk", activite) and conso.etat in ETATS_PLACES:
+            Ajouter(conso.date, conso.unite_id, conso.groupe_id, conso.evenement_id, -(conso.quantite or 1))
+
+    return dict_places
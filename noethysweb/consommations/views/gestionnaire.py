@@ -105,23 +105,23 @@ class View(CustomView, TemplateView):
         data["liste_conso_json"] = serializers.serialize('json', data["liste_conso"])
 
         # Recherche les individus présents
-        liste_idinscriptions = list({conso.inscription_id:None for conso in data["liste_conso"]}.keys())
+        dict_idinscriptions = {conso.inscription_id: None for conso in data["liste_conso"]}
 
         # Ajoute les éventuelles inscriptions des individus ajoutés manuellement
         selection_idactivite = data["selection_activite"].pk if data["selection_activite"] else None
         for key_case, dict_conso in data["consommations"].items():
             for conso in dict_conso:
-                if conso["inscription"] not in liste_idinscriptions and str(conso["date"]) == str(data["date_min"]) and conso["activite"] == selection_idactivite and (not data["selection_groupes"] or conso["groupe"] in data["selection_groupes"]):
-                    liste_idinscriptions.append(conso["inscription"])
+                if conso["inscription"] not in dict_idinscriptions and str(conso["date"]) == str(data["date_min"]) and conso["activite"] == selection_idactivite and (not data["selection_groupes"] or conso["groupe"] in data["selection_groupes"]):
+                    dict_idinscriptions[conso["inscription"]] = None
 
         # Ajouter un nouvel individu
         ajouter_individu = self.request.POST.get("donnees_ajouter_individu")
         if ajouter_individu and not ajouter_individu.startswith("INSCRITS"):
             selection_ajouter_individu = [int(idindividu) for idindividu in ajouter_individu.split(";")]
             for inscription in Inscription.objects.select_related("individu").filter(individu_id__in=selection_ajouter_individu, activite=data["selection_activite"]):
-                if inscription.pk not in liste_idinscriptions:
+                if inscription.pk not in dict_idinscriptions:
                     if inscription.Is_inscription_in_periode(data["date_min"], data["date_max"]):
-                        liste_idinscriptions.append(inscription.pk)
+                        dict_idinscriptions[inscription.pk] = None
                     else:
                         messages.add_message(self.request, messages.INFO, "L'inscription de %s n'est pas active sur cette date" % inscription.individu.Get_nom())
 
@@ -149,9 +149,9 @@ class View(CustomView, TemplateView):
         if ajouter_individu == "INSCRITS_TOUS":
             conditions &= Q(activite=data["selection_activite"])
         elif ajouter_individu and ajouter_individu.startswith("INSCRITS_GROUPE"):
-            conditions &= Q(activite=data["selection_activite"], groupe_id=int(ajouter_individu.split(":")[1])) | Q(pk__in=liste_idinscriptions)
+            conditions &= Q(activite=data["selection_activite"], groupe_id=int(ajouter_individu.split(":")[1])) | Q(pk__in=list(dict_idinscriptions.keys()))
         else:
-            conditions &= Q(pk__in=liste_idinscriptions)
+            conditions &= Q(pk__in=list(dict_idinscriptions.keys()))
 
         if len(data["selection_classes"]) < len(data["liste_classes"]):
             conditions &= Q(individu__scolarite__classe_id__in=data["selection_classes"])
@@ -13,8 +13,8 @@ from django.db.models import Q, Count
 from django.core import serializers
 from core.models import Ouverture, Remplissage, UniteRemplissage, Vacance, Unite, Consommation, MemoJournee, Evenement, Groupe, Individu, Ventilation, Famille, \
                         Tarif, CombiTarif, TarifLigne, Quotient, Prestation, Aide, Deduction, CombiAide, Ferie, Individu, Activite, Classe, Scolarite, QuestionnaireReponse
-from core.utils import utils_dates, utils_dictionnaires, utils_db, utils_texte, utils_decimal, utils_historique
-from consommations.utils import utils_consommations
+from core.utils import utils_dates, utils_dictionnaires, utils_db, utils_texte, utils_decimal, utils_historique, utils_cache, utils_sqlite
+from consommations.utils import utils_consommations, utils_places
 
 
 def Get_individus(request):
@@ -50,23 +50,25 @@ def Get_periode(data):
 
 
 def Maj_tarifs_fratries(activite=None, prestations=[], liste_IDprestation_existants=[]):
-    liste_tarifs_speciaux = Tarif.objects.filter(activite=activite, methode__contains="nbre_ind")
+    liste_tarifs_speciaux = utils_cache.Get_tarifs_fratries(getattr(activite, "pk", activite))
     if liste_tarifs_speciaux:
-        prestations += list(Prestation.objects.filter(pk__in=liste_IDprestation_existants, facture__isnull=True))
+        liste_id_tarif = [tarif.pk for tarif in liste_tarifs_speciaux]
+        prestations = prestations + list(Prestation.objects.filter(pk__in=liste_IDprestation_existants, tarif_id__in=liste_id_tarif, facture__isnull=True).only("famille_id", "tarif_id", "date"))
 
         # Recherche les individu à modifier
-        liste_modifications = []
-        liste_id_tarif = [tarif.pk for tarif in liste_tarifs_speciaux]
-        for prestation in prestations:
-            if prestation.tarif_id in liste_id_tarif:
-                key = (prestation.famille_id, prestation.tarif_id, str(prestation.date))
-                if key not in liste_modifications:
-                    liste_modifications.append(key)
+        liste_modifications = {(prestation.famille_id, prestation.tarif_id, str(prestation.date)) for prestation in prestations if prestation.tarif_id in liste_id_tarif}
 
-        # Recherche les fratries
+        # Recherche les fratries en une seule requête
         if liste_modifications:
-            for famille_id, tarif_id, date in liste_modifications:
-                liste_prestations_fratrie = Prestation.objects.select_related("tarif", "tarif_ligne").filter(famille_id=famille_id, tarif_id=tarif_id, date=date).order_by("individu_id")
+            dict_fratries = {}
+            conditions = Q(famille_id__in={key[0] for key in liste_modifications}, tarif_id__in={key[1] for key in liste_modifications}, date__in={key[2] for key in liste_modifications})
+            for prestation in Prestation.objects.select_related("tarif", "tarif_ligne").filter(conditions).order_by("individu_id", "pk"):
+                key = (prestation.famille_id, prestation.tarif_id, str(prestation.date))
+                if key in liste_modifications:
+                    dict_fratries.setdefault(key, []).append(prestation)
+
+            liste_prestations_modifiees = []
+            for liste_prestations_fratrie in dict_fratries.values():
                 for index, prestation in enumerate(liste_prestations_fratrie):
                     if "degr" in prestation.tarif.methode:
                         num_enfant = index + 1
@@ -78,36 +80,30 @@ def Maj_tarifs_fratries(activite=None, prestations=[], liste_IDprestation_exista
                         prestation.montant_initial = nouveau_montant
                         logger.debug("tarif selon le nbre d'individus : Prestation %d modifiée : montant=%s num_enfant=%d" % (prestation.pk, prestation.montant_initial, num_enfant))
                         prestation.montant = prestation.montant_initial - montant_deductions
-                        prestation.save()
-                        Ventilation.objects.filter(prestation=prestation).delete()
+                        liste_prestations_modifiees.append(prestation)
 
+            if liste_prestations_modifiees:
+                Prestation.objects.bulk_update(liste_prestations_modifiees, ["montant_initial", "montant"], batch_size=200)
+                Ventilation.objects.filter(prestation__in=liste_prestations_modifiees).delete()
 
-def Get_generic_data(data={}):
-    """ Renvoie les données communes à la grille des conso et au gestionnaire des conso """
-    # Création de listes de données
-    data["liste_individus"] = []
-    data["liste_familles"] = []
-    data["liste_key_individus"] = []
-    for inscription in data["liste_inscriptions"]:
-        if inscription.individu not in data["liste_individus"]: data["liste_individus"].append(inscription.individu)
-        if inscription.famille not in data["liste_familles"]: data["liste_familles"].append(inscription.famille)
-        key = (inscription.individu_id, inscription.famille_id)
-        if key not in data["liste_key_individus"]: data["liste_key_individus"].append(key)
+
+def Get_generic_data(data={}, navigateur=True):
+    """ Renvoie les données communes à la grille des conso et au gestionnaire des conso.
+        navigateur=False : uniquement les données natives utiles aux traitements côté serveur, sans conversion JSON """
+    # Indexation des inscriptions
+    index_inscriptions = utils_consommations.Indexer_inscriptions(data["liste_inscriptions"])
+    data["liste_individus"] = list(index_inscriptions["individus"].values())
+    data["liste_familles"] = list(index_inscriptions["familles"].values())
+    data["liste_key_individus"] = index_inscriptions["keys_individus"]
 
     # Permet de trouver les différences entre les inscriptions multiples d'un seul individu
     # Pour afficher le texte d'informations complémentaires des inscriptions
-    dict_differences = {}
-    for inscription in data["liste_inscriptions"]:
-        dict_differences.setdefault(inscription.individu, {})
-        dict_differences[inscription.individu].setdefault(inscription.activite, {"groupe": [], "famille": [], "categorie_tarif": []})
-        if inscription.groupe not in dict_differences[inscription.individu][inscription.activite]["groupe"]: dict_differences[inscription.individu][inscription.activite]["groupe"].append(inscription.groupe)
-        if inscription.famille not in dict_differences[inscription.individu][inscription.activite]["famille"]: dict_differences[inscription.individu][inscription.activite]["famille"].append(inscription.famille)
-        if inscription.categorie_tarif not in dict_differences[inscription.individu][inscription.activite]["categorie_tarif"]: dict_differences[inscription.individu][inscription.activite]["categorie_tarif"].append(inscription.categorie_tarif)
+    dict_differences = index_inscriptions["differences"]
 
     # Importation de la scolarité
     dict_scolarites = {}
     if data["options"].get("afficher_classe", "non") == "oui" or data["options"].get("afficher_niveau_scolaire", "non") == "oui":
-        conditions = Q(individu_id__in=data["liste_key_individus"]) & Q(date_debut__lte=data["date_max"]) & Q(date_fin__gte=data["date_min"])
+        conditions = Q(individu_id__in=index_inscriptions["individus"].keys()) & Q(date_debut__lte=data["date_max"]) & Q(date_fin__gte=data["date_min"])
         dict_scolarites = {scolarite.individu: scolarite for scolarite in Scolarite.objects.select_related("individu", "classe", "niveau").filter(conditions)}
 
     for inscription in data["liste_inscriptions"]:
@@ -115,7 +111,7 @@ def Get_generic_data(data={}):
 
         # Ajout des informations différentes
         for info in ("groupe", "famille", "categorie_tarif"):
-            if len(dict_differences[inscription.individu][inscription.activite][info]) > 1:
+            if len(dict_differences[(inscription.individu_id, inscription.activite_id)][info]) > 1:
                 inscription.infos.append(getattr(inscription, info).nom)
 
         # Ajout d'autres informations
@@ -134,24 +130,21 @@ def Get_generic_data(data={}):
         inscription.infos = " | ".join(inscription.infos)
 
     # Regroupe les inscriptions par individu
-    dict_resultats = {}
-    for inscription in data["liste_inscriptions"]:
-        key = (inscription.individu, inscription.famille_id)
-        dict_resultats.setdefault(key, [])
-        dict_resultats[key].append(inscription)
-    data['dict_inscriptions_by_individu'] = dict_resultats
+    data['dict_inscriptions_by_individu'] = index_inscriptions["inscriptions_by_individu"]
 
     #-------------------------- Importation des données des individus ------------------------------
 
     # Importation des consommations existantes
-    if "liste_conso_json" not in data:
+    if "liste_conso_json" not in data and "liste_conso" not in data:
         liste_conso = Consommation.objects.select_related("inscription").filter(data["conditions_periodes"] & Q(inscription__in=data["liste_inscriptions"]))
         data["liste_conso"] = liste_conso
-        data["liste_conso_json"] = serializers.serialize('json', liste_conso)
+        if navigateur:
+            data["liste_conso_json"] = serializers.serialize('json', liste_conso)
 
     # Importation des mémos journaliers
-    liste_memos = MemoJournee.objects.filter(date__gte=data["date_min"], date__lte=data["date_max"], inscription__in=data["liste_inscriptions"])
-    data['liste_memos_json'] = serializers.serialize('json', liste_memos)
+    if navigateur:
+        liste_memos = MemoJournee.objects.filter(date__gte=data["date_min"], date__lte=data["date_max"], inscription__in=data["liste_inscriptions"])
+        data['liste_memos_json'] = serializers.serialize('json', liste_memos)
 
     # Importation des déductions
     dict_deductions = {}
@@ -163,10 +156,13 @@ def Get_generic_data(data={}):
     conditions = Q(pk__in=[conso.prestation_id for conso in data.get("liste_conso", [])]) | Q(categorie="consommation") & (data["conditions_periodes"] | (Q(forfait_date_debut__lte=data["date_max"]) & Q(forfait_date_fin__gte=data["date_min"])))
     if data["mode"] in ("individu", "portail"):
         conditions &= Q(famille_id=data["idfamille"]) & Q(individu__in=data["liste_individus"])
+    if data["mode"] == "lot":
+        conditions &= Q(activite=data["selection_activite"]) & Q(famille__in=data["liste_familles"]) & Q(individu__in=data["liste_individus"])
     liste_prestations = Prestation.objects.filter(conditions)
+    prestations_supprimees = set(data["dict_suppressions"]["prestations"])
     for p in liste_prestations:
-        if p.pk not in data["dict_suppressions"]["prestations"]:
-            data["prestations"][p.pk] = {
+        if p.pk not in prestations_supprimees:
+            data["prestations"][str(p.pk)] = {
                 "date": str(p.date), "categorie": p.categorie, "label": p.label, "montant_initial": float(p.montant_initial),
                 "montant": float(p.montant), "activite": p.activite_id, "tarif": p.tarif_id, "facture": p.facture_id,
                 "famille": p.famille_id, "individu": p.individu_id, "categorie_tarif": p.categorie_tarif_id, "temps_facture": utils_dates.DeltaEnStr(p.temps_facture, separateur=":"),
@@ -175,93 +171,101 @@ def Get_generic_data(data={}):
                 "forfait": p.forfait, "dirty": False,
             }
             if p.pk in dict_deductions:
-                data["prestations"][p.pk]["aides"] = dict_deductions[p.pk]
+                data["prestations"][str(p.pk)]["aides"] = dict_deductions[p.pk]
 
-            if p.forfait_date_debut:
+            if p.forfait_date_debut and navigateur:
                 # Création d'une couleur pour le forfait crédit
-                data["prestations"][p.pk]["couleur"] = ColorHash(str(p.pk)).hex
+                data["prestations"][str(p.pk)]["couleur"] = ColorHash(str(p.pk)).hex
 
-    data['dict_prestations_json'] = mark_safe(json.dumps(data["prestations"]))
+    if navigateur:
+        data['dict_prestations_json'] = mark_safe(json.dumps(data["prestations"]))
     #logger.debug("prestations=" + str(data['dict_prestations_json']))
 
 
     #-------------------------- Importation des données du calendrier ------------------------------
 
     # Importation des ouvertures
-    list_groupes_inscriptions = list({inscription.groupe_id: None for inscription in data["liste_inscriptions"]}.keys())
+    groupes_inscriptions = {inscription.groupe_id for inscription in data["liste_inscriptions"]}
     liste_ouvertures = []
-    liste_dates = []
-    liste_unites_ouvertes = []
+    dates = set()
+    unites_ouvertes = set()
     for ouverture in Ouverture.objects.filter(data["conditions_periodes"] & Q(activite=data['selection_activite'])):
         liste_ouvertures.append("%s_%s_%s" % (ouverture.date, ouverture.groupe_id, ouverture.unite_id))
-        if ouverture.date not in liste_dates and ouverture.groupe_id in list_groupes_inscriptions:
-            liste_dates.append(ouverture.date)
-        if ouverture.unite_id not in liste_unites_ouvertes:
-            liste_unites_ouvertes.append(ouverture.unite_id)
+        if ouverture.groupe_id in groupes_inscriptions:
+            dates.add(ouverture.date)
+        unites_ouvertes.add(ouverture.unite_id)
     data['liste_ouvertures'] = liste_ouvertures
 
     # Récupération des dates
-    liste_dates.sort()
-    data['liste_dates'] = liste_dates
+    data['liste_dates'] = sorted(dates)
 
     # Importation des vacances
     if "liste_vacances" not in data:
-        liste_vacances = Vacance.objects.filter(date_fin__gte=data["date_min"], date_debut__lte=data["date_max"])
+        liste_vacances = utils_cache.Get_vacances(date_min=data["date_min"], date_max=data["date_max"])
         data['liste_vacances'] = liste_vacances
-    data['liste_vacances_json'] = mark_safe(json.dumps([(str(vac.date_debut), str(vac.date_fin)) for vac in data['liste_vacances']]))
 
     # Importation des événements
     liste_evenements = Evenement.objects.filter(data["conditions_periodes"] & Q(activite=data['selection_activite'])).order_by("date", "heure_debut")
-    data["liste_evenements_json"] = serializers.serialize('json', liste_evenements)
     data["liste_evenements"] = liste_evenements
 
-    # Importation des remplissages
-    liste_remplissage = Remplissage.objects.filter(data["conditions_periodes"] & Q(activite=data['selection_activite']))
-    data['dict_capacite_json'] = mark_safe(json.dumps({'%s_%d_%d' % (r.date, r.unite_remplissage_id, r.groupe_id or 0): r.places for r in liste_remplissage}))
-
-    # Importation des unités de remplissage
-    liste_unites_remplissage = UniteRemplissage.objects.prefetch_related('unites').filter(activite=data['selection_activite']).order_by("ordre")
-    data['liste_unites_remplissage'] = liste_unites_remplissage
-
-    # Prépare un dict unités de remplissage par unité de conso pour le dict des unités de conso
+    # Les remplissages et les places prises ne servent qu'à l'affichage dans le navigateur
     dict_unites_remplissage_unites = {}
-    dict_unites_remplissage_json = {}
-    for unite in liste_unites_remplissage:
-        for unite_conso in unite.unites.all():
-            dict_unites_remplissage_json.setdefault(unite.pk, {"unites_conso": [], "seuil_alerte": unite.seuil_alerte})
-            dict_unites_remplissage_json[unite.pk]["unites_conso"].append(unite_conso.pk)
-            dict_unites_remplissage_unites.setdefault(unite_conso.pk, [])
-            dict_unites_remplissage_unites[unite_conso.pk].append(unite.pk)
-    data['dict_unites_remplissage_json'] = mark_safe(json.dumps(dict_unites_remplissage_json))
-
-    # Importation des places prises
-    liste_places = Consommation.objects.values('date', 'unite', 'groupe', 'quantite', 'evenement').annotate(nbre=Count('pk')).filter(data["conditions_periodes"] & Q(activite=data['selection_activite']) & Q(etat__in=("reservation", "present", "attente"))).exclude(inscription__in=data["liste_inscriptions"])
-    dict_places = {}
-    for p in liste_places:
-        for idgroupe in [p["groupe"], 0]:
-            key = "%s_%d_%d" % (p["date"], p["unite"], idgroupe)
-            quantite = p["nbre"] * p["quantite"] if p["quantite"] else p["nbre"]
-            dict_places[key] = dict_places.get(key, 0) + quantite
-            if p["evenement"]:
-                key += "_%d" % p["evenement"]
-                dict_places[key] = dict_places.get(key, 0) + quantite
-    data['dict_places_json'] = mark_safe(json.dumps(dict_places))
+    if navigateur:
+        data['liste_vacances_json'] = mark_safe(json.dumps([(str(vac.date_debut), str(vac.date_fin)) for vac in data['liste_vacances']]))
+        data["liste_evenements_json"] = serializers.serialize('json', liste_evenements)
+
+        # Importation des remplissages
+        liste_remplissage = Remplissage.objects.filter(data["conditions_periodes"] & Q(activite=data['selection_activite']))
+        data['dict_capacite_json'] = mark_safe(json.dumps({'%s_%d_%d' % (r.date, r.unite_remplissage_id, r.groupe_id or 0): r.places for r in liste_remplissage}))
+
+        # Importation des unités de remplissage
+        liste_unites_remplissage = UniteRemplissage.objects.prefetch_related('unites').filter(activite=data['selection_activite']).order_by("ordre")
+        data['liste_unites_remplissage'] = liste_unites_remplissage
+
+        # Prépare un dict unités de remplissage par unité de conso pour le dict des unités de conso
+        dict_unites_remplissage_json = {}
+        for unite in liste_unites_remplissage:
+            for unite_conso in unite.unites.all():
+                dict_unites_remplissage_json.setdefault(unite.pk, {"unites_conso": [], "seuil_alerte": unite.seuil_alerte})
+                dict_unites_remplissage_json[unite.pk]["unites_conso"].append(unite_conso.pk)
+                dict_unites_remplissage_unites.setdefault(unite_conso.pk, [])
+                dict_unites_remplissage_unites[unite_conso.pk].append(unite.pk)
+        data['dict_unites_remplissage_json'] = mark_safe(json.dumps(dict_unites_remplissage_json))
+
+        # Importation des places prises (hors consommations des inscriptions affichées)
+        if "liste_conso" in data:
+            consommations_exclues = data["liste_conso"]
+        else:
+            consommations_exclues = Consommation.objects.filter(data["conditions_periodes"] & Q(activite=data['selection_activite']) & Q(inscription__in=data["liste_inscriptions"]))
+        dict_places = utils_places.Get_dict_places(activite=data['selection_activite'], conditions_periodes=data["conditions_periodes"], consommations_exclues=consommations_exclues)
+        data['dict_places_json'] = mark_safe(json.dumps(dict_places))
 
     # Importation des groupes
-    data['liste_groupes'] = Groupe.objects.filter(activite=data['selection_activite']).order_by("ordre")
-    data['liste_groupes_json'] = serializers.serialize('json', data['liste_groupes'])
+    data['liste_groupes'] = utils_cache.Get_groupes(data['selection_activite'].pk)
+    if navigateur:
+        data['liste_groupes_json'] = serializers.serialize('json', data['liste_groupes'])
 
     # Sélection des groupes
     if data["mode"] in ("date", "pointeuse") and not data['selection_groupes']:
         data['selection_groupes'] = [groupe.pk for groupe in data['liste_groupes']]
 
     # Importation des unités de conso
-    groupes_utilises = list({inscription.groupe: True for inscription in data['liste_inscriptions']}.keys()) + data.get("selection_groupes", [])
+    groupes_utilises = list(groupes_inscriptions) + data.get("selection_groupes", [])
     conditions = (Q(groupes__in=groupes_utilises) | Q(groupes__isnull=True))
-    data["liste_unites"] = Unite.objects.select_related('activite').prefetch_related('groupes', 'incompatibilites', 'dependances').filter(conditions, activite=data['selection_activite']).distinct().order_by("ordre")
+    liste_unites = Unite.objects.filter(conditions, activite=data['selection_activite']).distinct().order_by("ordre")
+
+    # Pour les traitements côté serveur : les données natives suffisent
+    if not navigateur:
+        data["liste_unites"] = list(liste_unites)
+        for key in ("liste_familles", "periode", "consommations", "memos", "liste_idindividus", "liste_key_individus"):
+            if key in data:
+                del data[key]
+        return data
+
+    data["liste_unites"] = liste_unites.select_related('activite').prefetch_related('groupes', 'incompatibilites', 'dependances')
 
     # Sélection des unités visibles
-    data["liste_unites_visibles"] = [unite for unite in data["liste_unites"] if unite.pk in liste_unites_ouvertes and (unite.visible_portail or data["mode"] != "portail")]
+    data["liste_unites_visibles"] = [unite for unite in data["liste_unites"] if unite.pk in unites_ouvertes and (unite.visible_portail or data["mode"] != "portail")]
 
     # Recherche s'il y a des forfaits crédit dans les tarifs de l'activité
     data["tarifs_credits_exists"] = False
@@ -315,10 +319,11 @@ def Save_grille(request=None, donnees={}):
 
     # ----------------------------------- PRESTATIONS --------------------------------------
 
-    # Enregistrement des prestations
+    # Analyse des prestations
     dict_idprestation = {}
     liste_nouvelles_prestations = []
     liste_IDprestation_existants = []
+    dict_prestations_modifiees = {}
     for IDprestation, dict_prestation in donnees["prestations"].items():
 
         prestation_temp = {
@@ -329,161 +334,195 @@ def Save_grille(request=None, donnees={}):
             "forfait_date_debut": dict_prestation["forfait_date_debut"], "forfait_date_fin": dict_prestation["forfait_date_fin"],
         }
 
-        # Enregistrement des nouvelles prestations
+        # Nouvelles prestations
         if "-" in IDprestation:
             logger.debug("Prestation à ajouter : ID" + str(IDprestation) + " > " + str(dict_prestation))
-            prestation = Prestation.objects.create(**prestation_temp)
-            liste_nouvelles_prestations.append(prestation)
-
-            liste_historique.append({"titre": "Ajout d'une prestation", "detail": "%s du %s" % (dict_prestation["label"], utils_dates.ConvertDateToFR(dict_prestation["date"])), "utilisateur": request.user if request else None,
-                                     "famille_id": dict_prestation["famille"], "individu_id": dict_prestation["individu"], "objet": "Prestation", "idobjet": prestation.pk, "classe": "Prestation", "activite_id": dict_prestation["activite"]})
-
-            # Mémorise la correspondante du nouvel IDprestation avec l'ancien IDprestation
-            dict_idprestation[IDprestation] = prestation.pk
-
-            # Enregistrement des aides
-            for dict_aide in dict_prestation["aides"]:
-                deduction = Deduction.objects.create(date=dict_prestation["date"], label=dict_aide["label"], aide_id=dict_aide["aide"], famille_id=dict_prestation["famille"], prestation=prestation, montant=dict_aide["montant"])
-                liste_historique.append({"titre": "Ajout d'une déduction", "detail": "%s du %s" % (dict_aide["label"], utils_dates.ConvertDateToFR(dict_prestation["date"])), "utilisateur": request.user if request else None,
-                                         "famille_id": dict_prestation["famille"], "individu_id": dict_prestation["individu"], "objet": "Déduction", "idobjet": deduction.pk, "classe": "Deduction", "activite_id": dict_prestation["activite"]})
+            liste_nouvelles_prestations.append((IDprestation, dict_prestation, Prestation(**prestation_temp)))
 
         # Modification de prestations
         if "-" not in IDprestation:
             liste_IDprestation_existants.append(IDprestation)
 
             if dict_prestation.get("dirty", False):
-                Prestation.objects.filter(pk=int(IDprestation)).update(**prestation_temp)
+                dict_prestations_modifiees[int(IDprestation)] = prestation_temp
 
-    # ---------------------------------- CONSOMMATIONS -------------------------------------
+    # ------------------------------- LECTURES PREALABLES -----------------------------------
 
-    dict_unites = {unite.pk: unite for unite in Unite.objects.all()}
+    # Seules les données de référence et les listes d'ID sont préparées avant de réserver la base en écriture
+    dict_unites = utils_cache.Get_unites()
+    idconso_modifiees = [dict_conso["pk"] for consommations in donnees["consommations"].values() for dict_conso in consommations if "-" not in str(dict_conso["pk"]) and dict_conso["dirty"]]
+    idmemos_modifies = [dict_memo["pk"] for dict_memo in donnees.get("memos", {}).values() if dict_memo["texte"] and dict_memo["pk"] and dict_memo["dirty"]]
 
-    # Analyse et préparation des consommations
-    liste_ajouts = []
-    dict_modifications = {}
+    # --------------------------------- ENREGISTREMENT -------------------------------------
+
+    # Seule cette partie réserve la base en écriture. Elle reste d'un seul tenant : les consommations et
+    # les tarifs des fratries dépendent des prestations qui viennent d'être créées
     dict_idconso = {}
-    for key_case, consommations in donnees["consommations"].items():
-        for dict_conso in consommations:
-            # Recherche du nouvel IDprestation
-            dict_conso["prestation"] = dict_idprestation.get(dict_conso["prestation"], dict_conso["prestation"])
-
-            if "-" in str(dict_conso["pk"]):
-                liste_ajouts.append(Consommation(
-                    individu_id=dict_conso["individu"], inscription_id=dict_conso["inscription"], activite_id=dict_conso["activite"], date=dict_conso["date"],
-                    unite_id=dict_conso["unite"], groupe_id=dict_conso["groupe"], heure_debut=dict_conso["heure_debut"], heure_fin=dict_conso["heure_fin"],
-                    etat=dict_conso["etat"], categorie_tarif_id=dict_conso["categorie_tarif"], prestation_id=dict_conso["prestation"], quantite=dict_conso["quantite"],
-                    evenement_id=dict_conso["evenement"], badgeage_debut=dict_conso["badgeage_debut"], badgeage_fin=dict_conso["badgeage_fin"],
-                ))
-                logger.debug("Consommation à ajouter : " + str(dict_conso))
-                label_conso = dict_conso["nom_evenement"] if "nom_evenement" in dict_conso else dict_unites[dict_conso["unite"]].nom
-                liste_historique.append({"titre": "Ajout d'une consommation", "detail": "%s du %s (%s)" % (label_conso, utils_dates.ConvertDateToFR(dict_conso["date"]), utils_consommations.Get_label_etat(dict_conso["etat"])), "utilisateur": request.user if request else None,
-                                         "famille_id": dict_conso["famille"], "individu_id": dict_conso["individu"], "objet": "Consommation", "idobjet": None, "classe": "Consommation", "activite_id": dict_conso["activite"], "date": dict_conso["date"]})
-                detail_evenements[len(liste_historique)-1] = dict_conso.get("description_evenement", None)
-
-                # Mode pointeuse pour récupérer l'idconso
-                if donnees.get("mode", None) == "pointeuse":
-                    liste_ajouts[0].save()
-                    dict_idconso[dict_conso["pk"]] = liste_ajouts[0].pk
-                    liste_ajouts = []
-
-            elif dict_conso["dirty"]:
-                dict_modifications[dict_conso["pk"]] = dict_conso
-                logger.debug("Consommation à modifier : " + str(dict_conso))
-                liste_historique.append({"titre": "Modification d'une consommation", "detail": "%s du %s (%s)" % (dict_unites[dict_conso["unite"]].nom, utils_dates.ConvertDateToFR(dict_conso["date"]), utils_consommations.Get_label_etat(dict_conso["etat"])), "utilisateur": request.user if request else None,
-                                         "famille_id": dict_conso["famille"], "individu_id": dict_conso["individu"], "objet": "Consommation", "idobjet": dict_conso["pk"], "classe": "Consommation", "activite_id": dict_conso["activite"], "date": dict_conso["date"]})
-
-    # Récupère la liste des conso à modifier
-    liste_modifications = []
-    for conso in Consommation.objects.filter(pk__in=dict_modifications.keys()):
-        conso.groupe_id = dict_modifications[conso.pk]["groupe"]
-        conso.heure_debut = dict_modifications[conso.pk]["heure_debut"]
-        conso.heure_fin = dict_modifications[conso.pk]["heure_fin"]
-        conso.etat = dict_modifications[conso.pk]["etat"]
-        conso.categorie_tarif_id = dict_modifications[conso.pk]["categorie_tarif"]
-        conso.prestation_id = dict_modifications[conso.pk]["prestation"]
-        conso.quantite = dict_modifications[conso.pk]["quantite"]
-
-        if conso.prestation_id in dict_idprestation:
-            conso.prestation_id = dict_idprestation[conso.prestation_id]
-
-        liste_modifications.append(conso)
-
-    # Traitement dans la base
-    texte_notification = []
-    if liste_ajouts:
-        Consommation.objects.bulk_create(liste_ajouts)
-        texte_notification.append("%s ajout%s" % (len(liste_ajouts), "s" if len(liste_ajouts) > 1 else ""))
-    if liste_modifications:
-        Consommation.objects.bulk_update(liste_modifications, ["groupe", "heure_debut", "heure_fin", "etat", "categorie_tarif", "prestation", "quantite"], batch_size=50)
-        texte_notification.append("%s modification%s" % (len(liste_modifications), "s" if len(liste_modifications) > 1 else ""))
-    if donnees["suppressions"]["consommations"]:
-        logger.debug("Consommations à supprimer : " + str(donnees["suppressions"]["consommations"]))
-        liste_conso_suppr = list(Consommation.objects.select_related("unite", "inscription", "evenement").filter(pk__in=donnees["suppressions"]["consommations"]))
-        qs = Consommation.objects.filter(pk__in=donnees["suppressions"]["consommations"])
-        qs._raw_delete(qs.db)
-        texte_notification.append("%s suppression%s" % (len(donnees["suppressions"]["consommations"]), "s" if len(donnees["suppressions"]["consommations"]) > 1 else ""))
-        for conso in liste_conso_suppr:
-            label_conso = conso.evenement.nom if conso.evenement else conso.unite.nom
-            liste_historique.append({"titre": "Suppression d'une consommation", "detail": "%s du %s (%s)" % (label_conso, utils_dates.ConvertDateToFR(conso.date), conso.get_etat_display()), "date": conso.date, "activite_id": conso.activite_id,
-                                     "utilisateur": request.user if request else None, "famille_id": conso.inscription.famille_id, "individu_id": conso.individu_id, "objet": "Consommation", "idobjet": conso.pk, "classe": "Consommation"})
-
-    # Notification d'enregistrement des consommations
-    # if texte_notification and request:
-    #     messages.add_message(request, messages.SUCCESS, "Consommations enregistrées : %s" % utils_texte.Convert_liste_to_texte_virgules(texte_notification))
-
-    # Suppression des prestations obsolètes (après la suppression des consommations associées)
-    logger.debug("Prestations à supprimer : " + str(donnees["suppressions"]["prestations"]))
-    liste_prestations_suppr = []
-    if donnees["suppressions"]["prestations"]:
-        liste_prestations_suppr = list(Prestation.objects.filter(pk__in=donnees["suppressions"]["prestations"]))
-
-        qs = Deduction.objects.filter(prestation_id__in=donnees["suppressions"]["prestations"])
-        qs._raw_delete(qs.db)
-
-        # Pour supprimer les consommations fantômes
-        Consommation.objects.filter(prestation_id__in=donnees["suppressions"]["prestations"]).delete()
-
-        Ventilation.objects.filter(prestation_id__in=donnees["suppressions"]["prestations"]).delete()
-        qs = Prestation.objects.filter(pk__in=donnees["suppressions"]["prestations"])
-        qs._raw_delete(qs.db)
-
-        for prestation in liste_prestations_suppr:
-            liste_historique.append({"titre": "Suppression d'une prestation", "detail": "%s du %s" % (prestation.label, utils_dates.ConvertDateToFR(prestation.date)),
-                                     "utilisateur": request.user if request else None, "famille_id": prestation.famille_id, "individu_id": prestation.individu_id, "objet": "Prestation", "idobjet": prestation.pk, "classe": "Prestation", "activite_id": prestation.activite_id})
-
-    # ------------------ TRAITEMENT DES TARIFS SELON NBRE INDIVIDUS PRESENTS -------------------
-
-    Maj_tarifs_fratries(activite=donnees.get("selection_activite", None) or donnees.get("activite", None), prestations=liste_nouvelles_prestations + liste_prestations_suppr, liste_IDprestation_existants=liste_IDprestation_existants)
-
-    # ---------------------------------- MEMOS JOURNALIERS -------------------------------------
-
-    if "memos" in donnees:
-
-        # Analyse et préparation des mémos
+    with utils_sqlite.Transaction_ecriture(label="grille"):
+        # Les lignes à modifier ou à supprimer sont lues sous le verrou pour ne pas écraser un enregistrement concurrent
+        prestations_modifiees = list(Prestation.objects.filter(pk__in=dict_prestations_modifiees.keys())) if dict_prestations_modifiees else []
+        consommations_modifiees = list(Consommation.objects.filter(pk__in=idconso_modifiees)) if idconso_modifiees else []
+        liste_conso_suppr = list(Consommation.objects.select_related("unite", "inscription", "evenement").filter(pk__in=donnees["suppressions"]["consommations"])) if donnees["suppressions"]["consommations"] else []
+        liste_prestations_suppr = list(Prestation.objects.filter(pk__in=donnees["suppressions"]["prestations"])) if donnees["suppressions"]["prestations"] else []
+        memos_modifies = list(MemoJournee.objects.filter(pk__in=idmemos_modifies)) if idmemos_modifies else []
+
+        # Enregistrement des nouvelles prestations
+        utils_db.Creer_objets([prestation for IDprestation, dict_prestation, prestation in liste_nouvelles_prestations])
+        liste_deductions = []
+        for IDprestation, dict_prestation, prestation in liste_nouvelles_prestations:
+            liste_historique.append({"titre": "Ajout d'une prestation", "detail": "%s du %s" % (dict_prestation["label"], utils_dates.ConvertDateToFR(dict_prestation["date"])), "utilisateur": request.user if request else None,
+                                     "famille_id": dict_prestation["famille"], "individu_id": dict_prestation["individu"], "objet": "Prestation", "idobjet": prestation.pk, "classe": "Prestation", "activite_id": dict_prestation["activite"]})
+
+            # Mémorise la correspondante du nouvel IDprestation avec l'ancien IDprestation
+            dict_idprestation[IDprestation] = prestation.pk
+
+            # Préparation des aides
+            for dict_aide in dict_prestation["aides"]:
+                liste_deductions.append((dict_prestation, dict_aide, Deduction(date=dict_prestation["date"], label=dict_aide["label"], aide_id=dict_aide["aide"], famille_id=dict_prestation["famille"], prestation=prestation, montant=dict_aide["montant"])))
+
+        # Enregistrement des aides
+        utils_db.Creer_objets([deduction for dict_prestation, dict_aide, deduction in liste_deductions])
+        for dict_prestation, dict_aide, deduction in liste_deductions:
+            liste_historique.append({"titre": "Ajout d'une déduction", "detail": "%s du %s" % (dict_aide["label"], utils_dates.ConvertDateToFR(dict_prestation["date"])), "utilisateur": request.user if request else None,
+                                     "famille_id": dict_prestation["famille"], "individu_id": dict_prestation["individu"], "objet": "Déduction", "idobjet": deduction.pk, "classe": "Deduction", "activite_id": dict_prestation["activite"]})
+        liste_nouvelles_prestations = [prestation for IDprestation, dict_prestation, prestation in liste_nouvelles_prestations]
+
+        # Enregistrement des prestations modifiées : uniquement les champs qui ont changé
+        liste_modifications, champs_modifies = [], set()
+        for prestation in prestations_modifiees:
+            champs = utils_db.Appliquer_valeurs(prestation, dict_prestations_modifiees[prestation.pk])
+            if champs:
+                liste_modifications.append(prestation)
+                champs_modifies.update(champs)
+        if liste_modifications:
+            logger.debug("Prestations à modifier : %s (%s)" % ([prestation.pk for prestation in liste_modifications], ", ".join(sorted(champs_modifies))))
+            Prestation.objects.bulk_update(liste_modifications, sorted(champs_modifies), batch_size=200)
+
+        # ---------------------------------- CONSOMMATIONS -------------------------------------
+
+        # Analyse et préparation des consommations
         liste_ajouts = []
         dict_modifications = {}
-        for key_case, dict_memo in donnees["memos"].items():
-            if dict_memo["texte"]:
-                if not dict_memo["pk"]:
-                    liste_ajouts.append(MemoJournee(date=dict_memo["date"], inscription_id=dict_memo["inscription"], texte=dict_memo["texte"]))
-                elif dict_memo["dirty"]:
-                    dict_modifications[dict_memo["pk"]] = dict_memo
-
-        # Récupère la liste des mémos à modifier
-        liste_modifications = []
-        for memo in MemoJournee.objects.filter(pk__in=dict_modifications.keys()):
-            memo.texte = dict_modifications[memo.pk]["texte"]
-            liste_modifications.append(memo)
+        cles_places = set()
+        for key_case, consommations in donnees["consommations"].items():
+            for dict_conso in consommations:
+                # Recherche du nouvel IDprestation
+                dict_conso["prestation"] = dict_idprestation.get(dict_conso["prestation"], dict_conso["prestation"])
+
+                if "-" in str(dict_conso["pk"]):
+                    liste_ajouts.append(Consommation(
+                        individu_id=dict_conso["individu"], inscription_id=dict_conso["inscription"], activite_id=dict_conso["activite"], date=dict_conso["date"],
+                        unite_id=dict_conso["unite"], groupe_id=dict_conso["groupe"], heure_debut=dict_conso["heure_debut"], heure_fin=dict_conso["heure_fin"],
+                        etat=dict_conso["etat"], categorie_tarif_id=dict_conso["categorie_tarif"], prestation_id=dict_conso["prestation"], quantite=dict_conso["quantite"],
+                        evenement_id=dict_conso["evenement"], badgeage_debut=dict_conso["badgeage_debut"], badgeage_fin=dict_conso["badgeage_fin"],
+                    ))
+                    logger.debug("Consommation à ajouter : " + str(dict_conso))
+                    label_conso = dict_conso["nom_evenement"] if "nom_evenement" in dict_conso else dict_unites[dict_conso["unite"]].nom
+                    liste_historique.append({"titre": "Ajout d'une consommation", "detail": "%s du %s (%s)" % (label_conso, utils_dates.ConvertDateToFR(dict_conso["date"]), utils_consommations.Get_label_etat(dict_conso["etat"])), "utilisateur": request.user if request else None,
+                                             "famille_id": dict_conso["famille"], "individu_id": dict_conso["individu"], "objet": "Consommation", "idobjet": None, "classe": "Consommation", "activite_id": dict_conso["activite"], "date": dict_conso["date"]})
+                    detail_evenements[len(liste_historique)-1] = dict_conso.get("description_evenement", None)
+
+                    # Mode pointeuse pour récupérer l'idconso
+                    if donnees.get("mode", None) == "pointeuse":
+                        liste_ajouts[0].save()
+                        dict_idconso[dict_conso["pk"]] = liste_ajouts[0].pk
+                        liste_ajouts = []
+
+                elif dict_conso["dirty"]:
+                    dict_modifications[dict_conso["pk"]] = dict_conso
+                    logger.debug("Consommation à modifier : " + str(dict_conso))
+                    liste_historique.append({"titre": "Modification d'une consommation", "detail": "%s du %s (%s)" % (dict_unites[dict_conso["unite"]].nom, utils_dates.ConvertDateToFR(dict_conso["date"]), utils_consommations.Get_label_etat(dict_conso["etat"])), "utilisateur": request.user if request else None,
+                                             "famille_id": dict_conso["famille"], "individu_id": dict_conso["individu"], "objet": "Consommation", "idobjet": dict_conso["pk"], "classe": "Consommation", "activite_id": dict_conso["activite"], "date": dict_conso["date"]})
+
+        # Récupère la liste des conso réellement modifiées
+        liste_modifications, champs_modifies = [], set()
+        for conso in consommations_modifiees:
+            dict_conso = dict_modifications[conso.pk]
+            champs = utils_db.Appliquer_valeurs(conso, {
+                "groupe_id": dict_conso["groupe"], "heure_debut": dict_conso["heure_debut"], "heure_fin": dict_conso["heure_fin"], "etat": dict_conso["etat"],
+                "categorie_tarif_id": dict_conso["categorie_tarif"], "prestation_id": dict_idprestation.get(dict_conso["prestation"], dict_conso["prestation"]), "quantite": dict_conso["quantite"],
+            })
+            if champs:
+                liste_modifications.append(conso)
+                champs_modifies.update(champs)
 
         # Traitement dans la base
+        texte_notification = []
+        cles_places.update(utils_places.Get_cles(liste_ajouts + liste_modifications))
         if liste_ajouts:
-            MemoJournee.objects.bulk_create(liste_ajouts)
+            Consommation.objects.bulk_create(liste_ajouts)
+            texte_notification.append("%s ajout%s" % (len(liste_ajouts), "s" if len(liste_ajouts) > 1 else ""))
         if liste_modifications:
-            MemoJournee.objects.bulk_update(liste_modifications, ["texte"])
-        if donnees["suppressions"]["memos"]:
-            qs = MemoJournee.objects.filter(pk__in=donnees["suppressions"]["memos"])
+            Consommation.objects.bulk_update(liste_modifications, sorted(champs_modifies), batch_size=200)
+            texte_notification.append("%s modification%s" % (len(liste_modifications), "s" if len(liste_modifications) > 1 else ""))
+        if donnees["suppressions"]["consommations"]:
+            logger.debug("Consommations à supprimer : " + str(donnees["suppressions"]["consommations"]))
+            cles_places.update(utils_places.Get_cles(liste_conso_suppr))
+            qs = Consommation.objects.filter(pk__in=donnees["suppressions"]["consommations"])
+            qs._raw_delete(qs.db)
+            texte_notification.append("%s suppression%s" % (len(donnees["suppressions"]["consommations"]), "s" if len(donnees["suppressions"]["consommations"]) > 1 else ""))
+            for conso in liste_conso_suppr:
+                label_conso = conso.evenement.nom if conso.evenement else conso.unite.nom
+                liste_historique.append({"titre": "Suppression d'une consommation", "detail": "%s du %s (%s)" % (label_conso, utils_dates.ConvertDateToFR(conso.date), conso.get_etat_display()), "date": conso.date, "activite_id": conso.activite_id,
+                                         "utilisateur": request.user if request else None, "famille_id": conso.inscription.famille_id, "individu_id": conso.individu_id, "objet": "Consommation", "idobjet": conso.pk, "classe": "Consommation"})
+
+        # Notification d'enregistrement des consommations
+        # if texte_notification and request:
+        #     messages.add_message(request, messages.SUCCESS, "Consommations enregistrées : %s" % utils_texte.Convert_liste_to_texte_virgules(texte_notification))
+
+        # Suppression des prestations obsolètes (après la suppression des consommations associées)
+        logger.debug("Prestations à supprimer : " + str(donnees["suppressions"]["prestations"]))
+        if donnees["suppressions"]["prestations"]:
+            qs = Deduction.objects.filter(prestation_id__in=donnees["suppressions"]["prestations"])
+            qs._raw_delete(qs.db)
+
+            # Pour supprimer les consommations fantômes
+            Consommation.objects.filter(prestation_id__in=donnees["suppressions"]["prestations"]).delete()
+
+            Ventilation.objects.filter(prestation_id__in=donnees["suppressions"]["prestations"]).delete()
+            qs = Prestation.objects.filter(pk__in=donnees["suppressions"]["prestations"])
             qs._raw_delete(qs.db)
 
+            for prestation in liste_prestations_suppr:
+                liste_historique.append({"titre": "Suppression d'une prestation", "detail": "%s du %s" % (prestation.label, utils_dates.ConvertDateToFR(prestation.date)),
+                                         "utilisateur": request.user if request else None, "famille_id": prestation.famille_id, "individu_id": prestation.individu_id, "objet": "Prestation", "idobjet": prestation.pk, "classe": "Prestation", "activite_id": prestation.activite_id})
+
+        # ------------------ TRAITEMENT DES TARIFS SELON NBRE INDIVIDUS PRESENTS -------------------
+
+        Maj_tarifs_fratries(activite=donnees.get("selection_activite", None) or donnees.get("activite", None), prestations=liste_nouvelles_prestations + liste_prestations_suppr, liste_IDprestation_existants=liste_IDprestation_existants)
+
+        # ---------------------------------- MEMOS JOURNALIERS -------------------------------------
+
+        if "memos" in donnees:
+
+            # Analyse et préparation des mémos
+            liste_ajouts = []
+            dict_modifications = {}
+            for key_case, dict_memo in donnees["memos"].items():
+                if dict_memo["texte"]:
+                    if not dict_memo["pk"]:
+                        liste_ajouts.append(MemoJournee(date=dict_memo["date"], inscription_id=dict_memo["inscription"], texte=dict_memo["texte"]))
+                    elif dict_memo["dirty"]:
+                        dict_modifications[dict_memo["pk"]] = dict_memo
+
+            # Récupère la liste des mémos à modifier
+            liste_modifications = []
+            for memo in memos_modifies:
+                memo.texte = dict_modifications[memo.pk]["texte"]
+                liste_modifications.append(memo)
+
+            # Traitement dans la base
+            if liste_ajouts:
+                MemoJournee.objects.bulk_create(liste_ajouts)
+            if liste_modifications:
+                MemoJournee.objects.bulk_update(liste_modifications, ["texte"])
+            if donnees["suppressions"]["memos"]:
+                qs = MemoJournee.objects.filter(pk__in=donnees["suppressions"]["memos"])
+                qs._raw_delete(qs.db)
+
+    # Mise à jour des places prises des journées modifiées
+    utils_places.Actualiser(cles_places)
+
     # Sauvegarde de l'historique
     utils_historique.Ajouter_plusieurs(liste_historique)
 
@@ -571,10 +610,194 @@ class Facturation():
         self.dict_tarifs = {}
         self.dict_combi_tarif = {}
         self.dict_aides = {}
+        self.dict_combi_aides = {}
+        self.dict_deductions = {}
+        self.dict_evenements = {}
+        self.dict_tarifs_evenements = {}
+        self.dict_caisses_familles = {}
+        self.dict_reponses = {}
+        self.dict_vacances = {}
+        self.dict_conso_forfaits = {}
+        self.index_prestations = None
+        self.index_prestations_lignes = None
         self.tarif_fratries_exists = False
 
+    def Precharger(self):
+        """ Importe en une fois les tarifs, lignes, combinaisons, QF et aides de toutes les cases touchées """
+        cases = list(self.donnees["cases_touchees"].values())
+        if not cases:
+            return
+
+        # Tarifs des activités par catégorie de tarif
+        keys_tarifs = {(case["activite"], case["categorie_tarif"]) for case in cases} - set(self.dict_tarifs.keys())
+        tarifs = []
+        if keys_tarifs:
+            for key in keys_tarifs:
+                self.dict_tarifs[key] = []
+            for tarif in Tarif.objects.select_related("nom_tarif").prefetch_related("groupes", "caisses", "categories_tarifs").filter(
+                    activite_id__in={idactivite for idactivite, idcategorie in keys_tarifs}, categories_tarifs__in={idcategorie for idactivite, idcategorie in keys_tarifs}).distinct().order_by("date_debut", "pk"):
+                tarifs.append(tarif)
+                for categorie_tarif in tarif.categories_tarifs.all():
+                    if (tarif.activite_id, categorie_tarif.pk) in keys_tarifs:
+                        self.dict_tarifs[(tarif.activite_id, categorie_tarif.pk)].append(tarif)
+            self.Charger_combinaisons(tarifs)
+
+        # Evènements et tarifs spéciaux des évènements
+        idevenements = set()
+        for case in cases:
+            for conso in self.donnees["consommations"].get("%s_%s" % (case["date"], case["inscription"]), []):
+                if conso["evenement"]:
+                    idevenements.add(conso["evenement"])
+        tarifs.extend(self.Charger_evenements(idevenements))
+
+        # Lignes des tarifs, QF, caisses et aides des familles
+        self.Charger_lignes_tarifs(tarifs)
+        idfamilles = {case["famille"] for case in cases}
+        self.Charger_quotients(idfamilles)
+        self.dict_caisses_familles.update(dict(Famille.objects.filter(pk__in=idfamilles).values_list("pk", "caisse_id")))
+        self.Charger_aides(cases)
+
+    def Charger_combinaisons(self, tarifs=[]):
+        """ Importe les combinaisons d'unités des tarifs donnés """
+        for tarif in tarifs:
+            self.dict_combi_tarif.setdefault(tarif.pk, [])
+        for combi in CombiTarif.objects.prefetch_related("unites").filter(tarif__in=tarifs).order_by("pk"):
+            combi.liste_unites = sorted([unite.pk for unite in combi.unites.all()])
+            self.dict_combi_tarif[combi.tarif_id].append(combi)
+
+    def Charger_lignes_tarifs(self, tarifs=[]):
+        """ Importe les lignes de calcul des tarifs donnés """
+        idtarifs = {tarif.pk for tarif in tarifs} - set(self.dict_lignes_tarifs.keys())
+        for idtarif in idtarifs:
+            self.dict_lignes_tarifs[idtarif] = []
+        for ligne in TarifLigne.objects.filter(tarif_id__in=idtarifs).order_by("num_ligne", "pk"):
+            self.dict_lignes_tarifs[ligne.tarif_id].append(ligne)
+
+    def Charger_evenements(self, idevenements=[]):
+        """ Importe les évènements donnés et leurs tarifs spéciaux """
+        idevenements = set(idevenements) - set(self.dict_evenements.keys())
+        if not idevenements:
+            return []
+        for idevenement in idevenements:
+            self.dict_evenements[idevenement] = None
+        self.dict_evenements.update({evenement.pk: evenement for evenement in Evenement.objects.filter(pk__in=idevenements)})
+        tarifs = list(Tarif.objects.select_related("nom_tarif").prefetch_related("groupes", "caisses", "categories_tarifs").filter(evenement_id__in=idevenements).order_by("date_debut", "pk"))
+        for tarif in tarifs:
+            for categorie_tarif in tarif.categories_tarifs.all():
+                self.dict_tarifs_evenements.setdefault((tarif.evenement_id, categorie_tarif.pk), []).append(tarif)
+        return tarifs
+
+    def Charger_quotients(self, idfamilles=[]):
+        """ Importe les quotients familiaux des familles données """
+        idfamilles = set(idfamilles) - set(self.dict_quotients.keys())
+        for idfamille in idfamilles:
+            self.dict_quotients[idfamille] = []
+        for quotient in Quotient.objects.filter(famille_id__in=idfamilles).order_by("date_debut", "pk"):
+            self.dict_quotients[quotient.famille_id].append(quotient)
+
+    def Charger_aides(self, cases=[]):
+        """ Importe les aides journalières des cases données avec leurs combinaisons et leurs déductions """
+        keys_aides = {"%d_%d_%d" % (case["famille"], case["individu"], case["activite"]) for case in cases} - set(self.dict_aides.keys())
+        if not keys_aides:
+            return
+        for key_aide in keys_aides:
+            self.dict_aides[key_aide] = []
+        aides = Aide.objects.select_related("caisse").prefetch_related("individus").filter(famille_id__in={case["famille"] for case in cases}, activite_id__in={case["activite"] for case in cases}).order_by("pk")
+        aides_plafonnees = []
+        for aide in aides:
+            for individu in aide.individus.all():
+                key_aide = "%d_%d_%d" % (aide.famille_id, individu.pk, aide.activite_id)
+                if key_aide in keys_aides:
+                    self.dict_aides[key_aide].append(aide)
+            self.dict_combi_aides[aide.pk] = []
+            if aide.nbre_dates_max or aide.montant_max:
+                self.dict_deductions[(aide.famille_id, aide.pk)] = []
+                aides_plafonnees.append(aide)
+
+        # Combinaisons d'unités des aides
+        for combi in CombiAide.objects.select_related("aide").prefetch_related("unites").filter(aide__in=aides).order_by("pk"):
+            combi.liste_unites = sorted([unite.pk for unite in combi.unites.all()])
+            self.dict_combi_aides[combi.aide_id].append(combi)
+
+        # Déductions déjà enregistrées pour les aides plafonnées
+        if aides_plafonnees:
+            for deduction in Deduction.objects.select_related("prestation").filter(aide__in=aides_plafonnees, famille_id__in={aide.famille_id for aide in aides_plafonnees}):
+                if (deduction.famille_id, deduction.aide_id) in self.dict_deductions:
+                    self.dict_deductions[(deduction.famille_id, deduction.aide_id)].append(deduction)
+
+    def Get_combinaisons(self, tarif=None):
+        """ Renvoie les combinaisons d'un tarif """
+        if tarif.pk not in self.dict_combi_tarif:
+            self.Charger_combinaisons([tarif])
+        return self.dict_combi_tarif[tarif.pk]
+
+    def Get_lignes_tarif(self, tarif=None, date=None):
+        """ Renvoie les lignes de calcul d'un tarif, éventuellement limitées à une date """
+        if tarif.pk not in self.dict_lignes_tarifs:
+            self.Charger_lignes_tarifs([tarif])
+        if date:
+            return [ligne for ligne in self.dict_lignes_tarifs[tarif.pk] if str(ligne.date) == date]
+        return self.dict_lignes_tarifs[tarif.pk]
+
+    def Get_evenement(self, idevenement=None):
+        """ Renvoie un évènement """
+        if idevenement not in self.dict_evenements:
+            self.Charger_lignes_tarifs(self.Charger_evenements([idevenement]))
+        return self.dict_evenements[idevenement]
+
+    def Get_tarifs_evenement(self, evenement=None, idcategorie_tarif=None):
+        """ Renvoie les tarifs spéciaux d'un évènement pour une catégorie de tarif """
+        if evenement.pk not in self.dict_evenements:
+            self.Charger_lignes_tarifs(self.Charger_evenements([evenement.pk]))
+        return self.dict_tarifs_evenements.get((evenement.pk, idcategorie_tarif), [])
+
+    def Get_aides(self, case_tableau=None):
+        """ Renvoie les aides potentielles d'une case """
+        key_aide = "%d_%d_%d" % (case_tableau["famille"], case_tableau["individu"], case_tableau["activite"])
+        if key_aide not in self.dict_aides:
+            self.Charger_aides([case_tableau])
+        return self.dict_aides[key_aide]
+
+    def Get_deductions(self, idfamille=None, aide=None):
+        """ Renvoie les déductions enregistrées d'une famille pour une aide """
+        if (idfamille, aide.pk) not in self.dict_deductions:
+            self.dict_deductions[(idfamille, aide.pk)] = list(Deduction.objects.select_related("prestation").filter(famille_id=idfamille, aide=aide))
+        return self.dict_deductions[(idfamille, aide.pk)]
+
+    def Get_caisse_famille(self, idfamille=None):
+        """ Renvoie l'ID de la caisse d'une famille """
+        if idfamille not in self.dict_caisses_familles:
+            self.dict_caisses_familles[idfamille] = Famille.objects.filter(pk=idfamille).values_list("caisse_id", flat=True).first()
+        return self.dict_caisses_familles[idfamille]
+
+    def Indexer_prestation(self, IDprestation=None, dict_prestation={}, nouvelle=False):
+        """ Ajoute une prestation à l'index utilisé pour retrouver les prestations identiques """
+        key = (dict_prestation["date"], dict_prestation["individu"], dict_prestation["tarif"], dict_prestation["famille"])
+        self.index_prestations.setdefault(key, ([], []))[1 if nouvelle else 0].append((IDprestation, dict_prestation))
+
+    def Get_prestations_identiques(self, dict_prestation={}):
+        """ Renvoie les prestations en mémoire de même date, individu, tarif et famille """
+        if self.index_prestations is None:
+            self.index_prestations = {}
+            for IDprestation, dict_prestation_temp in self.donnees["prestations"].items():
+                self.Indexer_prestation(IDprestation, dict_prestation_temp)
+            for IDprestation, dict_prestation_temp in self.dict_nouvelles_prestations.items():
+                self.Indexer_prestation(IDprestation, dict_prestation_temp, nouvelle=True)
+        prestations, nouvelles_prestations = self.index_prestations.get((dict_prestation["date"], dict_prestation["individu"], dict_prestation["tarif"], dict_prestation["famille"]), ([], []))
+        return prestations + nouvelles_prestations
+
+    def Get_prestations_ligne(self, case_tableau=None):
+        """ Renvoie les prestations affichées sur la ligne d'une case """
+        if self.index_prestations_lignes is None:
+            self.index_prestations_lignes = {}
+            for IDprestation, dict_prestation in self.donnees["prestations"].items():
+                key = (dict_prestation["date"], dict_prestation["famille"], dict_prestation["individu"], dict_prestation["activite"])
+                self.index_prestations_lignes.setdefault(key, []).append((IDprestation, dict_prestation))
+        return self.index_prestations_lignes.get((case_tableau["date"], case_tableau["famille"], case_tableau["individu"], case_tableau["activite"]), [])
+
     def Facturer(self):
         messages = []
+        self.Precharger()
         for key_case, case_tableau in self.donnees["cases_touchees"].items():
             #logger.debug("Case étudiée : " + str(key_case))
 
@@ -596,33 +819,17 @@ class Facturation():
                 # Mémorise les tarifs
                 key = (case_tableau["activite"], case_tableau["categorie_tarif"])
                 if key not in self.dict_tarifs:
-                    self.dict_tarifs[key] = Tarif.objects.prefetch_related('groupes', 'caisses').filter(activite_id=case_tableau["activite"], categories_tarifs=case_tableau["categorie_tarif"]).order_by("date_debut")
+                    self.dict_tarifs[key] = Tarif.objects.select_related("nom_tarif").prefetch_related('groupes', 'caisses').filter(activite_id=case_tableau["activite"], categories_tarifs=case_tableau["categorie_tarif"]).order_by("date_debut")
 
                 # Recherche un tarif valable pour cette date
-                tarifs_valides1 = []
-                liste_id_tarif = []
-                for tarif in self.dict_tarifs[key]:
-                    if self.Recherche_tarif_valide(tarif, case_tableau):
-                        tarifs_valides1.append(tarif)
-                        liste_id_tarif.append(str(tarif.pk))
-                liste_id_tarif.sort()
-                liste_id_tarif_str = ";".join(liste_id_tarif)
-
-                # Importation des combi de ces tarifs
-                dict_combi_by_activite = {}
-                if liste_id_tarif_str not in self.dict_combi_tarif:
-                    self.dict_combi_tarif[liste_id_tarif_str] = CombiTarif.objects.prefetch_related('unites').filter(tarif__in=tarifs_valides1)
-                for combi in self.dict_combi_tarif[liste_id_tarif_str]:
-                    dict_combi_by_activite.setdefault(combi.tarif_id, [])
-                    dict_combi_by_activite[combi.tarif_id].append(combi)
+                tarifs_valides1 = [tarif for tarif in self.dict_tarifs[key] if self.Recherche_tarif_valide(tarif, case_tableau)]
 
                 # Recherche des combinaisons présentes
                 tarifs_valides2 = []
                 for tarif in tarifs_valides1:
                     tarif.nbre_max_unites_combi = 0
-                    for combinaison in dict_combi_by_activite.get(tarif.pk, []):
-                        unites_combi = [unite.pk for unite in combinaison.unites.all()]
-                        unites_combi.sort()
+                    for combinaison in self.Get_combinaisons(tarif):
+                        unites_combi = combinaison.liste_unites
                         if self.Recherche_combinaison(dictUnitesUtilisees, unites_combi, tarif):
                             if len(unites_combi) > tarif.nbre_max_unites_combi:
                                 tarif.nbre_max_unites_combi = len(unites_combi)
@@ -659,7 +866,9 @@ class Facturation():
 
                                 # Recherche la quantité de conso déjà enregistrées dans la DB
                                 if "-" not in IDprestationForfait:
-                                    for conso in Consommation.objects.filter(prestation_id=IDprestationForfait):
+                                    if IDprestationForfait not in self.dict_conso_forfaits:
+                                        self.dict_conso_forfaits[IDprestationForfait] = list(Consommation.objects.filter(prestation_id=IDprestationForfait))
+                                    for conso in self.dict_conso_forfaits[IDprestationForfait]:
                                         key = "%s_%d" % (conso.date, conso.inscription_id)
                                         dict_quantites.setdefault(key, [])
                                         dict_quantites[key].append(conso.unite_id)
@@ -717,7 +926,7 @@ class Facturation():
                         for conso in self.donnees["consommations"].get("%s_%s" % (case_tableau["date"], case_tableau["inscription"]), []):
                             if conso["evenement"] and conso["etat"] not in ("attente", "refus"):
                                 idevenement = conso["evenement"]
-                                evenement = Evenement.objects.filter(pk=idevenement).first()
+                                evenement = self.Get_evenement(idevenement)
                                 liste_evenements.append(evenement)
                                 logger.debug("Evenement trouvé sur la ligne : ID" + str(idevenement))
 
@@ -729,7 +938,7 @@ class Facturation():
                         if evenement:
                             tarif = None
                             # tarif avancé
-                            for tarif_evenement in Tarif.objects.filter(evenement=evenement, categories_tarifs=case_tableau["categorie_tarif"]).order_by("date_debut"):
+                            for tarif_evenement in self.Get_tarifs_evenement(evenement, case_tableau["categorie_tarif"]):
                                 if self.Recherche_tarif_valide(tarif_evenement, case_tableau):
                                     tarif = tarif_evenement
                                     tarif.nom_evenement = evenement.nom
@@ -782,77 +991,74 @@ class Facturation():
                         # -------------------------------------------------------------------------
 
                         # Recherche si une aide est valable à cette date et pour cet individu et pour cette activité
-                        key_aide = "%d_%d_%d" % (case_tableau["famille"], case_tableau["individu"], case_tableau["activite"])
-                        if key_aide not in self.dict_aides:
-                            self.dict_aides[key_aide] = Aide.objects.select_related("caisse").filter(famille_id=case_tableau["famille"], individus__pk=case_tableau["individu"], activite_id=case_tableau["activite"])
+                        aides = self.Get_aides(case_tableau)
 
                         liste_aide_retenues = []
-                        if key_aide in self.dict_aides:
-                            if self.dict_aides[key_aide]:
-                                logger.debug("Aides potentielles trouvées = " + str(self.dict_aides[key_aide]))
-
-                            for aide in self.dict_aides[key_aide]:
-                                if str(aide.date_debut) <= case_tableau["date"] and str(aide.date_fin) >= case_tableau["date"] and self.Verification_periodes(aide.jours_scolaires, aide.jours_vacances, case_tableau["date"]):
-                                    liste_combi_valides = []
-
-                                    # On recherche si des combinaisons sont présentes sur cette ligne
-                                    for combi in CombiAide.objects.prefetch_related('unites').filter(aide=aide):
-                                        if tarif.combi_retenue == [unite.pk for unite in combi.unites.all().order_by("pk")]:
-                                            combi.nbre_max_unites = len(tarif.combi_retenue)
-                                            liste_combi_valides.append(combi)
-
-                                    if liste_combi_valides:
-                                        # Tri des combinaisons par nombre d'unités et on garde la combi qui a le plus grand nombre d'unités
-                                        liste_combi_valides.sort(key=lambda combi: combi.nbre_max_unites, reverse=True)
-                                        combi_retenue = liste_combi_valides[0]
-                                        logger.debug("Combi aide retenue : " + str(combi_retenue))
-
-                                        # Vérifie que le montant max ou le nbre de dates max n'est pas déjà atteint avant application
-                                        aide_valide = True
-                                        liste_aides_utilisees = []
-                                        if aide.nbre_dates_max or aide.montant_max:
-
-                                            def Ajoute_aide(IDprestation, date, IDindividu, montant):
-                                                if IDprestation not in self.liste_anciennes_prestations and (IDindividu != case_tableau["individu"] or date != case_tableau["date"]):
-                                                    liste_aides_utilisees.append({"idprestation": IDprestation, "date": date, "montant": montant})
-
-                                            # Recherche dans les nouvelles prestations
-                                            for IDprestation, dict_prestation in self.dict_nouvelles_prestations.items():
-                                                for dict_aide in dict_prestation["aides"]:
-                                                    if dict_aide["aide"] == combi_retenue.aide_id:
-                                                        Ajoute_aide(IDprestation, dict_prestation["date"], dict_prestation["individu"], dict_aide["montant"])
-
-                                            # Recherche dans les aides affichées
-                                            liste_id_temp = []
-                                            for dict_aide in self.donnees["dict_aides"]:
-                                                if dict_aide["famille"] == case_tableau["famille"] and dict_aide["aide"] == combi_retenue.aide_id:
-                                                    Ajoute_aide(dict_aide["idprestation"], dict_aide["date"], dict_aide["individu"], dict_aide["montant"])
-                                                    liste_id_temp.append(dict_aide["idprestation"])
-
-                                            # Recherche dans la base de données
-                                            for deduction in Deduction.objects.filter(famille_id=case_tableau["famille"], aide=combi_retenue.aide).prefetch_related('prestation'):
-                                                if deduction.prestation_id not in self.donnees["dict_suppressions"]["prestations"] and deduction.prestation_id not in liste_id_temp:
-                                                    Ajoute_aide(deduction.prestation_id, str(deduction.date), deduction.prestation.individu_id, float(deduction.montant))
-
-                                            logger.debug("%d déductions utilisent déjà cette aide : %s" % (len(liste_aides_utilisees), liste_aides_utilisees))
-
-                                            montant_total = decimal.Decimal(0.0)
-                                            dict_dates = {}
-                                            for dict_aide in liste_aides_utilisees:
-                                                montant_total += decimal.Decimal(dict_aide["montant"])
-                                                dict_dates[dict_aide["date"]] = None
-
-                                            if aide.nbre_dates_max and (len(dict_dates.keys()) >= aide.nbre_dates_max):
-                                                logger.debug("Le nombre de dates max de l'aide est dépassé. Aide non appliquée.")
-                                                aide_valide = False
-
-                                            if aide.montant_max and (montant_total + combi_retenue.montant > aide.montant_max):
-                                                logger.debug("Le montant max de l'aide est dépassé. Aide non appliquée.")
-                                                aide_valide = False
-
-                                        # Mémorisation de l'aide retenue
-                                        if aide_valide:
-                                            liste_aide_retenues.append(combi_retenue)
+                        if aides:
+                            logger.debug("Aides potentielles trouvées = " + str(aides))
+
+                        for aide in aides:
+                            if str(aide.date_debut) <= case_tableau["date"] and str(aide.date_fin) >= case_tableau["date"] and self.Verification_periodes(aide.jours_scolaires, aide.jours_vacances, case_tableau["date"]):
+                                liste_combi_valides = []
+
+                                # On recherche si des combinaisons sont présentes sur cette ligne
+                                for combi in self.dict_combi_aides.get(aide.pk, []):
+                                    if tarif.combi_retenue == combi.liste_unites:
+                                        combi.nbre_max_unites = len(tarif.combi_retenue)
+                                        liste_combi_valides.append(combi)
+
+                                if liste_combi_valides:
+                                    # Tri des combinaisons par nombre d'unités et on garde la combi qui a le plus grand nombre d'unités
+                                    liste_combi_valides.sort(key=lambda combi: combi.nbre_max_unites, reverse=True)
+                                    combi_retenue = liste_combi_valides[0]
+                                    logger.debug("Combi aide retenue : " + str(combi_retenue))
+
+                                    # Vérifie que le montant max ou le nbre de dates max n'est pas déjà atteint avant application
+                                    aide_valide = True
+                                    liste_aides_utilisees = []
+                                    if aide.nbre_dates_max or aide.montant_max:
+
+                                        def Ajoute_aide(IDprestation, date, IDindividu, montant):
+                                            if IDprestation not in self.liste_anciennes_prestations and (IDindividu != case_tableau["individu"] or date != case_tableau["date"]):
+                                                liste_aides_utilisees.append({"idprestation": IDprestation, "date": date, "montant": montant})
+
+                                        # Recherche dans les nouvelles prestations
+                                        for IDprestation, dict_prestation in self.dict_nouvelles_prestations.items():
+                                            for dict_aide in dict_prestation["aides"]:
+                                                if dict_aide["aide"] == combi_retenue.aide_id:
+                                                    Ajoute_aide(IDprestation, dict_prestation["date"], dict_prestation["individu"], dict_aide["montant"])
+
+                                        # Recherche dans les aides affichées
+                                        liste_id_temp = []
+                                        for dict_aide in self.donnees["dict_aides"]:
+                                            if dict_aide["famille"] == case_tableau["famille"] and dict_aide["aide"] == combi_retenue.aide_id:
+                                                Ajoute_aide(dict_aide["idprestation"], dict_aide["date"], dict_aide["individu"], dict_aide["montant"])
+                                                liste_id_temp.append(dict_aide["idprestation"])
+
+                                        # Recherche dans la base de données
+                                        for deduction in self.Get_deductions(case_tableau["famille"], aide):
+                                            if deduction.prestation_id not in self.donnees["dict_suppressions"]["prestations"] and deduction.prestation_id not in liste_id_temp:
+                                                Ajoute_aide(deduction.prestation_id, str(deduction.date), deduction.prestation.individu_id, float(deduction.montant))
+
+                                        logger.debug("%d déductions utilisent déjà cette aide : %s" % (len(liste_aides_utilisees), liste_aides_utilisees))
+
+                                        montant_total = decimal.Decimal(0.0)
+                                        dict_dates = {}
+                                        for dict_aide in liste_aides_utilisees:
+                                            montant_total += decimal.Decimal(dict_aide["montant"])
+                                            dict_dates[dict_aide["date"]] = None
+
+                                        if aide.nbre_dates_max and (len(dict_dates.keys()) >= aide.nbre_dates_max):
+                                            logger.debug("Le nombre de dates max de l'aide est dépassé. Aide non appliquée.")
+                                            aide_valide = False
+
+                                        if aide.montant_max and (montant_total + combi_retenue.montant > aide.montant_max):
+                                            logger.debug("Le montant max de l'aide est dépassé. Aide non appliquée.")
+                                            aide_valide = False
+
+                                    # Mémorisation de l'aide retenue
+                                    if aide_valide:
+                                        liste_aide_retenues.append(combi_retenue)
 
 
                         if not forfait_credit:
@@ -872,6 +1078,8 @@ class Facturation():
                             IDprestation = dict_resultat["IDprestation"]
                             if dict_resultat["nouveau"]:
                                 self.dict_nouvelles_prestations[IDprestation] = dict_resultat["dictPrestation"]
+                                if self.index_prestations is not None:
+                                    self.Indexer_prestation(IDprestation, dict_resultat["dictPrestation"], nouvelle=True)
                                 logger.debug("Ajout de la nouvelle prestation " + str(IDprestation))
                         else:
                             IDprestation = forfait_credit
@@ -886,9 +1094,9 @@ class Facturation():
                     if not conso["forfait"]:
 
                         # Retrouve le IDprestation
-                        if (conso["unite"], conso["evenement"]) in list(dictUnitesPrestations.keys()):
+                        if (conso["unite"], conso["evenement"]) in dictUnitesPrestations:
                             IDprestation = dictUnitesPrestations[(conso["unite"], conso["evenement"])]
-                        elif (conso["unite"], None) in list(dictUnitesPrestations.keys()):
+                        elif (conso["unite"], None) in dictUnitesPrestations:
                             IDprestation = dictUnitesPrestations[(conso["unite"], None)]
                         else:
                             IDprestation = None
@@ -897,11 +1105,10 @@ class Facturation():
                         self.dict_modif_cases[conso["key_case"]] = IDprestation
 
                 # 8 - Supprime des prestations qui ne sont plus utilisées sur la ligne
-                for idprestation, dict_prestation in self.donnees["prestations"].items():
-                    if dict_prestation["date"] == case_tableau["date"] and dict_prestation["famille"] == case_tableau["famille"] and dict_prestation["individu"] == case_tableau["individu"] and dict_prestation["activite"] == case_tableau["activite"]:
-                        if idprestation not in dictUnitesPrestations.values() and idprestation not in self.liste_anciennes_prestations and not dict_prestation["forfait_date_debut"] and not dict_prestation["forfait"]:
-                            logger.debug("La prestation suivante ne semble plus utilisée, on la supprime : " + str(idprestation))
-                            self.liste_anciennes_prestations.append(idprestation)
+                for idprestation, dict_prestation in self.Get_prestations_ligne(case_tableau):
+                    if idprestation not in dictUnitesPrestations.values() and idprestation not in self.liste_anciennes_prestations and not dict_prestation["forfait_date_debut"] and not dict_prestation["forfait"]:
+                        logger.debug("La prestation suivante ne semble plus utilisée, on la supprime : " + str(idprestation))
+                        self.liste_anciennes_prestations.append(idprestation)
 
         # Messages d'information
         if self.tarif_fratries_exists and self.donnees["mode"] in ("individu", "date"):
@@ -938,27 +1145,26 @@ class Facturation():
         }
 
         # Recherche si une prestation identique existe déjà en mémoire
-        for dict_temp in (self.donnees["prestations"].items(), self.dict_nouvelles_prestations.items()):
-            for IDprestation, dict_prestation_1 in dict_temp:
-                dict_prestation_2 = dict_prestation_1.copy()
+        for IDprestation, dict_prestation_1 in self.Get_prestations_identiques(dictPrestation):
+            dict_prestation_2 = dict_prestation_1.copy()
 
-                # Renvoie prestation existante si la prestation apparaît déjà sur une facture même si le montant est différent
-                keys = ["date", "individu", "tarif", "famille"]
-                if evenement:
-                    keys.append("label")
-                if dict_prestation_2["facture"] != None and CompareDict(dictPrestation, dict_prestation_2, keys=keys) == True:
-                    logger.debug("Récupération d'un IDprestation facturé existant : " + str(IDprestation))
-                    return {"IDprestation": IDprestation, "dictPrestation": dict_prestation_2, "nouveau": False}
+            # Renvoie prestation existante si la prestation apparaît déjà sur une facture même si le montant est différent
+            keys = ["date", "individu", "tarif", "famille"]
+            if evenement:
+                keys.append("label")
+            if dict_prestation_2["facture"] != None and CompareDict(dictPrestation, dict_prestation_2, keys=keys) == True:
+                logger.debug("Récupération d'un IDprestation facturé existant : " + str(IDprestation))
+                return {"IDprestation": IDprestation, "dictPrestation": dict_prestation_2, "nouveau": False}
 
-                # Renvoie prestation existante si la prestation semble identique avec montants identiques
-                keys = ["date", "individu", "tarif", "montant_initial", "montant", "categorie_tarif", "famille", "label", "temps_facture", "quantite", "tarif_ligne"]
+            # Renvoie prestation existante si la prestation semble identique avec montants identiques
+            keys = ["date", "individu", "tarif", "montant_initial", "montant", "categorie_tarif", "famille", "label", "temps_facture", "quantite", "tarif_ligne"]
 
-                if dictPrestation["temps_facture"]: dictPrestation["temps_facture"] = dictPrestation["temps_facture"].lstrip("0")
-                if dict_prestation_2["temps_facture"]: dict_prestation_2["temps_facture"] = dict_prestation_2["temps_facture"].lstrip("0")
+            if dictPrestation["temps_facture"]: dictPrestation["temps_facture"] = dictPrestation["temps_facture"].lstrip("0")
+            if dict_prestation_2["temps_facture"]: dict_prestation_2["temps_facture"] = dict_prestation_2["temps_facture"].lstrip("0")
 
-                if CompareDict(dictPrestation, dict_prestation_2, keys=keys) == True:
-                    logger.debug("Récupération d'un IDprestation existant : " + str(IDprestation))
-                    return {"IDprestation": IDprestation, "dictPrestation": dict_prestation_2, "nouveau": False}
+            if CompareDict(dictPrestation, dict_prestation_2, keys=keys) == True:
+                logger.debug("Récupération d'un IDprestation existant : " + str(IDprestation))
+                return {"IDprestation": IDprestation, "dictPrestation": dict_prestation_2, "nouveau": False}
 
         # Génération d'un nouvel IDprestation
         IDprestation = str(uuid4())
@@ -1020,8 +1226,7 @@ class Facturation():
 
         # Vérifie si caisse ok
         if tarif.caisses.exists():
-            famille = Famille.objects.prefetch_related("caisse").get(pk=case_tableau["famille"])
-            if famille.caisse_id not in [caisse.pk for caisse in tarif.caisses.all()]:
+            if self.Get_caisse_famille(case_tableau["famille"]) not in [caisse.pk for caisse in tarif.caisses.all()]:
                 return False
 
         # Vérifie si période ok
@@ -1044,7 +1249,7 @@ class Facturation():
 
         # Si la famille a un QF :
         if IDfamille not in self.dict_quotients:
-            self.dict_quotients[IDfamille] = Quotient.objects.filter(famille_id=IDfamille).order_by("date_debut")
+            self.Charger_quotients([IDfamille])
         for quotient in self.dict_quotients[IDfamille]:
             if quotient.date_debut <= date <= quotient.date_fin and (not tarif.type_quotient or tarif.type_quotient == quotient.type_quotient):
                 return quotient.quotient
@@ -1052,13 +1257,16 @@ class Facturation():
 
     def Verification_periodes(self, jours_scolaires, jours_vacances, date):
         """ Vérifie si jour est scolaire ou vacances """
+        if date not in self.dict_vacances:
+            self.dict_vacances[date] = bool(utils_dates.EstEnVacances(utils_dates.ConvertDateENGtoDate(date), self.donnees["liste_vacances"]))
+        est_en_vacances = self.dict_vacances[date]
         date = utils_dates.ConvertDateENGtoDate(date)
         valide = False
         if jours_scolaires:
-            if not utils_dates.EstEnVacances(date, self.donnees["liste_vacances"]) and str(date.weekday()) in [x for x in jours_scolaires]:
+            if not est_en_vacances and str(date.weekday()) in [x for x in jours_scolaires]:
                 valide = True
         if jours_vacances:
-            if utils_dates.EstEnVacances(date, self.donnees["liste_vacances"]) and str(date.weekday()) in [x for x in jours_vacances]:
+            if est_en_vacances and str(date.weekday()) in [x for x in jours_vacances]:
                 valide = True
         return valide
 
@@ -1105,16 +1313,13 @@ class Facturation():
 
         # Récupération des lignes de tarifs mémorisés
         def Get_lignes_tarif():
-            if tarif in self.dict_lignes_tarifs:
-                return self.dict_lignes_tarifs[tarif]
-            self.dict_lignes_tarifs[tarif] = TarifLigne.objects.filter(tarif=tarif).order_by("num_ligne").all()
-            return self.dict_lignes_tarifs[tarif]
+            return self.Get_lignes_tarif(tarif)
 
 
         # Recherche du montant du tarif : MONTANT UNIQUE
         if methode_calcul == "montant_unique":
             lignes_calcul = Get_lignes_tarif()
-            ligne_calcul = lignes_calcul.first()
+            ligne_calcul = lignes_calcul[0] if lignes_calcul else None
             montant_tarif = ligne_calcul.montant_unique
             if ligne_calcul.montant_questionnaire and ligne_calcul.montant_questionnaire != "0":
                 montant_tarif = self.Get_montant_questionnaire(IDquestion=ligne_calcul.montant_questionnaire, case_tableau=case_tableau)
@@ -1218,7 +1423,7 @@ class Facturation():
         # Recherche du montant du tarif : EN FONCTION DE LA DATE - MONTANT UNIQUE OU QF
         if methode_calcul in ("montant_unique_date", "qf_date"):
             montant_tarif = 0.0
-            lignes_calcul = TarifLigne.objects.filter(tarif=tarif, date=case_tableau["date"]).order_by("num_ligne").all()
+            lignes_calcul = self.Get_lignes_tarif(tarif, date=case_tableau["date"])
 
             if "qf" in methode_calcul:
                 qf_famille = self.Recherche_QF(tarif, case_tableau)
@@ -1247,7 +1452,7 @@ class Facturation():
             lignes_calcul = Get_lignes_tarif()
 
             if "montant_unique" in methode_calcul:
-                ligne_calcul = lignes_calcul.first()
+                ligne_calcul = lignes_calcul[0] if lignes_calcul else None
 
             if "qf" in methode_calcul:
                 for ligne_calcul in lignes_calcul:
@@ -1534,6 +1739,12 @@ class Facturation():
         return montant_tarif, nom_tarif, temps_facture, quantite, ligne_calcul
 
     def Get_montant_questionnaire(self, IDquestion=None, case_tableau=None):
+        key = (IDquestion, case_tableau["famille"], case_tableau["individu"])
+        if key not in self.dict_reponses:
+            self.dict_reponses[key] = self.Get_reponse_questionnaire(IDquestion=IDquestion, case_tableau=case_tableau)
+        return self.dict_reponses[key]
+
+    def Get_reponse_questionnaire(self, IDquestion=None, case_tableau=None):
         conditions = Q(question_id=IDquestion) & ((Q(question__categorie="famille") & Q(famille_id=case_tableau["famille"]) | Q(question__categorie="individu") & Q(individu_id=case_tableau["individu"])))
         reponse = QuestionnaireReponse.objects.filter(conditions).first()
         if reponse:
@@ -4,12 +4,13 @@
 #  Distribué sous licence GNU GPL.
 
 import datetime, json
-from django.db.models import Q, Count
+from django.db.models import Q
 from django.shortcuts import render
 from django.views.generic import TemplateView
-from core.models import Activite, Ouverture, Remplissage, UniteRemplissage, Vacance, Consommation, Evenement, Groupe
+from core.models import Activite, Ouverture, Remplissage, UniteRemplissage, Vacance, Evenement, Groupe
 from core.views.base import CustomView
-from core.utils import utils_dates, utils_parametres
+from core.utils import utils_dates, utils_parametres, utils_cache
+from consommations.utils import utils_places
 
 
 def Get_activites(request=None):
@@ -110,20 +111,19 @@ def Get_data(parametres={}, request=None):
             dict_unites_remplissage_unites[unite_conso.pk].append(unite_remplissage.pk)
 
     # Importation des ouvertures
-    liste_ouvertures = []
-    liste_dates = []
+    ouvertures = set()
+    dates = set()
     for ouverture in Ouverture.objects.filter(conditions_periodes & Q(activite__in=liste_activites)):
         for id_unite_remplissage in dict_unites_remplissage_unites.get(ouverture.unite_id, []):
-            liste_ouvertures.append("%s_%s_%s" % (ouverture.date, id_unite_remplissage, ouverture.groupe_id))
-            if ouverture.date not in liste_dates:
-                liste_dates.append(ouverture.date)
+            ouvertures.add("%s_%s_%s" % (ouverture.date, id_unite_remplissage, ouverture.groupe_id))
+            dates.add(ouverture.date)
 
     # Récupération des dates
-    liste_dates.sort()
+    liste_dates = sorted(dates)
 
     # Importation des vacances
     if date_min and date_max:
-        liste_vacances = Vacance.objects.filter(date_fin__gte=date_min, date_debut__lte=date_max)
+        liste_vacances = utils_cache.Get_vacances(date_min=date_min, date_max=date_max)
     else:
         liste_vacances = []
 
@@ -144,17 +144,15 @@ def Get_data(parametres={}, request=None):
             if activite in dict_groupes:
                 dict_groupes[activite].append(Total())
 
-    # Importation des places prises
-    liste_places = Consommation.objects.values('date', 'unite', 'groupe', 'quantite', 'evenement').annotate(nbre=Count('pk')).filter(conditions_periodes & Q(activite__in=liste_activites) & Q(etat__in=("reservation", "present")))
+    # Importation des places prises (réservations et présents) depuis la table tenue à jour à chaque enregistrement
     dict_places = {}
-    for p in liste_places:
-        for idgroupe in [p["groupe"], 0]:
-            for id_unite_remplissage in dict_unites_remplissage_unites.get(p["unite"], []):
-                key = "%s_%d_%d" % (p["date"], id_unite_remplissage, idgroupe)
-                quantite = p["nbre"] * p["quantite"] if p["quantite"] else p["nbre"]
+    for date, idunite, idgroupe_conso, idevenement, quantite in utils_places.Get_places_prises(activites=liste_activites, conditions_periodes=conditions_periodes, attente=False):
+        for idgroupe in [idgroupe_conso, 0]:
+            for id_unite_remplissage in dict_unites_remplissage_unites.get(idunite, []):
+                key = "%s_%d_%d" % (date, id_unite_remplissage, idgroupe)
                 dict_places[key] = dict_places.get(key, 0) + quantite
-                if p["evenement"]:
-                    key += "_%d" % p["evenement"]
+                if idevenement:
+                    key += "_%d" % idevenement
                     dict_places[key] = dict_places.get(key, 0) + quantite
 
     # Colonnes
@@ -224,7 +222,7 @@ def Get_data(parametres={}, request=None):
                         restantes += dict_cases[key_temp]["restantes"]
                 case_valide = True
 
-            elif key_case in liste_ouvertures:
+            elif key_case in ouvertures:
                 # Case normale
                 liste_initiales = []
                 for idgroupe in [colonne["groupe"].pk, 0]:
@@ -10,6 +10,10 @@ class Core(AppConfig):
     # Pour personnaliser l'affichage dans admin
     verbose_name = "Utilisateurs"
 
+    def ready(self):
+        # Invalidation du cache partagé lors des modifications des données de référence
+        from core import signals
+
 
 class CustomAuth(AppConfig):
     name = 'django.contrib.auth'
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2019-2021 Ivan LUCAS.
+#  Noethysweb, application de gestion multi-activités.
+#  Distribué sous licence GNU GPL.
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Analyse avec EXPLAIN les requêtes de la grille, de la facturation et des statistiques et signale les index manquants. Exemple : analyser_index --plans"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--date_debut", type=str, nargs="?", help="Date début au format anglais", default=None)
+        parser.add_argument("--date_fin", type=str, nargs="?", help="Date fin au format anglais", default=None)
+        parser.add_argument("--plans", action="store_true", help="Afficher les plans d'exécution complets", default=False)
+
+    def handle(self, *args, **kwargs):
+        from core.utils import utils_dates, utils_index
+
+        # Index déclarés mais absents de la base (migration non appliquée par exemple)
+        index_manquants = utils_index.Get_index_manquants()
+        for table, nom_index, colonnes in index_manquants:
+            self.stdout.write(self.style.WARNING("Index manquant sur la table %s : %s (%s)" % (table, nom_index, ", ".join(colonnes))))
+
+        # Analyse des requêtes représentatives
+        nbre_alertes = 0
+        rapport = utils_index.Analyser(date_debut=utils_dates.ConvertDateENGtoDate(kwargs["date_debut"]), date_fin=utils_dates.ConvertDateENGtoDate(kwargs["date_fin"]))
+        for label, tables, plan in rapport:
+            if tables:
+                nbre_alertes += 1
+                self.stdout.write(self.style.WARNING("%s : parcours complet de %s" % (label, ", ".join(tables))))
+            else:
+                self.stdout.write("%s : OK" % label)
+            if kwargs["plans"]:
+                self.stdout.write(plan + "\n")
+
+        if index_manquants or nbre_alertes:
+            self.stdout.write(self.style.WARNING("Analyse des index terminée : %d index manquants, %d requêtes sans index adapté" % (len(index_manquants), nbre_alertes)))
+        else:
+            self.stdout.write(self.style.SUCCESS("Analyse des index OK"))
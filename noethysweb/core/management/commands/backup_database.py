@@ -1,9 +1,36 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2019-2021 Ivan LUCAS.
+#  Noethysweb, application de gestion multi-activités.
+#  Distribué sous licence GNU GPL.
+
 from django.core.management.base import BaseCommand
 
+
 class Command(BaseCommand):
-    help = "Backup the database"
+    help = "Sauvegarde la base SQLite sans bloquer l'application (copie compressée, dédupliquée et purgée selon la rétention). Exemple : backup_database --liste"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--liste", action="store_true", help="Afficher la liste des sauvegardes au lieu d'en créer une", default=False)
+        parser.add_argument("--restaurer", type=str, nargs="?", help="Décompresser la dernière sauvegarde dans le fichier indiqué (la base n'est pas remplacée)", default=None)
 
     def handle(self, *args, **kwargs):
-        from outils.utils import utils_update
-        resultat = utils_update.backup_database()
-        print("Backup result:", resultat)
\ No newline at end of file
+        from outils.utils import utils_sauvegarde_db
+        if kwargs["liste"]:
+            for sauvegarde in utils_sauvegarde_db.Get_catalogue():
+                self.stdout.write("%s  %s  %d octets" % (sauvegarde["date"], sauvegarde["fichier"], sauvegarde["taille"]))
+            return
+
+        if kwargs["restaurer"]:
+            sauvegarde = utils_sauvegarde_db.Get_derniere_sauvegarde()
+            if not sauvegarde:
+                self.stdout.write(self.style.ERROR("Aucune sauvegarde disponible"))
+                return
+            utils_sauvegarde_db.Decompresser(utils_sauvegarde_db.Get_chemin(sauvegarde), kwargs["restaurer"])
+            self.stdout.write(self.style.SUCCESS("Décompression de la sauvegarde du %s OK" % sauvegarde["date"]))
+            return
+
+        sauvegarde = utils_sauvegarde_db.Creer_sauvegarde()
+        if not sauvegarde:
+            self.stdout.write(self.style.ERROR("Sauvegarde de la base impossible (base non SQLite ou sauvegarde déjà en cours)"))
+            return
+        self.stdout.write(self.style.SUCCESS("Sauvegarde de la base OK (%s)" % utils_sauvegarde_db.Get_chemin(sauvegarde)))
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2019-2021 Ivan LUCAS.
+#  Noethysweb, application de gestion multi-activités.
+#  Distribué sous licence GNU GPL.
+
+import json
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Génère un jeu de données de test et mesure la durée et le nombre de requêtes des traitements principaux (à lancer sur une base de développement). Exemple : benchmark --familles 200 --sortie mesures.json"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--familles", type=int, nargs="?", help="Nombre de familles générées", default=100)
+        parser.add_argument("--enfants", type=int, nargs="?", help="Nombre d'enfants inscrits par famille", default=2)
+        parser.add_argument("--scenarios", type=str, nargs="?", help="Codes des scénarios à mesurer séparés par des virgules (tous par défaut)", default="")
+        parser.add_argument("--conserver", action="store_true", help="Conserver le jeu de données généré au lieu de l'annuler", default=False)
+        parser.add_argument("--sortie", type=str, nargs="?", help="Fichier JSON dans lequel enregistrer les mesures", default=None)
+        parser.add_argument("--reference", type=str, nargs="?", help="Fichier JSON de mesures précédentes à comparer", default=None)
+
+    def handle(self, *args, **kwargs):
+        from core.utils import utils_benchmark
+        scenarios = [code.strip() for code in kwargs["scenarios"].split(",") if code.strip()]
+        codes_inconnus = set(scenarios) - {code for code, label, fonction in utils_benchmark.SCENARIOS}
+        if codes_inconnus:
+            self.stdout.write(self.style.ERROR("Scénarios inconnus : %s" % ", ".join(sorted(codes_inconnus))))
+            return
+
+        resultats = utils_benchmark.Executer(nbre_familles=kwargs["familles"], nbre_enfants=kwargs["enfants"], scenarios=scenarios, conserver=kwargs["conserver"])
+
+        # Comparaison avec des mesures précédentes
+        if kwargs["reference"]:
+            with open(kwargs["reference"]) as fichier:
+                utils_benchmark.Comparer(resultats, json.load(fichier))
+
+        for mesure in resultats:
+            texte = "%s : %.3f s | %d requêtes" % (mesure["label"], mesure["duree"], mesure["requetes"])
+            if "ecart_duree" in mesure:
+                texte += " (%+.1f %% | %+d requêtes)" % (mesure["ecart_duree"], mesure["ecart_requetes"])
+            self.stdout.write(texte)
+
+        if kwargs["sortie"]:
+            with open(kwargs["sortie"], "w") as fichier:
+                json.dump(resultats, fichier, indent=2)
+
+        self.stdout.write(self.style.SUCCESS("Benchmark OK"))
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2019-2021 Ivan LUCAS.
+#  Noethysweb, application de gestion multi-activités.
+#  Distribué sous licence GNU GPL.
+
+import os, datetime
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+
+class Command(BaseCommand):
+    help = "Affiche la configuration SQLite et les attentes de verrou en écriture mémorisées par l'application. Exemple : diagnostic_sqlite --sonde 10"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sonde", type=int, nargs="?", help="Nombre de mesures du temps d'obtention du verrou en écriture", default=0)
+        parser.add_argument("--checkpoint", action="store_true", help="Reporter le journal WAL dans la base et le tronquer", default=False)
+        parser.add_argument("--raz", action="store_true", help="Remettre à zéro les statistiques des attentes", default=False)
+
+    def handle(self, *args, **kwargs):
+        from core.utils import utils_sqlite
+        if connection.vendor != "sqlite":
+            self.stdout.write(self.style.ERROR("La base de données n'est pas une base SQLite"))
+            return
+
+        # Configuration
+        self.stdout.write("Configuration de la connexion :")
+        for nom, valeur in utils_sqlite.Get_etat().items():
+            self.stdout.write("   %s = %s" % (nom, valeur))
+        chemin = connection.settings_dict["NAME"]
+        for suffixe in ("", "-wal", "-shm"):
+            if os.path.isfile(str(chemin) + suffixe):
+                self.stdout.write("   Taille du fichier %s : %.1f Mo" % (os.path.basename(str(chemin) + suffixe), os.path.getsize(str(chemin) + suffixe) / 1024 / 1024))
+
+        if kwargs["checkpoint"]:
+            with connection.cursor() as cursor:
+                cursor.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+                self.stdout.write("Checkpoint WAL : %s" % (cursor.fetchone(),))
+
+        # Attentes mémorisées
+        statistiques = utils_sqlite.Get_statistiques()
+        self.stdout.write("Attentes de verrou en écriture supérieures à %dms :" % (utils_sqlite.SEUIL_ATTENTE * 1000))
+        if not statistiques:
+            self.stdout.write("   Aucune")
+        for label, stats in sorted(statistiques.items(), key=lambda item: -item[1]["duree"]):
+            self.stdout.write("   %s : %d attentes, total %.2fs, moyenne %.3fs, max %.3fs, %d échecs, dernière le %s" % (
+                label, stats["nbre"], stats["duree"], stats["duree"] / stats["nbre"], stats["max"], stats["echecs"],
+                datetime.datetime.fromtimestamp(stats["derniere"]).strftime("%d/%m/%Y %H:%M:%S")))
+
+        # Mesure en direct
+        if kwargs["sonde"]:
+            durees = utils_sqlite.Sonder(nbre=kwargs["sonde"])
+            self.stdout.write("Obtention du verrou en écriture : moyenne %.3fs, max %.3fs sur %d essais" % (sum(durees) / len(durees), max(durees), len(durees)))
+
+        if kwargs["raz"]:
+            utils_sqlite.Reinitialiser_statistiques()
+
+        self.stdout.write(self.style.SUCCESS("Diagnostic SQLite OK"))
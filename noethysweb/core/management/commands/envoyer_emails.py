@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2019-2021 Ivan LUCAS.
+#  Noethysweb, application de gestion multi-activités.
+#  Distribué sous licence GNU GPL.
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Envoi des emails programmés. Exemple : envoyer_emails --boucle pour attendre indéfiniment de nouveaux envois"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--boucle", action="store_true", help="Attendre de nouveaux envois au lieu de s'arrêter", default=False)
+        parser.add_argument("--intervalle", type=int, nargs="?", help="Intervalle en secondes entre deux recherches de nouveaux envois", default=10)
+
+    def handle(self, *args, **kwargs):
+        from outils.utils import utils_taches_email
+        nbre_taches = utils_taches_email.Traiter_taches(boucle=kwargs["boucle"], intervalle=kwargs["intervalle"])
+        self.stdout.write(self.style.SUCCESS("Envoi des emails programmés OK (%d tâches traitées)" % nbre_taches))
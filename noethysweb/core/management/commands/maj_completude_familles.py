@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2019-2021 Ivan LUCAS.
+#  Noethysweb, application de gestion multi-activités.
+#  Distribué sous licence GNU GPL.
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Précalcule la complétude des dossiers des familles (pièces, adhésions, questionnaires, sondages et renseignements manquants). Exemple : maj_completude_familles --tout"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tout", action="store_true", help="Recalculer toutes les familles et pas seulement celles dont la complétude est obsolète", default=False)
+
+    def handle(self, *args, **kwargs):
+        from core.utils import utils_completude
+        if kwargs["tout"]:
+            utils_completude.Invalider_tout()
+        nbre_familles = utils_completude.Actualiser_familles()
+        self.stdout.write(self.style.SUCCESS("Mise à jour de la complétude des familles OK (%d familles recalculées)" % nbre_familles))
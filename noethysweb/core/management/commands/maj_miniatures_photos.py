@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2019-2021 Ivan LUCAS.
+#  Noethysweb, application de gestion multi-activités.
+#  Distribué sous licence GNU GPL.
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Génère les miniatures WebP des photos des albums et les avatars des individus. Exemple : maj_miniatures_photos --album 3"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--album", type=int, help="ID de l'album à traiter (tous les albums par défaut)", default=None)
+        parser.add_argument("--tout", action="store_true", help="Traiter aussi les photos qui ont déjà une empreinte (miniatures supprimées ou largeurs modifiées)", default=False)
+        parser.add_argument("--purger", action="store_true", help="Supprimer les miniatures qui ne sont plus utilisées", default=False)
+
+    def handle(self, *args, **kwargs):
+        from core.models import Photo, Individu
+        from core.utils import utils_miniatures
+        photos = Photo.objects.exclude(fichier="").order_by("pk")
+        if kwargs["album"]:
+            photos = photos.filter(album_id=kwargs["album"])
+        if not kwargs["tout"]:
+            photos = photos.filter(empreinte__isnull=True)
+
+        nbre_photos, nbre_erreurs = 0, 0
+        for photo in photos.iterator(chunk_size=200):
+            if photo.Generer_miniatures():
+                nbre_photos += 1
+            else:
+                nbre_erreurs += 1
+        self.stdout.write(self.style.SUCCESS("Génération des miniatures OK (%d photos traitées, %d erreurs)" % (nbre_photos, nbre_erreurs)))
+
+        # Avatars des individus enregistrés avant leur génération à l'enregistrement de la photo
+        if not kwargs["album"]:
+            individus = Individu.objects.exclude(photo="").exclude(photo=None).order_by("pk")
+            if not kwargs["tout"]:
+                individus = individus.filter(photo_empreinte__isnull=True)
+            else:
+                individus.update(photo_empreinte=None)
+            nbre_individus, nbre_erreurs = 0, 0
+            for individu in individus.only("pk", "photo", "photo_empreinte").iterator(chunk_size=200):
+                if individu.Generer_miniature_photo():
+                    nbre_individus += 1
+                else:
+                    nbre_erreurs += 1
+            self.stdout.write(self.style.SUCCESS("Génération des avatars OK (%d individus traités, %d erreurs)" % (nbre_individus, nbre_erreurs)))
+
+        if kwargs["purger"]:
+            # Les avatars des individus sont conservés
+            empreintes = set(Photo.objects.exclude(empreinte=None).values_list("empreinte", flat=True))
+            empreintes.update(Individu.objects.exclude(photo_empreinte=None).values_list("photo_empreinte", flat=True))
+            storages = {Photo._meta.get_field("fichier").storage, Individu._meta.get_field("photo").storage}
+            nbre_fichiers = sum(utils_miniatures.Purger(storage, empreintes) for storage in storages)
+            self.stdout.write(self.style.SUCCESS("Purge des miniatures OK (%d fichiers supprimés)" % nbre_fichiers))
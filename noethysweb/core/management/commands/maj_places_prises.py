@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2019-2021 Ivan LUCAS.
+#  Noethysweb, application de gestion multi-activités.
+#  Distribué sous licence GNU GPL.
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Recalcule la table des places prises à partir des consommations. Exemple : maj_places_prises --activite 3"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--activite", type=int, nargs="?", help="ID de l'activité à recalculer (toutes par défaut)", default=None)
+
+    def handle(self, *args, **kwargs):
+        from consommations.utils import utils_places
+        nbre_journees = utils_places.Reconstruire(activite=kwargs["activite"])
+        self.stdout.write(self.style.SUCCESS("Mise à jour des places prises OK (%d journées recalculées)" % nbre_journees))
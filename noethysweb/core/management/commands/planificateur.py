@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2019-2021 Ivan LUCAS.
+#  Noethysweb, application de gestion multi-activités.
+#  Distribué sous licence GNU GPL.
+
+import signal, threading
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Exécute les tâches planifiées (PLANIFICATEUR_TACHES ou CRONJOBS) à lancer comme service : une seule instance est active à la fois. Exemple : planificateur --etat"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--etat", action="store_true", help="Afficher les tâches et les durées des dernières exécutions", default=False)
+        parser.add_argument("--ignorer_crontab", action="store_true", help="Démarrer même si des tâches django-crontab sont installées dans la crontab système", default=False)
+        parser.add_argument("--executer", type=str, nargs="?", help="Exécuter immédiatement la tâche indiquée (chemin de la fonction ou nom de la commande)", default=None)
+
+    def handle(self, *args, **kwargs):
+        from core.utils import utils_planificateur
+
+        if kwargs["etat"]:
+            statistiques = utils_planificateur.Get_statistiques()
+            taches = utils_planificateur.Get_taches()
+            if not taches:
+                self.stdout.write("Aucune tâche planifiée (voir PLANIFICATEUR_TACHES ou CRONJOBS)")
+            for tache in taches:
+                stats = statistiques.get(tache.chemin, None)
+                self.stdout.write("%s  %s" % (tache.cron.expression.ljust(15), tache.chemin))
+                if stats:
+                    self.stdout.write("   %d exécutions (%d erreurs, %d chevauchements), moyenne %.2fs, max %.2fs, dernière le %s en %.2fs%s" % (
+                        stats["nbre"], stats["nbre_erreurs"], stats["nbre_chevauchements"], stats["duree_totale"] / (stats["nbre"] or 1), stats["duree_max"],
+                        stats["dernier_debut"].strftime("%d/%m/%Y %H:%M:%S") if stats.get("dernier_debut") else "-", stats.get("derniere_duree", 0.0),
+                        " : %s" % stats["derniere_erreur"] if stats.get("derniere_erreur") else ""))
+            return
+
+        if kwargs["executer"]:
+            taches = [tache for tache in utils_planificateur.Get_taches() if tache.chemin == kwargs["executer"]]
+            tache = taches[0] if taches else utils_planificateur.Tache(expression="* * * * *", chemin=kwargs["executer"])
+            utils_planificateur.Planificateur(taches=[]).Executer_tache(tache)
+            self.stdout.write(self.style.SUCCESS("Exécution de %s OK" % tache.chemin))
+            return
+
+        # Les tâches encore installées dans la crontab système seraient exécutées deux fois
+        lignes_crontab = utils_planificateur.Get_lignes_crontab()
+        if lignes_crontab and not kwargs["ignorer_crontab"]:
+            self.stdout.write(self.style.ERROR("La crontab système contient encore %d tâches installées par django-crontab. Supprimez-les avec 'python manage.py crontab remove' avant de démarrer le planificateur." % len(lignes_crontab)))
+            return
+
+        # Arrêt propre à la réception de SIGTERM (arrêt du service) ou de Ctrl+C
+        arret = threading.Event()
+        for signal_arret in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signal_arret, lambda *args: arret.set())
+        if not utils_planificateur.Demarrer(arret=arret):
+            self.stdout.write(self.style.ERROR("Une autre instance du planificateur est déjà active"))
+            return
+        self.stdout.write(self.style.SUCCESS("Arrêt du planificateur OK"))
@@ -13,6 +13,7 @@ class Command(BaseCommand):
         parser.add_argument("--date_debut", type=str, nargs="?", help="Date début au format anglais", default=None)
         parser.add_argument("--date_fin", type=str, nargs="?", help="Date fin au format anglais", default=None)
         parser.add_argument("--mois", type=str, nargs="?", help="Mois au format AAAA-MM", default=None)
+        parser.add_argument("--processus", type=int, nargs="?", help="Nombre de processus (par défaut : RECALCUL_NBRE_PROCESSUS ou nombre de coeurs)", default=None)
 
     def handle(self, *args, **kwargs):
         import datetime, calendar
@@ -31,6 +32,9 @@ class Command(BaseCommand):
 
         # Recalcul des prestations du mois
         from facturation.utils import utils_recalculer_prestations
-        utils_recalculer_prestations.Recalculer(request=None, date_debut=date_debut, date_fin=date_fin)
+        resultat = utils_recalculer_prestations.Recalculer(request=None, date_debut=date_debut, date_fin=date_fin, nbre_processus=kwargs["processus"])
+        if resultat["nbre_erreurs"]:
+            self.stdout.write(self.style.ERROR("Recalculer les prestations : %d paquets en erreur sur %d (voir le journal)" % (resultat["nbre_erreurs"], resultat["nbre_paquets"])))
+            return
 
-        self.stdout.write(self.style.SUCCESS("Recalculer les prestations du mois en cours OK"))
+        self.stdout.write(self.style.SUCCESS("Recalculer les prestations du mois en cours OK (%d inscriptions)" % resultat["nbre_inscriptions"]))
@@ -0,0 +1,43 @@
+# Generated by Django 3.2.19 on 2026-10-18 10:38
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0234_alter_utilisateur_options'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TacheEnvoiMail',
+            fields=[
+                ('idtache', models.AutoField(db_column='IDtache', primary_key=True, serialize=False, verbose_name='ID')),
+                ('statut', models.CharField(choices=[('attente', 'En attente'), ('en_cours', 'En cours'), ('termine', 'Terminé'), ('erreur', 'Erreur'), ('annule', 'Annulé')], default='attente', max_length=50, verbose_name='Statut')),
+                ('destinataires', models.TextField(blank=True, null=True, verbose_name='Destinataires')),
+                ('url_base', models.CharField(blank=True, max_length=400, null=True, verbose_name='URL de base')),
+                ('url_portail', models.CharField(blank=True, max_length=400, null=True, verbose_name='URL du portail')),
+                ('nbre_total', models.IntegerField(default=0, verbose_name='Nombre total')),
+                ('nbre_traites', models.IntegerField(default=0, verbose_name='Nombre traités')),
+                ('nbre_succes', models.IntegerField(default=0, verbose_name='Nombre de succès')),
+                ('nbre_echecs', models.IntegerField(default=0, verbose_name="Nombre d'échecs")),
+                ('tentatives', models.IntegerField(default=0, verbose_name='Tentatives')),
+                ('date_creation', models.DateTimeField(auto_now_add=True, verbose_name='Date de création')),
+                ('date_debut', models.DateTimeField(blank=True, null=True, verbose_name='Date de début')),
+                ('date_fin', models.DateTimeField(blank=True, null=True, verbose_name='Date de fin')),
+                ('date_maj', models.DateTimeField(blank=True, null=True, verbose_name='Date de mise à jour')),
+                ('date_prochaine_tentative', models.DateTimeField(blank=True, null=True, verbose_name='Date de la prochaine tentative')),
+                ('erreur', models.TextField(blank=True, null=True, verbose_name='Erreur')),
+                ('mail', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.mail', verbose_name='Email')),
+                ('utilisateur', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Utilisateur')),
+            ],
+            options={
+                'verbose_name': "tâche d'envoi d'emails",
+                'verbose_name_plural': "tâches d'envoi d'emails",
+                'db_table': 'taches_envoi_mail',
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 3.2.19 on 2026-10-18 10:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Max, Count, Q
+
+
+def initialiser_conversations(apps, schema_editor):
+    """ Création des résumés des conversations existantes """
+    PortailMessage = apps.get_model('core', 'PortailMessage')
+    PortailConversation = apps.get_model('core', 'PortailConversation')
+    non_lu = Q(utilisateur__isnull=True, date_lecture__isnull=True)
+    resumes = PortailMessage.objects.values("famille_id", "structure_id").annotate(dernier_id=Max("idmessage"), dernier_non_lu_id=Max("idmessage", filter=non_lu), nbre_non_lus=Count("idmessage", filter=non_lu))
+    dates = dict(PortailMessage.objects.values_list("idmessage", "date_creation"))
+    PortailConversation.objects.bulk_create([PortailConversation(
+        famille_id=resume["famille_id"], structure_id=resume["structure_id"], dernier_message_id=resume["dernier_id"], dernier_message_non_lu_id=resume["dernier_non_lu_id"],
+        date_dernier_message=dates[resume["dernier_id"]], nbre_non_lus=resume["nbre_non_lus"]) for resume in resumes], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0235_tacheenvoimail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PortailConversation',
+            fields=[
+                ('idconversation', models.AutoField(db_column='IDconversation', primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_dernier_message', models.DateTimeField(blank=True, null=True, verbose_name='Date du dernier message')),
+                ('nbre_non_lus', models.IntegerField(default=0, verbose_name='Nombre de messages non lus')),
+                ('dernier_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.portailmessage', verbose_name='Dernier message')),
+                ('dernier_message_non_lu', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.portailmessage', verbose_name='Dernier message non lu')),
+                ('famille', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.famille', verbose_name='Famille')),
+                ('structure', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.structure', verbose_name='Structure')),
+            ],
+            options={
+                'verbose_name': 'conversation',
+                'verbose_name_plural': 'conversations',
+                'db_table': 'portail_conversations',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='portailconversation',
+            index=models.Index(fields=['structure', 'nbre_non_lus'], name='portail_con_structu_1db425_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='portailconversation',
+            unique_together={('famille', 'structure')},
+        ),
+        migrations.RunPython(initialiser_conversations, migrations.RunPython.noop),
+    ]
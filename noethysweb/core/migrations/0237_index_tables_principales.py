@@ -0,0 +1,53 @@
+# Generated by Django 3.2.19 on 2026-10-18 10:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0236_portailconversation'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='consommation',
+            index=models.Index(fields=['activite', 'date'], name='consommations_activite_date'),
+        ),
+        migrations.AddIndex(
+            model_name='consommation',
+            index=models.Index(fields=['inscription', 'date'], name='consommations_inscr_date'),
+        ),
+        migrations.AddIndex(
+            model_name='consommation',
+            index=models.Index(fields=['individu', 'date'], name='consommations_individu_date'),
+        ),
+        migrations.AddIndex(
+            model_name='deduction',
+            index=models.Index(fields=['famille', 'date'], name='deductions_famille_date'),
+        ),
+        migrations.AddIndex(
+            model_name='memojournee',
+            index=models.Index(fields=['inscription', 'date'], name='memo_journee_inscr_date'),
+        ),
+        migrations.AddIndex(
+            model_name='ouverture',
+            index=models.Index(fields=['activite', 'date'], name='ouvertures_activite_date'),
+        ),
+        migrations.AddIndex(
+            model_name='prestation',
+            index=models.Index(fields=['famille', 'date'], name='prestations_famille_date'),
+        ),
+        migrations.AddIndex(
+            model_name='prestation',
+            index=models.Index(fields=['activite', 'date'], name='prestations_activite_date'),
+        ),
+        migrations.AddIndex(
+            model_name='prestation',
+            index=models.Index(fields=['facture', 'date'], name='prestations_facture_date'),
+        ),
+        migrations.AddIndex(
+            model_name='remplissage',
+            index=models.Index(fields=['activite', 'date'], name='remplissage_activite_date'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 3.2.19 on 2026-10-18 10:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Q, Sum, Case, When, F, IntegerField
+
+
+def initialiser_places_prises(apps, schema_editor):
+    """ Calcul des places prises à partir des consommations existantes """
+    Consommation = apps.get_model('core', 'Consommation')
+    PlacesPrises = apps.get_model('core', 'PlacesPrises')
+    quantite = Case(When(Q(quantite__isnull=True) | Q(quantite=0), then=1), default=F("quantite"), output_field=IntegerField())
+    liste_places = Consommation.objects.filter(etat__in=("reservation", "present", "attente"), activite__isnull=False, date__isnull=False, unite__isnull=False).values("activite", "date", "unite", "groupe", "evenement").annotate(places=Sum(quantite))
+    liste_ajouts = []
+    for p in liste_places.iterator():
+        liste_ajouts.append(PlacesPrises(activite_id=p["activite"], date=p["date"], unite_id=p["unite"], groupe_id=p["groupe"], evenement_id=p["evenement"], places=p["places"]))
+        if len(liste_ajouts) >= 5000:
+            PlacesPrises.objects.bulk_create(liste_ajouts, batch_size=500)
+            liste_ajouts = []
+    PlacesPrises.objects.bulk_create(liste_ajouts, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0237_index_tables_principales'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlacesPrises',
+            fields=[
+                ('idplaces', models.AutoField(db_column='IDplaces', primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Date')),
+                ('places', models.IntegerField(default=0, verbose_name='Places prises')),
+                ('activite', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.activite', verbose_name='Activité')),
+                ('evenement', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='core.evenement', verbose_name='Evénement')),
+                ('groupe', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='core.groupe', verbose_name='Groupe')),
+                ('unite', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.unite', verbose_name='Unité de consommation')),
+            ],
+            options={
+                'verbose_name': 'places prises',
+                'verbose_name_plural': 'places prises',
+                'db_table': 'places_prises',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='placesprises',
+            index=models.Index(fields=['activite', 'date'], name='places_prises_activite_date'),
+        ),
+        migrations.RunPython(initialiser_places_prises, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.2.19 on 2026-10-18 11:10
+
+from django.db import migrations, models
+from django.db.models import Q, Sum, Case, When, F, IntegerField
+
+
+def initialiser_places_attente(apps, schema_editor):
+    """ Calcul des places en attente à partir des consommations existantes """
+    Consommation = apps.get_model('core', 'Consommation')
+    PlacesPrises = apps.get_model('core', 'PlacesPrises')
+    quantite = Case(When(Q(quantite__isnull=True) | Q(quantite=0), then=1), default=F("quantite"), output_field=IntegerField())
+    liste_places = Consommation.objects.filter(etat="attente", activite__isnull=False, date__isnull=False, unite__isnull=False).values("activite", "date", "unite", "groupe", "evenement").annotate(attente=Sum(quantite))
+    for p in liste_places.iterator():
+        PlacesPrises.objects.filter(activite_id=p["activite"], date=p["date"], unite_id=p["unite"], groupe_id=p["groupe"], evenement_id=p["evenement"]).update(attente=p["attente"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0238_placesprises'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='placesprises',
+            name='attente',
+            field=models.IntegerField(default=0, verbose_name='Places en attente'),
+        ),
+        migrations.RunPython(initialiser_places_attente, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 3.2.19 on 2026-10-18 11:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0239_placesprises_attente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FamilleCompletude',
+            fields=[
+                ('idcompletude', models.AutoField(db_column='IDcompletude', primary_key=True, serialize=False, verbose_name='ID')),
+                ('nbre_pieces', models.IntegerField(default=0, verbose_name='Pièces manquantes')),
+                ('nbre_cotisations', models.IntegerField(default=0, verbose_name='Adhésions manquantes')),
+                ('nbre_questionnaires', models.IntegerField(default=0, verbose_name='Questionnaires manquants')),
+                ('nbre_sondages', models.IntegerField(default=0, verbose_name='Sondages manquants')),
+                ('nbre_renseignements', models.IntegerField(default=0, verbose_name='Renseignements manquants')),
+                ('idrattachement_renseignements', models.IntegerField(blank=True, null=True, verbose_name='ID du premier rattachement aux renseignements incomplets')),
+                ('page_renseignements', models.CharField(blank=True, max_length=50, null=True, verbose_name='Page des renseignements à compléter')),
+                ('idrattachement_questionnaires', models.IntegerField(blank=True, null=True, verbose_name='ID du premier rattachement aux questionnaires incomplets')),
+                ('date_calcul', models.DateField(blank=True, null=True, verbose_name='Date du calcul')),
+                ('a_jour', models.BooleanField(default=False, verbose_name='A jour')),
+                ('famille', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='completude', to='core.famille', verbose_name='Famille')),
+            ],
+            options={
+                'verbose_name': 'complétude du dossier famille',
+                'verbose_name_plural': 'complétudes des dossiers familles',
+                'db_table': 'familles_completude',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='famillecompletude',
+            index=models.Index(fields=['a_jour', 'date_calcul'], name='familles_co_a_jour_601e82_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.19 on 2026-10-18 11:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0240_famillecompletude'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='empreinte',
+            field=models.CharField(blank=True, max_length=40, null=True, verbose_name='Empreinte'),
+        ),
+    ]
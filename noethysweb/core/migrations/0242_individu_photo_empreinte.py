@@ -0,0 +1,18 @@
+# Generated by Django 3.2.19 on 2026-10-18 15:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0241_photo_empreinte'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='individu',
+            name='photo_empreinte',
+            field=models.CharField(blank=True, max_length=40, null=True, verbose_name='Empreinte de la photo'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.19 on 2026-10-18 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0242_individu_photo_empreinte'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='famillecompletude',
+            name='version',
+            field=models.IntegerField(default=0, verbose_name='Version'),
+        ),
+    ]
@@ -26,7 +26,7 @@ from core.data.data_modeles_impressions import (
 )
 from core.data.data_modeles_sms import CATEGORIES as CATEGORIES_MODELES_SMS
 from core.data.data_modeles_word import CATEGORIES as CATEGORIES_MODELES_WORD
-from core.utils import utils_dates, utils_permissions, utils_texte
+from core.utils import utils_dates, utils_miniatures, utils_permissions, utils_texte
 from individus.utils.utils_transports import Get_liste_choix_categories
 
 CATEGORIES_TRANSPORTS = Get_liste_choix_categories()
@@ -1737,6 +1737,9 @@ class Ouverture(models.Model):
         db_table = 'ouvertures'
         verbose_name = "ouverture"
         verbose_name_plural = "ouvertures"
+        indexes = [
+            models.Index(fields=["activite", "date"], name="ouvertures_activite_date"),
+        ]
 
     def __str__(self):
         return "Ouverture ID%d" % self.idouverture
@@ -1754,6 +1757,9 @@ class Remplissage(models.Model):
         db_table = 'remplissage'
         verbose_name = "remplissage"
         verbose_name_plural = "remplissages"
+        indexes = [
+            models.Index(fields=["activite", "date"], name="remplissage_activite_date"),
+        ]
 
     def __str__(self):
         return "Remplissage ID%d" % self.idremplissage if self.idremplissage else "Nouveau"
@@ -1797,6 +1803,7 @@ class Individu(models.Model):
     tel_mobile_sms = models.BooleanField(verbose_name="Autoriser l'envoi de SMS vers le téléphone portable", default=False)
     etat = models.CharField(verbose_name="Etat", max_length=50, blank=True, null=True)
     photo = ResizedImageField(verbose_name=_("Photo"), upload_to=get_uuid_path, blank=True, null=True)
+    photo_empreinte = models.CharField(verbose_name="Empreinte de la photo", max_length=40, blank=True, null=True)
     listes_diffusion = models.ManyToManyField(ListeDiffusion, blank=True, related_name="individu_listes_diffusion")
     regimes_alimentaires = models.ManyToManyField(RegimeAlimentaire, verbose_name=_("Régimes alimentaires"), related_name="individu_regimes_alimentaires", blank=True)
     maladies = models.ManyToManyField(TypeMaladie, verbose_name=_("Maladies contractées"), related_name="individu_maladies", blank=True)
@@ -1886,6 +1893,25 @@ class Individu(models.Model):
         else:
             return settings.STATIC_ROOT + "/images/" + dict_civilite["image"]
 
+    def Generer_miniature_photo(self):
+        """ Génère l'avatar de la photo et mémorise son empreinte (aucun accès au stockage si la photo n'a pas changé) """
+        empreinte = utils_miniatures.Get_empreinte_nom(self.photo.name) if self.photo else None
+        if empreinte == self.photo_empreinte:
+            return empreinte
+        if empreinte:
+            empreinte = utils_miniatures.Generer(self.photo, largeurs=[utils_miniatures.LARGEUR_AVATAR], empreinte=empreinte)
+        Individu.objects.filter(pk=self.pk).update(photo_empreinte=empreinte)
+        self.photo_empreinte = empreinte
+        return empreinte
+
+    def Get_photo_miniature(self):
+        """ Renvoie l'URL de la photo réduite à la taille d'un avatar ou de l'original si l'avatar n'a pas encore été généré """
+        if self.photo:
+            if self.photo_empreinte and self.photo_empreinte == utils_miniatures.Get_empreinte_nom(self.photo.name):
+                return utils_miniatures.Get_url(self.photo, self.photo_empreinte, utils_miniatures.LARGEUR_AVATAR)
+            return self.photo.url
+        return self.Get_photo()
+
     def Get_sexe(self):
         dict_civilite = data_civilites.GetCiviliteForIndividu(self)
         return dict_civilite["sexe"]
@@ -2435,6 +2461,11 @@ class Prestation(models.Model):
         db_table = 'prestations'
         verbose_name = "prestation"
         verbose_name_plural = "prestations"
+        indexes = [
+            models.Index(fields=["famille", "date"], name="prestations_famille_date"),
+            models.Index(fields=["activite", "date"], name="prestations_activite_date"),
+            models.Index(fields=["facture", "date"], name="prestations_facture_date"),
+        ]
 
     def __str__(self):
         return "Prestation ID%d : %s" % (self.idprestation, self.label)
@@ -2470,11 +2501,38 @@ class Consommation(models.Model):
         db_table = 'consommations'
         verbose_name = "consommation"
         verbose_name_plural = "consommations"
+        indexes = [
+            models.Index(fields=["activite", "date"], name="consommations_activite_date"),
+            models.Index(fields=["inscription", "date"], name="consommations_inscr_date"),
+            models.Index(fields=["individu", "date"], name="consommations_individu_date"),
+        ]
 
     def __str__(self):
         return "Consommation ID%d" % self.idconso if self.idconso else "Nouveau"
 
 
+class PlacesPrises(models.Model):
+    idplaces = models.AutoField(verbose_name="ID", db_column='IDplaces', primary_key=True)
+    activite = models.ForeignKey(Activite, verbose_name="Activité", on_delete=models.CASCADE)
+    date = models.DateField(verbose_name="Date")
+    unite = models.ForeignKey(Unite, verbose_name="Unité de consommation", on_delete=models.CASCADE)
+    groupe = models.ForeignKey(Groupe, verbose_name="Groupe", blank=True, null=True, on_delete=models.CASCADE)
+    evenement = models.ForeignKey(Evenement, verbose_name="Evénement", blank=True, null=True, on_delete=models.CASCADE)
+    places = models.IntegerField(verbose_name="Places prises", default=0)
+    attente = models.IntegerField(verbose_name="Places en attente", default=0)
+
+    class Meta:
+        db_table = 'places_prises'
+        verbose_name = "places prises"
+        verbose_name_plural = "places prises"
+        indexes = [
+            models.Index(fields=["activite", "date"], name="places_prises_activite_date"),
+        ]
+
+    def __str__(self):
+        return "Places prises ID%d" % self.idplaces if self.idplaces else "Nouveau"
+
+
 class PaiementTpe(models.Model):
     STATUT_ATTENTE = "ATTENTE"
     STATUT_SUCCES = "SUCCES"
@@ -2652,6 +2710,9 @@ class Deduction(models.Model):
         db_table = 'deductions'
         verbose_name = "déduction"
         verbose_name_plural = "déductions"
+        indexes = [
+            models.Index(fields=["famille", "date"], name="deductions_famille_date"),
+        ]
 
     def __str__(self):
         return "Déduction ID%d" % self.iddeduction
@@ -2772,6 +2833,9 @@ class MemoJournee(models.Model):
         db_table = 'memo_journee'
         verbose_name = "mémo journalier"
         verbose_name_plural = "mémos journaliers"
+        indexes = [
+            models.Index(fields=["inscription", "date"], name="memo_journee_inscr_date"),
+        ]
 
     def __str__(self):
         return "MemoJournee ID%d" % self.idmemo
@@ -3280,6 +3344,42 @@ class Mail(models.Model):
         super().delete(*args, **kwargs)
 
 
+class TacheEnvoiMail(models.Model):
+    idtache = models.AutoField(verbose_name="ID", db_column='IDtache', primary_key=True)
+    mail = models.ForeignKey(Mail, verbose_name="Email", on_delete=models.CASCADE)
+    utilisateur = models.ForeignKey(Utilisateur, verbose_name="Utilisateur", blank=True, null=True, on_delete=models.SET_NULL)
+    statut = models.CharField(verbose_name="Statut", max_length=50, choices=[
+        ("attente", "En attente"), ("en_cours", "En cours"), ("termine", "Terminé"), ("erreur", "Erreur"), ("annule", "Annulé")], default="attente")
+    destinataires = models.TextField(verbose_name="Destinataires", blank=True, null=True)
+    url_base = models.CharField(verbose_name="URL de base", max_length=400, blank=True, null=True)
+    url_portail = models.CharField(verbose_name="URL du portail", max_length=400, blank=True, null=True)
+    nbre_total = models.IntegerField(verbose_name="Nombre total", default=0)
+    nbre_traites = models.IntegerField(verbose_name="Nombre traités", default=0)
+    nbre_succes = models.IntegerField(verbose_name="Nombre de succès", default=0)
+    nbre_echecs = models.IntegerField(verbose_name="Nombre d'échecs", default=0)
+    tentatives = models.IntegerField(verbose_name="Tentatives", default=0)
+    date_creation = models.DateTimeField(verbose_name="Date de création", auto_now_add=True)
+    date_debut = models.DateTimeField(verbose_name="Date de début", blank=True, null=True)
+    date_fin = models.DateTimeField(verbose_name="Date de fin", blank=True, null=True)
+    date_maj = models.DateTimeField(verbose_name="Date de mise à jour", blank=True, null=True)
+    date_prochaine_tentative = models.DateTimeField(verbose_name="Date de la prochaine tentative", blank=True, null=True)
+    erreur = models.TextField(verbose_name="Erreur", blank=True, null=True)
+
+    class Meta:
+        db_table = 'taches_envoi_mail'
+        verbose_name = "tâche d'envoi d'emails"
+        verbose_name_plural = "tâches d'envoi d'emails"
+
+    def __str__(self):
+        return "Tâche d'envoi ID%d" % self.idtache if self.idtache else "Nouvelle tâche d'envoi"
+
+    def Get_progression(self):
+        """ Renvoie le pourcentage d'avancement de l'envoi """
+        if not self.nbre_total:
+            return 100
+        return int(100 * self.nbre_traites / self.nbre_total)
+
+
 class PortailPeriode(models.Model):
     idperiode = models.AutoField(verbose_name='ID', db_column='IDperiode', primary_key=True)
     activite = models.ForeignKey(Activite, verbose_name="Activité", on_delete=models.CASCADE)
@@ -3405,6 +3505,54 @@ class PortailMessage(models.Model):
         return "Message ID%d" % self.idmessage if self.idmessage else "Nouveau message"
 
 
+class PortailConversation(models.Model):
+    idconversation = models.AutoField(verbose_name="ID", db_column='IDconversation', primary_key=True)
+    famille = models.ForeignKey(Famille, verbose_name="Famille", on_delete=models.CASCADE)
+    structure = models.ForeignKey(Structure, verbose_name="Structure", on_delete=models.CASCADE)
+    dernier_message = models.ForeignKey(PortailMessage, verbose_name="Dernier message", related_name="+", blank=True, null=True, on_delete=models.SET_NULL)
+    dernier_message_non_lu = models.ForeignKey(PortailMessage, verbose_name="Dernier message non lu", related_name="+", blank=True, null=True, on_delete=models.SET_NULL)
+    date_dernier_message = models.DateTimeField(verbose_name="Date du dernier message", blank=True, null=True)
+    nbre_non_lus = models.IntegerField(verbose_name="Nombre de messages non lus", default=0)
+
+    class Meta:
+        db_table = 'portail_conversations'
+        verbose_name = "conversation"
+        verbose_name_plural = "conversations"
+        unique_together = ("famille", "structure")
+        indexes = [models.Index(fields=["structure", "nbre_non_lus"])]
+
+    def __str__(self):
+        return "Conversation ID%d" % self.idconversation if self.idconversation else "Nouvelle conversation"
+
+
+class FamilleCompletude(models.Model):
+    idcompletude = models.AutoField(verbose_name="ID", db_column='IDcompletude', primary_key=True)
+    famille = models.OneToOneField(Famille, verbose_name="Famille", related_name="completude", on_delete=models.CASCADE)
+    nbre_pieces = models.IntegerField(verbose_name="Pièces manquantes", default=0)
+    nbre_cotisations = models.IntegerField(verbose_name="Adhésions manquantes", default=0)
+    nbre_questionnaires = models.IntegerField(verbose_name="Questionnaires manquants", default=0)
+    nbre_sondages = models.IntegerField(verbose_name="Sondages manquants", default=0)
+    nbre_renseignements = models.IntegerField(verbose_name="Renseignements manquants", default=0)
+    idrattachement_renseignements = models.IntegerField(verbose_name="ID du premier rattachement aux renseignements incomplets", blank=True, null=True)
+    page_renseignements = models.CharField(verbose_name="Page des renseignements à compléter", max_length=50, blank=True, null=True)
+    idrattachement_questionnaires = models.IntegerField(verbose_name="ID du premier rattachement aux questionnaires incomplets", blank=True, null=True)
+    date_calcul = models.DateField(verbose_name="Date du calcul", blank=True, null=True)
+    a_jour = models.BooleanField(verbose_name="A jour", default=False)
+    version = models.IntegerField(verbose_name="Version", default=0)
+
+    class Meta:
+        db_table = 'familles_completude'
+        verbose_name = "complétude du dossier famille"
+        verbose_name_plural = "complétudes des dossiers familles"
+        indexes = [models.Index(fields=["a_jour", "date_calcul"])]
+
+    def __str__(self):
+        return "Complétude famille ID%d" % self.famille_id
+
+    def Get_nbre_manquants(self):
+        return self.nbre_pieces + self.nbre_cotisations + self.nbre_questionnaires + self.nbre_sondages + self.nbre_renseignements
+
+
 class ContactUrgence(models.Model):
     idcontact = models.AutoField(verbose_name="ID", db_column='IDcontact', primary_key=True)
     nom = models.CharField(verbose_name=_("Nom"), max_length=200)
@@ -3658,6 +3806,7 @@ class Photo(models.Model):
     fichier = models.FileField(verbose_name="Fichier", storage=get_storage("photo"), upload_to=get_uuid_path)
     titre = models.CharField(verbose_name="Titre de la photo", max_length=300, blank=True, null=True, help_text="Le titre est visible pour les familles sur le portail.")
     date_creation = models.DateTimeField(verbose_name="Date de création", blank=True, null=True, help_text="Cette date est utilisée pour trier les photos.")
+    empreinte = models.CharField(verbose_name="Empreinte", max_length=40, blank=True, null=True)
 
     class Meta:
         db_table = 'photos'
@@ -3670,6 +3819,24 @@ class Photo(models.Model):
     def get_upload_path(self):
         return str(self.album_id)
 
+    def Generer_miniatures(self):
+        """ Génère les miniatures WebP de la photo et mémorise l'empreinte de son contenu """
+        empreinte = utils_miniatures.Generer(self.fichier)
+        if empreinte != self.empreinte:
+            Photo.objects.filter(pk=self.pk).update(empreinte=empreinte)
+            self.empreinte = empreinte
+        return empreinte
+
+    def Get_url_miniature(self, largeur=utils_miniatures.LARGEURS[0]):
+        """ Renvoie l'URL d'une miniature ou de l'original si les miniatures n'ont pas encore été générées """
+        return utils_miniatures.Get_url(self.fichier, self.empreinte, largeur) if self.empreinte else self.fichier.url
+
+    def Get_url_apercu(self):
+        return self.Get_url_miniature(largeur=utils_miniatures.LARGEURS[-1])
+
+    def Get_srcset(self):
+        return utils_miniatures.Get_srcset(self.fichier, self.empreinte) if self.empreinte else ""
+
 
 class ImageArticle(models.Model):
     idimage = models.AutoField(verbose_name="ID", db_column='IDimage', primary_key=True)
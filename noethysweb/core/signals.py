@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2019-2021 Ivan LUCAS.
+#  Noethysweb, application de gestion multi-activités.
+#  Distribué sous licence GNU GPL.
+
+from django.contrib.auth.models import Group
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from core.models import Utilisateur, Organisateur, Parametre, Activite, Unite, Groupe, Tarif, Vacance, PortailParametre, PortailChamp, PortailMessage, \
+                        Structure, Famille, Individu, Rattachement, Inscription, Piece, TypePiece, Cotisation, TypeCotisation, \
+                        QuestionnaireQuestion, QuestionnaireReponse, Sondage, SondageRepondant, Photo
+from core.utils import utils_cache, utils_conversations, utils_completude, utils_sqlite
+
+
+@receiver(connection_created)
+def Configurer_connexion(sender, connection, **kwargs):
+    utils_sqlite.Configurer_connexion(connection)
+
+
+@receiver([post_save, post_delete], sender=Organisateur)
+def Invalider_organisateur(sender, instance, **kwargs):
+    utils_cache.Invalider("organisateur")
+
+
+@receiver([post_save, post_delete], sender=Utilisateur)
+def Invalider_menus_utilisateur(sender, instance, **kwargs):
+    # Les enregistrements partiels (date de dernière connexion...) ne modifient pas les permissions
+    update_fields = kwargs.get("update_fields", None)
+    if instance.categorie == "utilisateur" and not (update_fields and not {"is_superuser", "is_active"}.intersection(update_fields)):
+        utils_cache.Invalider_categorie("menus")
+
+
+@receiver([post_save, post_delete], sender=Group)
+@receiver(m2m_changed, sender=Utilisateur.user_permissions.through)
+@receiver(m2m_changed, sender=Utilisateur.groups.through)
+@receiver(m2m_changed, sender=Group.permissions.through)
+def Invalider_menus(sender, instance, **kwargs):
+    # Les menus mémorisés dépendent des permissions des utilisateurs
+    if kwargs.get("action", "post_").startswith("post_"):
+        utils_cache.Invalider_categorie("menus")
+
+
+@receiver([post_save, post_delete], sender=Parametre)
+def Invalider_parametre(sender, instance, **kwargs):
+    if instance.categorie == "options_interface" and instance.utilisateur_id:
+        utils_cache.Invalider("options_interface_user%d" % instance.utilisateur_id)
+
+
+@receiver([post_save, post_delete], sender=PortailParametre)
+def Invalider_parametres_portail(sender, instance, **kwargs):
+    utils_cache.Invalider("parametres_portail")
+
+
+@receiver([post_save, post_delete], sender=PortailChamp)
+def Invalider_champs_portail(sender, instance, **kwargs):
+    utils_cache.Invalider("parametres_portail_champs")
+
+
+@receiver([post_save, post_delete], sender=Activite)
+@receiver([post_save, post_delete], sender=Unite)
+@receiver([post_save, post_delete], sender=Groupe)
+@receiver([post_save, post_delete], sender=Tarif)
+@receiver([post_save, post_delete], sender=Vacance)
+def Invalider_reference(sender, instance, **kwargs):
+    # La suppression d'une activité supprime aussi ses unités, groupes et tarifs, qui invalident leur propre catégorie
+    categories = {Activite: "activites", Unite: "unites", Groupe: "groupes", Tarif: "tarifs", Vacance: "vacances"}
+    utils_cache.Invalider_categorie(categories[sender])
+
+
+@receiver([post_save, post_delete], sender=PortailMessage)
+def Actualiser_conversation(sender, instance, **kwargs):
+    utils_conversations.Actualiser_conversation(idfamille=instance.famille_id, idstructure=instance.structure_id)
+
+
+@receiver([post_save, post_delete], sender=Piece)
+@receiver([post_save, post_delete], sender=Cotisation)
+@receiver([post_save, post_delete], sender=QuestionnaireReponse)
+@receiver([post_save, post_delete], sender=SondageRepondant)
+def Invalider_completude_document(sender, instance, **kwargs):
+    # Un document individuel concerne toutes les familles de l'individu
+    utils_completude.Invalider([instance.famille_id])
+    utils_completude.Invalider_individus([instance.individu_id])
+
+
+@receiver([post_save, post_delete], sender=Inscription)
+@receiver([post_save, post_delete], sender=Rattachement)
+def Invalider_completude_famille(sender, instance, **kwargs):
+    utils_completude.Invalider([instance.famille_id])
+
+
+@receiver([post_save, post_delete], sender=Individu)
+def Invalider_completude_individu(sender, instance, **kwargs):
+    utils_completude.Invalider_individus([instance.pk])
+
+
+@receiver(m2m_changed, sender=Famille.individus_masques.through)
+def Invalider_completude_individus_masques(sender, instance, **kwargs):
+    # Depuis l'individu (reverse), pk_set contient les familles concernées
+    if kwargs.get("action", "post_").startswith("post_"):
+        utils_completude.Invalider((kwargs.get("pk_set", None) or []) if kwargs.get("reverse", False) else [instance.pk])
+
+
+@receiver([post_save, post_delete], sender=Structure)
+@receiver([post_save, post_delete], sender=Activite)
+@receiver([post_save, post_delete], sender=TypePiece)
+@receiver([post_save, post_delete], sender=TypeCotisation)
+@receiver([post_save, post_delete], sender=QuestionnaireQuestion)
+@receiver([post_save, post_delete], sender=Sondage)
+@receiver(m2m_changed, sender=Activite.pieces.through)
+@receiver(m2m_changed, sender=Activite.cotisations.through)
+def Invalider_completude_parametrage(sender, instance, **kwargs):
+    # Le paramétrage des pièces, adhésions, questionnaires ou sondages concerne toutes les familles
+    if kwargs.get("action", "post_").startswith("post_"):
+        utils_completude.Invalider_tout()
+
+
+@receiver(post_save, sender=Photo)
+def Generer_miniatures_photo(sender, instance, **kwargs):
+    # Les miniatures existantes ne sont pas recalculées : seule l'empreinte du fichier est vérifiée
+    if instance.fichier and not kwargs.get("raw", False):
+        instance.Generer_miniatures()
+
+
+@receiver(post_save, sender=Individu)
+def Generer_miniature_photo_individu(sender, instance, **kwargs):
+    # L'avatar est généré à l'enregistrement de la photo et non au premier affichage
+    if not kwargs.get("raw", False):
+        instance.Generer_miniature_photo()
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2019-2021 Ivan LUCAS.
+#  Noethysweb, application de gestion multi-activités.
+#  Distribué sous licence GNU GPL.
+
+import logging, datetime, json, time, threading, socketserver
+logger = logging.getLogger(__name__)
+from django.db import connection, transaction
+from core.models import AdresseMail, Mail, Destinataire
+from core.utils import utils_cache, utils_fake_data
+
+# Nombre d'inscriptions ouvertes dans la grille, de factures imprimées, etc.
+TAILLE_ECHANTILLON = 10
+
+
+class Gestionnaire_smtp(socketserver.StreamRequestHandler):
+    """ Dialogue SMTP minimal : accepte tous les messages sans les transmettre """
+    def Repondre(self, texte=""):
+        self.wfile.write(("%s\r\n" % texte).encode())
+
+    def handle(self):
+        self.Repondre("220 localhost")
+        while True:
+            ligne = self.rfile.readline()
+            if not ligne:
+                return
+            commande = ligne.decode(errors="ignore").strip().upper()
+            if commande.startswith("EHLO"):
+                self.Repondre("250-localhost\r\n250 OK")
+            elif commande.startswith("DATA"):
+                self.Repondre("354 Fin des données par <CRLF>.<CRLF>")
+                while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                    pass
+                with self.server.verrou:
+                    self.server.nbre_messages += 1
+                self.Repondre("250 OK")
+            elif commande.startswith("QUIT"):
+                self.Repondre("221 Bye")
+                return
+            else:
+                self.Repondre("250 OK")
+
+
+class Serveur_smtp():
+    """ Serveur SMTP local remplaçant la messagerie pendant les mesures """
+    def __init__(self):
+        self.serveur = socketserver.ThreadingTCPServer(("127.0.0.1", 0), Gestionnaire_smtp)
+        self.serveur.daemon_threads = True
+        self.serveur.verrou = threading.Lock()
+        self.serveur.nbre_messages = 0
+        self.port = self.serveur.server_address[1]
+
+    def __enter__(self):
+        threading.Thread(target=self.serveur.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.serveur.shutdown()
+        self.serveur.server_close()
+
+    def Get_nbre_messages(self):
+        return self.serveur.nbre_messages
+
+
+def Mesurer(label="", fonction=None, *args, **kwargs):
+    """ Exécute une fonction et renvoie la mesure {label, duree, requetes} et le résultat de la fonction """
+    compteur = {"requetes": 0}
+
+    def Compter(execute, sql, params, many, context):
+        compteur["requetes"] += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(Compter):
+        chrono = time.perf_counter()
+        resultat = fonction(*args, **kwargs)
+        duree = time.perf_counter() - chrono
+    logger.debug("Benchmark : %s en %.3fs (%d requêtes)" % (label, duree, compteur["requetes"]))
+    return {"label": label, "duree": round(duree, 4), "requetes": compteur["requetes"]}, resultat
+
+
+# ------------------------------- Scénarios ---------------------------------
+
+def Get_periode_grille(donnees={}):
+    """ Mois de septembre du jeu de données : non facturé et avec des réservations """
+    annee = donnees["date_debut"].year
+    return datetime.date(annee, 9, 1), datetime.date(annee, 9, 30)
+
+
+def Ouvrir_grilles(donnees={}):
+    from consommations.utils.utils_grille_virtuelle import Grille_virtuelle
+    date_min, date_max = Get_periode_grille(donnees)
+    return [Grille_virtuelle(idfamille=inscription.famille_id, idindividu=inscription.individu_id, idactivite=inscription.activite_id, date_min=date_min, date_max=date_max)
+            for inscription in donnees["inscriptions"][:TAILLE_ECHANTILLON]]
+
+
+def Scenario_grille_ouverture(donnees={}):
+    donnees["grilles"] = Ouvrir_grilles(donnees)
+
+
+def Scenario_grille_enregistrement(donnees={}):
+    for grille in donnees.get("grilles") or Ouvrir_grilles(donnees):
+        grille.Ajouter(criteres={"unite": donnees["unites"][0].pk}, parametres={"etat": "reservation"})
+        grille.Enregistrer()
+
+
+def Scenario_facturation(donnees={}):
+    from facturation.utils import utils_facturation
+    annee = donnees["date_debut"].year
+    return utils_facturation.Facturation().GetDonnees(liste_activites=[donnees["activite"].pk], date_debut=datetime.date(annee, 7, 1), date_fin=donnees["date_fin"],
+                                                     date_edition=donnees["date_fin"], date_echeance=donnees["date_fin"])
+
+
+def Scenario_recalcul(donnees={}):
+    from facturation.utils import utils_recalculer_prestations
+    date_debut, date_fin = Get_periode_grille(donnees)
+    # Un seul processus : les processus fils ne verraient pas les données de la transaction en cours
+    return utils_recalculer_prestations.Recalculer(date_debut=date_debut, date_fin=date_fin, idactivite=donnees["activite"].pk, nbre_processus=1)
+
+
+def Scenario_factures_pdf(donnees={}, mode_email=False):
+    from facturation.utils import utils_facturation
+    dict_options = json.loads(donnees["modele_impression"].options)
+    dict_options["modele"] = donnees["modele_impression"].modele_document
+    return utils_facturation.Facturation().Impression(liste_factures=[facture.pk for facture in donnees["factures"][:TAILLE_ECHANTILLON]], dict_options=dict_options, mode_email=mode_email)
+
+
+def Scenario_factures_pdf_email(donnees={}):
+    # Un PDF par facture comme pour l'envoi par email (dans un seul processus : le benchmark s'exécute dans une transaction)
+    return Scenario_factures_pdf(donnees, mode_email=True)
+
+
+def Scenario_emails(donnees={}):
+    from outils.utils import utils_email
+    with Serveur_smtp() as serveur:
+        adresse_exp = AdresseMail.objects.create(adresse="benchmark@example.com", moteur="smtp", hote="127.0.0.1", port=serveur.port, lien_desinscription=False)
+        mail = Mail.objects.create(objet="Information {ORGANISATEUR_NOM}", html="<p>Bonjour,</p><p>Ceci est un message de test envoyé le {DATE_LONGUE}.</p>", adresse_exp=adresse_exp, selection="NON_ENVOYE")
+        destinataires = Destinataire.objects.bulk_create([Destinataire(categorie="famille", famille=famille, adresse=famille.mail) for famille in donnees["familles"]])
+        mail.destinataires.set(Destinataire.objects.filter(famille__in=donnees["familles"], categorie="famille"))
+        utils_email.Envoyer_model_mail(idmail=mail.pk)
+        if serveur.Get_nbre_messages() != len(destinataires):
+            logger.warning("Benchmark : %d emails reçus sur %d envoyés." % (serveur.Get_nbre_messages(), len(destinataires)))
+
+
+def Scenario_statistiques(donnees={}):
+    from outils.views.statistiques import View
+    # Les statistiques sont recalculées sans tenir compte du cache
+    utils_cache.Invalider_categorie("statistiques")
+    for rubrique in ("individus_nombre", "individus_age", "familles_nombre", "familles_qf"):
+        View().Get_data(parametres={"rubrique": rubrique, "activites": json.dumps({"type": "activites", "ids": [donnees["activite"].pk]}), "donnees": "ANNEE",
+                                    "annee": donnees["date_debut"].year, "etats": ["reservation", "present"], "tranches_qf": "0-500;501-1000;1001-99999"})
+
+
+SCENARIOS = [
+    ("grille_ouverture", "Grille : ouverture", Scenario_grille_ouverture),
+    ("grille_enregistrement", "Grille : enregistrement", Scenario_grille_enregistrement),
+    ("facturation", "Facturation : recherche des factures", Scenario_facturation),
+    ("recalcul", "Facturation : recalcul des prestations", Scenario_recalcul),
+    ("factures_pdf", "Facturation : impression des factures", Scenario_factures_pdf),
+    ("factures_pdf_email", "Facturation : PDF des factures à l'unité", Scenario_factures_pdf_email),
+    ("emails", "Emails : envoi groupé", Scenario_emails),
+    ("statistiques", "Statistiques", Scenario_statistiques),
+]
+
+
+def Executer(nbre_familles=100, nbre_enfants=2, scenarios=[], conserver=False):
+    """ Génère un jeu de données et mesure les scénarios. Tout est annulé à la fin sauf si conserver=True """
+    resultats = []
+    with transaction.atomic():
+        mesure, donnees = Mesurer("Génération du jeu de données", utils_fake_data.Generer_donnees, nbre_familles=nbre_familles, nbre_enfants=nbre_enfants)
+        resultats.append(dict(mesure, code="generation"))
+        for code, label, fonction in SCENARIOS:
+            if scenarios and code not in scenarios:
+                continue
+            mesure = Mesurer(label, fonction, donnees)[0]
+            resultats.append(dict(mesure, code=code))
+        if not conserver:
+            transaction.set_rollback(True)
+    return resultats
+
+
+def Comparer(resultats=[], reference=[]):
+    """ Ajoute à chaque mesure l'écart en % avec une mesure de référence de même code """
+    dict_reference = {mesure["code"]: mesure for mesure in reference}
+    for mesure in resultats:
+        mesure_reference = dict_reference.get(mesure["code"], None)
+        if mesure_reference and mesure_reference["duree"]:
+            mesure["ecart_duree"] = round((mesure["duree"] - mesure_reference["duree"]) * 100 / mesure_reference["duree"], 1)
+            mesure["ecart_requetes"] = mesure["requetes"] - mesure_reference["requetes"]
+    return resultats
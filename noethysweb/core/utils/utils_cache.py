@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2019-2021 Ivan LUCAS.
+#  Noethysweb, application de gestion multi-activités.
+#  Distribué sous licence GNU GPL.
+
+import logging, uuid
+logger = logging.getLogger(__name__)
+from django.core.cache import cache
+
+# Permet de distinguer une clé absente d'une valeur None mémorisée
+ABSENT = object()
+
+
+def Get(cle="", fonction=None, timeout=None):
+    """ Renvoie la valeur mémorisée dans le cache partagé ou la calcule avec la fonction donnée """
+    valeur = cache.get(cle, ABSENT)
+    if valeur is ABSENT:
+        valeur = fonction()
+        if timeout is None:
+            cache.set(cle, valeur)
+        else:
+            cache.set(cle, valeur, timeout)
+    return valeur
+
+
+def Invalider(*cles):
+    """ Supprime une ou plusieurs clés du cache partagé """
+    cache.delete_many(cles)
+
+
+def Get_version(categorie=""):
+    """ Renvoie le jeton de version actuel d'une catégorie de données de référence """
+    # Un jeton aléatoire plutôt qu'un compteur : si la clé est supprimée du cache (purge des entrées
+    # les plus anciennes), la nouvelle version ne peut pas coïncider avec une version déjà utilisée
+    cle = "version_reference_%s" % categorie
+    version = cache.get(cle, None)
+    if version is None:
+        version = uuid.uuid4().hex
+        # Un autre processus a pu créer la version entre-temps : c'est alors la sienne qui est conservée
+        if not cache.add(cle, version, None):
+            version = cache.get(cle, version)
+    return version
+
+
+def Invalider_categorie(categorie=""):
+    """ Change la version d'une catégorie : toutes les clés de cette catégorie deviennent obsolètes """
+    cache.set("version_reference_%s" % categorie, uuid.uuid4().hex, None)
+    logger.debug("Cache : invalidation des données de référence '%s'." % categorie)
+
+
+def Get_reference(categorie="", cle="", fonction=None, timeout=None):
+    """ Renvoie une donnée de référence mémorisée, versionnée par catégorie """
+    return Get("reference_%s_v%s_%s" % (categorie, Get_version(categorie), cle), fonction, timeout)
+
+
+def Get_organisateur():
+    """ Renvoie l'organisateur depuis le cache partagé """
+    from core.models import Organisateur
+    return Get("organisateur", lambda: Organisateur.objects.filter(pk=1).first())
+
+
+def Get_vacances(date_min=None, date_max=None):
+    """ Renvoie la liste des périodes de vacances chevauchant la période donnée """
+    from core.models import Vacance
+    liste_vacances = Get_reference("vacances", "liste", lambda: list(Vacance.objects.order_by("date_debut")))
+    return [vacance for vacance in liste_vacances if (not date_min or vacance.date_fin >= date_min) and (not date_max or vacance.date_debut <= date_max)]
+
+
+def Get_activite(idactivite=None):
+    """ Renvoie une activité depuis le cache partagé """
+    from core.models import Activite
+    return Get_reference("activites", "activite_%s" % idactivite, lambda: Activite.objects.get(pk=idactivite))
+
+
+def Get_unites():
+    """ Renvoie le dict {IDunite: unité} de toutes les unités de consommation """
+    from core.models import Unite
+    return Get_reference("unites", "toutes", lambda: {unite.pk: unite for unite in Unite.objects.all()})
+
+
+def Get_groupes(idactivite=None):
+    """ Renvoie la liste des groupes d'une activité """
+    from core.models import Groupe
+    return Get_reference("groupes", "activite_%s" % idactivite, lambda: list(Groupe.objects.filter(activite_id=idactivite).order_by("ordre")))
+
+
+def Get_tarifs_fratries(idactivite=None):
+    """ Renvoie la liste des tarifs d'une activité dépendant du nombre d'individus de la famille """
+    from core.models import Tarif
+    return Get_reference("tarifs", "fratries_%s" % idactivite, lambda: list(Tarif.objects.filter(activite_id=idactivite, methode__contains="nbre_ind")))
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2019-2021 Ivan LUCAS.
+#  Noethysweb, application de gestion multi-activités.
+#  Distribué sous licence GNU GPL.
+
+import logging, datetime
+logger = logging.getLogger(__name__)
+from django.db.models import F
+from core.models import Famille, FamilleCompletude, Rattachement
+
+
+def Calculer(famille=None):
+    """ Calcule les éléments manquants du dossier d'une famille tels qu'ils sont présentés sur le portail """
+    from individus.utils import utils_pieces_manquantes
+    from cotisations.utils import utils_cotisations_manquantes
+    from portail.utils import utils_questionnaires_manquants, utils_renseignements_manquants, utils_sondages_manquants
+
+    individus_masques = famille.individus_masques.all()
+    renseignements = utils_renseignements_manquants.Get_renseignements_manquants(famille=famille)
+    questionnaires = [data for data in utils_questionnaires_manquants.Get_questions_manquantes_famille(famille=famille).values() if data["nbre"]]
+    return {
+        "nbre_pieces": len(utils_pieces_manquantes.Get_pieces_manquantes(famille=famille, only_invalides=True, exclure_individus=individus_masques)),
+        "nbre_cotisations": len(utils_cotisations_manquantes.Get_cotisations_manquantes(famille=famille, exclure_individus=individus_masques)),
+        "nbre_questionnaires": sum(data["nbre"] for data in questionnaires),
+        "nbre_sondages": len(utils_sondages_manquants.Get_sondages_manquants(famille=famille)),
+        "nbre_renseignements": renseignements["nbre"],
+        "idrattachement_renseignements": renseignements["premier_rattachement_id"],
+        "page_renseignements": renseignements["page_cible"],
+        "idrattachement_questionnaires": questionnaires[0]["rattachement"].pk if questionnaires else None,
+    }
+
+
+def Actualiser_famille(famille=None):
+    """ Recalcule et enregistre la complétude du dossier d'une famille """
+    # La version est relevée avant le calcul : si une invalidation survient pendant le calcul, le résultat
+    # est enregistré sans être marqué à jour et sera recalculé à la prochaine lecture
+    completude, created = FamilleCompletude.objects.get_or_create(famille=famille)
+    valeurs = Calculer(famille)
+    valeurs.update({"date_calcul": datetime.date.today(), "a_jour": True})
+    if not FamilleCompletude.objects.filter(pk=completude.pk, version=completude.version).update(**valeurs):
+        valeurs["a_jour"] = False
+    for champ, valeur in valeurs.items():
+        setattr(completude, champ, valeur)
+    return completude
+
+
+def Get_completude(famille=None):
+    """ Renvoie la complétude du dossier d'une famille, recalculée uniquement si elle est obsolète """
+    # Les pièces et les adhésions arrivent à échéance : le calcul n'est valable que pour la journée
+    completude = FamilleCompletude.objects.filter(famille=famille, a_jour=True, date_calcul=datetime.date.today()).first()
+    return completude or Actualiser_famille(famille)
+
+
+def Actualiser_familles(familles=None):
+    """ Recalcule les complétudes obsolètes ou absentes de toutes les familles ou d'un queryset de familles """
+    if familles is None:
+        familles = Famille.objects.all()
+    familles_a_jour = FamilleCompletude.objects.filter(a_jour=True, date_calcul=datetime.date.today()).values("famille")
+    nbre_familles = 0
+    for famille in familles.exclude(pk__in=familles_a_jour).prefetch_related("individus_masques").iterator(chunk_size=200):
+        Actualiser_famille(famille)
+        nbre_familles += 1
+    logger.debug("Complétude des dossiers : %d familles recalculées." % nbre_familles)
+    return nbre_familles
+
+
+def Invalider(idfamilles=[]):
+    """ Signale que la complétude de certaines familles doit être recalculée """
+    idfamilles = {idfamille for idfamille in idfamilles if idfamille}
+    if idfamilles:
+        FamilleCompletude.objects.filter(famille_id__in=idfamilles).update(a_jour=False, version=F("version") + 1)
+
+
+def Invalider_individus(idindividus=[]):
+    """ Invalide la complétude des familles auxquelles des individus sont rattachés """
+    idindividus = {idindividu for idindividu in idindividus if idindividu}
+    if idindividus:
+        Invalider(Rattachement.objects.filter(individu_id__in=idindividus).values_list("famille_id", flat=True))
+
+
+def Invalider_tout():
+    """ Invalide toutes les complétudes (modification du paramétrage des pièces, adhésions, questionnaires ou sondages) """
+    FamilleCompletude.objects.update(a_jour=False, version=F("version") + 1)
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2019-2021 Ivan LUCAS.
+#  Noethysweb, application de gestion multi-activités.
+#  Distribué sous licence GNU GPL.
+
+import datetime
+from django.db.models import Max, Count, Q
+from django.utils import timezone
+from core.models import PortailMessage, PortailConversation
+
+# Nombre de jours pendant lesquels une conversation lue reste affichée
+DELAI_CONVERSATIONS_LUES = 90
+
+
+def Actualiser_conversation(idfamille=None, idstructure=None):
+    """ Recalcule le résumé d'une conversation famille/structure après la modification d'un de ses messages """
+    messages = PortailMessage.objects.filter(famille_id=idfamille, structure_id=idstructure)
+    resultat = messages.aggregate(
+        dernier_id=Max("idmessage"),
+        dernier_non_lu_id=Max("idmessage", filter=Q(utilisateur__isnull=True, date_lecture__isnull=True)),
+        nbre_non_lus=Count("idmessage", filter=Q(utilisateur__isnull=True, date_lecture__isnull=True)),
+    )
+
+    # Conversation sans message
+    if not resultat["dernier_id"]:
+        PortailConversation.objects.filter(famille_id=idfamille, structure_id=idstructure).delete()
+        return None
+
+    conversation, created = PortailConversation.objects.update_or_create(famille_id=idfamille, structure_id=idstructure, defaults={
+        "dernier_message_id": resultat["dernier_id"],
+        "dernier_message_non_lu_id": resultat["dernier_non_lu_id"],
+        "date_dernier_message": messages.get(pk=resultat["dernier_id"]).date_creation,
+        "nbre_non_lus": resultat["nbre_non_lus"],
+    })
+    return conversation
+
+
+def Actualiser_conversations(messages=None):
+    """ Recalcule les conversations concernées par une liste ou un queryset de messages """
+    if hasattr(messages, "values_list"):
+        couples = set(messages.values_list("famille_id", "structure_id"))
+    else:
+        couples = {(message.famille_id, message.structure_id) for message in messages}
+    for idfamille, idstructure in couples:
+        Actualiser_conversation(idfamille=idfamille, idstructure=idstructure)
+
+
+def Get_messages_non_lus(structures=None):
+    """ Renvoie le dernier message non lu de chaque conversation des structures données """
+    conversations = PortailConversation.objects.filter(structure__in=structures, nbre_non_lus__gt=0)
+    return PortailMessage.objects.filter(idmessage__in=conversations.values("dernier_message_non_lu")).select_related("famille", "structure").order_by("-date_creation")
+
+
+def Get_messages_lus(structures=None):
+    """ Renvoie le dernier message des conversations récentes sans message non lu """
+    date_limite = timezone.now() - datetime.timedelta(days=DELAI_CONVERSATIONS_LUES)
+    conversations = PortailConversation.objects.filter(structure__in=structures, nbre_non_lus=0, date_dernier_message__gte=date_limite)
+    return PortailMessage.objects.filter(idmessage__in=conversations.values("dernier_message")).select_related("famille", "structure").order_by("-date_creation")
@@ -3,6 +3,11 @@
 #  Noethysweb, application de gestion multi-activités.
 #  Distribué sous licence GNU GPL.
 
+import decimal
+from django.db import connection, connections, transaction
+from django.db.models import Max
+from django.core.exceptions import EmptyResultSet
+
 
 def Maj_infos():
     """ Met à jour des infos dans la DB """
@@ -28,3 +33,72 @@ def Maj_infos():
     # Met à jour les totaux des factures
     utils_factures.Maj_total_factures(IDfamille=0, IDfacture=0)
 
+
+
+def Creer_objets(objets=[], batch_size=500):
+    """ Enregistre des objets d'un même modèle en une requête par lot et renseigne leurs ID """
+    if not objets:
+        return objets
+    modele = type(objets[0])
+    if connection.features.can_return_rows_from_bulk_insert:
+        return modele.objects.bulk_create(objets, batch_size=batch_size)
+
+    # SQLite ne renvoie pas les ID des lignes insérées. Dans une transaction, le verrou en écriture est conservé
+    # dès le premier lot : les ID attribués sont donc consécutifs et se terminent au plus grand ID de la table
+    with transaction.atomic():
+        modele.objects.bulk_create(objets, batch_size=batch_size)
+        dernier_id = modele.objects.aggregate(dernier_id=Max("pk"))["dernier_id"]
+    for id_objet, objet in enumerate(objets, dernier_id - len(objets) + 1):
+        objet.pk = id_objet
+    return objets
+
+
+def Appliquer_valeurs(objet=None, valeurs={}):
+    """ Applique des valeurs à un objet et renvoie la liste des champs réellement modifiés """
+    champs_modifies = []
+    for nom_champ, valeur in valeurs.items():
+        champ = objet._meta.get_field(nom_champ)
+        valeur = champ.to_python(valeur)
+        # Les décimaux sont comparés avec la précision enregistrée dans la base
+        if isinstance(valeur, decimal.Decimal):
+            valeur = valeur.quantize(decimal.Decimal(10) ** -champ.decimal_places)
+        if getattr(objet, champ.attname) != valeur:
+            setattr(objet, champ.attname, valeur)
+            champs_modifies.append(champ.name)
+    return champs_modifies
+
+
+def Get_taille_paquet(queryset=None):
+    """ Renvoie le nombre maximal de valeurs d'une liste IN pour un queryset selon la limite de paramètres de la base (None = aucune limite) """
+    max_parametres = connections[queryset.db if queryset is not None else "default"].features.max_query_params
+    if not max_parametres:
+        return None
+    # Les paramètres déjà présents dans la requête sont décomptés
+    nbre_parametres = 0
+    if queryset is not None:
+        try:
+            nbre_parametres = len(queryset.query.sql_with_params()[1])
+        except EmptyResultSet:
+            pass
+    return max(max_parametres - nbre_parametres, 1)
+
+
+def Iterer_par_paquets(queryset=None, champ="pk", valeurs=[], chunk_size=2000):
+    """ Parcourt en flux les résultats d'un queryset filtré sur une liste de valeurs de taille quelconque (champ__in=valeurs).
+        La liste est découpée en paquets selon la limite de paramètres de la base : le tri n'est respecté qu'à l'intérieur de chaque paquet """
+    valeurs = list(dict.fromkeys(valeurs))
+    if not valeurs:
+        return
+    taille_paquet = Get_taille_paquet(queryset) or len(valeurs)
+    for index in range(0, len(valeurs), taille_paquet):
+        resultats = queryset.filter(**{"%s__in" % champ: valeurs[index:index + taille_paquet]})
+        # iterator() ignore les prefetch_related : le paquet est alors chargé en une fois
+        if resultats._prefetch_related_lookups:
+            yield from resultats
+        else:
+            yield from resultats.iterator(chunk_size=chunk_size)
+
+
+def Get_dict_par_paquets(queryset=None, valeurs=[], champ="pk"):
+    """ Renvoie un dict {pk: objet} des objets d'un queryset dont le champ est dans une liste de valeurs de taille quelconque """
+    return {objet.pk: objet for objet in Iterer_par_paquets(queryset, champ, valeurs)}
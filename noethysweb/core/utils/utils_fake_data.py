@@ -3,8 +3,13 @@
 #  Noethysweb, application de gestion multi-activités.
 #  Distribué sous licence GNU GPL.
 
-from core.models import Famille, Individu, Rattachement, Inscription, Consommation, Evenement, Ouverture, MemoJournee, Prestation
-import datetime
+from core.models import Famille, Individu, Rattachement, Inscription, Consommation, Evenement, Ouverture, MemoJournee, Prestation, Structure, Activite, \
+                        Groupe, Unite, CategorieTarif, NomTarif, Tarif, CombiTarif, TarifLigne, Facture, Reglement, Ventilation, Payeur, ModeReglement, \
+                        CompteBancaire, ModeleDocument, ModeleImpression, Organisateur, Quotient, TypeQuotient
+from core.utils import utils_db
+import datetime, decimal, json, random
+from django.db import transaction
+from django.db.models import F
 
 # Exemple d'utilisation dans la console python : from core.utils.utils_fake_data import Generate_ouvertures
 
@@ -41,3 +46,106 @@ def Generate_familles():
             Consommation.objects.create(date=datetime.date(2019, 2, jour), activite_id=1, etat="reservation", groupe_id=1, individu=enfant, inscription=inscription, unite_id=1)
             Consommation.objects.create(date=datetime.date(2019, 2, jour), activite_id=1, etat="reservation", groupe_id=1, individu=enfant, inscription=inscription, unite_id=2)
         print("Famille %d ok" % index)
+
+
+def Generer_jeu_donnees(nbre_familles=100, nbre_enfants=2, annee=None, taux_reservation=0.4, graine=1):
+    """ Génération par lots d'un jeu de données complet sur une année : activité, tarifs, ouvertures, familles, inscriptions,
+        consommations, prestations, factures du premier semestre et règlements. Renvoie un dict des principaux objets créés """
+    # Une seule transaction : sans elle, chaque insertion est validée séparément
+    with transaction.atomic():
+        return Generer_donnees(nbre_familles=nbre_familles, nbre_enfants=nbre_enfants, annee=annee, taux_reservation=taux_reservation, graine=graine)
+
+
+def Generer_donnees(nbre_familles=100, nbre_enfants=2, annee=None, taux_reservation=0.4, graine=1):
+    random.seed(graine)
+    if not annee:
+        annee = datetime.date.today().year
+    date_debut, date_fin = datetime.date(annee, 1, 1), datetime.date(annee, 12, 31)
+    dates = [date_debut + datetime.timedelta(days=index) for index in range((date_fin - date_debut).days + 1)]
+    dates = [date for date in dates if date.weekday() < 5]
+
+    # Paramétrage
+    Organisateur.objects.get_or_create(pk=1, defaults={"nom": "Organisateur"})
+    structure = Structure.objects.create(nom="Structure de test")
+    activite = Activite.objects.create(nom="Accueil de loisirs (test)", abrege="TEST", structure=structure, date_debut=date_debut, date_fin=date_fin)
+    groupes = utils_db.Creer_objets([Groupe(activite=activite, nom=nom, ordre=ordre) for ordre, nom in enumerate(["Petits", "Grands"], 1)])
+    unites = utils_db.Creer_objets([Unite(activite=activite, nom=nom, abrege=abrege, ordre=ordre, type="Unitaire") for ordre, (nom, abrege) in enumerate([("Matin", "M"), ("Après-midi", "AM")], 1)])
+    categorie_tarif = CategorieTarif.objects.create(activite=activite, nom="Catégorie unique")
+    tarifs = {}
+    for unite, montant in zip(unites, (decimal.Decimal("8.50"), decimal.Decimal("7.00"))):
+        nom_tarif = NomTarif.objects.create(activite=activite, nom=unite.nom)
+        tarif = Tarif.objects.create(activite=activite, nom_tarif=nom_tarif, date_debut=date_debut, methode="montant_unique", type="JOURN", etats=["reservation", "present", "absenti"])
+        tarif.categories_tarifs.add(categorie_tarif)
+        CombiTarif.objects.create(tarif=tarif, type="JOURN").unites.add(unite)
+        TarifLigne.objects.create(tarif=tarif, activite=activite, code="montant_unique", num_ligne=0, montant_unique=montant)
+        tarifs[unite.pk] = (tarif, nom_tarif.nom, montant)
+    Ouverture.objects.bulk_create([Ouverture(activite=activite, date=date, unite=unite, groupe=groupe) for date in dates for unite in unites for groupe in groupes], batch_size=500)
+
+    # Familles et individus
+    type_quotient = TypeQuotient.objects.create(nom="QF test")
+    familles = utils_db.Creer_objets([Famille(nom="FAMILLE%d" % index, mail="famille%d@example.com" % index) for index in range(nbre_familles)])
+    Quotient.objects.bulk_create([Quotient(famille=famille, type_quotient=type_quotient, date_debut=date_debut, date_fin=date_fin, quotient=random.choice((350, 700, 1200))) for famille in familles], batch_size=500)
+    individus, rattachements = [], []
+    for famille in familles:
+        individus.append((famille, 1, Individu(civilite=1, nom=famille.nom, prenom="Parent", date_naiss=datetime.date(annee - random.randint(28, 50), random.randint(1, 12), random.randint(1, 28)))))
+        for index in range(nbre_enfants):
+            individus.append((famille, 2, Individu(civilite=random.choice((4, 5)), nom=famille.nom, prenom="Enfant%d" % (index + 1), date_naiss=datetime.date(annee - random.randint(3, 12), random.randint(1, 12), random.randint(1, 28)))))
+    utils_db.Creer_objets([individu for famille, categorie, individu in individus])
+    Rattachement.objects.bulk_create([Rattachement(famille=famille, individu=individu, categorie=categorie, titulaire=categorie == 1) for famille, categorie, individu in individus], batch_size=500)
+    inscriptions = utils_db.Creer_objets([Inscription(famille=famille, individu=individu, activite=activite, groupe=groupes[0] if individu.date_naiss.year > annee - 7 else groupes[1],
+                                                      categorie_tarif=categorie_tarif, date_debut=date_debut) for famille, categorie, individu in individus if categorie == 2])
+
+    # Consommations et prestations
+    consommations, prestations = [], []
+    for inscription in inscriptions:
+        for date in dates:
+            for unite in unites:
+                if random.random() < taux_reservation:
+                    tarif, label, montant = tarifs[unite.pk]
+                    prestations.append(Prestation(date=date, categorie="consommation", label=label, montant_initial=montant, montant=montant, activite=activite, tarif=tarif,
+                                            famille_id=inscription.famille_id, individu_id=inscription.individu_id, categorie_tarif=categorie_tarif))
+                    consommations.append(Consommation(inscription=inscription, individu_id=inscription.individu_id, activite=activite, date=date, unite=unite, groupe_id=inscription.groupe_id,
+                                                      categorie_tarif=categorie_tarif, etat="present" if date.month < 7 else "reservation", prestation=prestations[-1]))
+    utils_db.Creer_objets(prestations)
+    Consommation.objects.bulk_create(consommations, batch_size=500)
+
+    # Factures du premier semestre
+    modele_document = ModeleDocument.objects.create(nom="Facture (test)", categorie="facture", largeur=210, hauteur=297, objets="[]")
+    from facturation.forms.factures_options_impression import VALEURS_DEFAUT
+    modele_impression = ModeleImpression.objects.create(categorie="facture", nom="Facture (test)", modele_document=modele_document, options=json.dumps(VALEURS_DEFAUT))
+    fin_semestre = datetime.date(annee, 6, 30)
+    prestations_familles = {}
+    for prestation in prestations:
+        if prestation.date <= fin_semestre:
+            prestations_familles.setdefault(prestation.famille_id, []).append(prestation)
+    numero = (Facture.objects.order_by("-numero").values_list("numero", flat=True).first() or 0) + 1
+    factures = []
+    for index, (idfamille, prestations_famille) in enumerate(prestations_familles.items()):
+        total = sum(prestation.montant for prestation in prestations_famille)
+        factures.append(Facture(numero=numero + index, famille_id=idfamille, date_edition=fin_semestre, date_echeance=fin_semestre + datetime.timedelta(days=30), date_debut=date_debut,
+                                date_fin=fin_semestre, activites=str(activite.pk), individus=";".join(sorted({str(prestation.individu_id) for prestation in prestations_famille})),
+                                prestations="consommation", total=total, regle=0, solde=total, solde_actuel=total))
+    utils_db.Creer_objets(factures)
+    for facture in factures:
+        for prestation in prestations_familles[facture.famille_id]:
+            prestation.facture = facture
+    Prestation.objects.bulk_update([prestation for prestations_famille in prestations_familles.values() for prestation in prestations_famille], ["facture"], batch_size=500)
+
+    # Règlements d'une facture sur deux
+    mode = ModeReglement.objects.create(label="Chèque (test)")
+    compte = CompteBancaire.objects.create(nom="Compte (test)")
+    modele_reglement = ModeleImpression.objects.create(categorie="reglement", nom="Règlement (test)")
+    factures_reglees = factures[::2]
+    payeurs = utils_db.Creer_objets([Payeur(famille_id=facture.famille_id, nom="Payeur %d" % facture.famille_id) for facture in factures_reglees])
+    reglements = utils_db.Creer_objets([Reglement(famille_id=facture.famille_id, date=facture.date_echeance, mode=mode, montant=facture.total, payeur=payeur, compte=compte, modelimp=modele_reglement)
+                                        for facture, payeur in zip(factures_reglees, payeurs)])
+    Ventilation.objects.bulk_create([Ventilation(famille_id=reglement.famille_id, reglement=reglement, prestation=prestation, montant=prestation.montant)
+                                     for facture, reglement in zip(factures_reglees, reglements) for prestation in prestations_familles[facture.famille_id]], batch_size=500)
+    Facture.objects.filter(pk__in=[facture.pk for facture in factures_reglees]).update(regle=F("total"), solde=0, solde_actuel=0)
+
+    # Places prises
+    from consommations.utils import utils_places
+    utils_places.Reconstruire(activite)
+
+    return {"activite": activite, "unites": unites, "groupes": groupes, "familles": familles, "inscriptions": inscriptions, "factures": factures,
+            "modele_impression": modele_impression, "date_debut": date_debut, "date_fin": date_fin}
@@ -5,12 +5,14 @@
 
 import logging
 logger = logging.getLogger(__name__)
-import datetime
+import datetime, multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from core.utils import utils_dates, utils_modeles_documents, utils_preferences, utils_fichiers
 from core.models import Organisateur
 from core.data import data_modeles_emails
 from django.core.cache import cache
 from django.conf import settings
+from django.db import connection, connections
 from uuid import uuid4
 
 from reportlab.platypus.doctemplate import PageTemplate, BaseDocTemplate, NextPageTemplate
@@ -287,3 +289,70 @@ class Impression():
     def Get_nom_fichier(self):
         return self.nom_fichier
 
+
+
+# Nombre minimal de documents pour justifier la répartition sur plusieurs processus
+SEUIL_IMPRESSION_PARALLELE = 20
+
+
+def Generer_documents(classe_impression=None, dict_documents={}, dict_options={}, IDmodele=None, categorie="", callback_progression=None):
+    """ Génère un PDF par document avec une seule instance d'impression """
+    resultats = {}
+    impression = classe_impression(dict_options=dict_options, IDmodele=IDmodele, generation_auto=False)
+    for ID, dict_document in dict_documents.items():
+        logger.debug("Création du PDF ID%d..." % ID)
+        impression.Generation_document(dict_donnees={ID: dict_document})
+        resultats[ID] = {"nom_fichier": impression.Get_nom_fichier(), "valeurs": impression.Get_champs_fusion_pour_email(categorie, ID)}
+        if callback_progression:
+            callback_progression(len(resultats), len(dict_documents))
+    return resultats
+
+
+def Generation_documents_lot(classe_impression=None, dict_documents={}, dict_options={}, IDmodele=None, categorie="", nbre_processus=None, callback_progression=None):
+    """ Génère un PDF par document dans MEDIA_ROOT/temp en répartissant le travail sur plusieurs processus.
+        Renvoie {ID: {"nom_fichier": ..., "valeurs": ...}} """
+    total = len(dict_documents)
+    if not nbre_processus:
+        # Répartition désactivée par défaut : les appelants sont des vues exécutées par le serveur web
+        nbre_processus = getattr(settings, "IMPRESSION_NBRE_PROCESSUS", None) or 1
+    nbre_processus = min(nbre_processus, max(total // SEUIL_IMPRESSION_PARALLELE, 1))
+
+    # La fermeture des connexions avant le fork annulerait la transaction en cours
+    if nbre_processus > 1 and connection.in_atomic_block:
+        logger.debug("Création des PDF dans une transaction : pas de répartition sur plusieurs processus")
+        nbre_processus = 1
+
+    if nbre_processus > 1 and "fork" in multiprocessing.get_all_start_methods():
+        try:
+            return Generation_parallele(classe_impression, dict_documents, dict_options, IDmodele, categorie, nbre_processus, callback_progression)
+        except Exception as err:
+            logger.error("Erreur lors de la création des PDF en parallèle, création séquentielle : %s" % err, exc_info=True)
+
+    # Génération dans le processus courant
+    return Generer_documents(classe_impression, dict_documents, dict_options, IDmodele, categorie, callback_progression=callback_progression)
+
+
+def Generation_parallele(classe_impression=None, dict_documents={}, dict_options={}, IDmodele=None, categorie="", nbre_processus=2, callback_progression=None):
+    """ Répartit la génération des PDF sur un pool de processus """
+    total = len(dict_documents)
+
+    # Découpage en paquets : plusieurs paquets par processus pour équilibrer la charge
+    taille_paquet = max(total // (nbre_processus * 4), 1)
+    liste_ID = list(dict_documents.keys())
+    paquets = [{ID: dict_documents[ID] for ID in liste_ID[index:index + taille_paquet]} for index in range(0, total, taille_paquet)]
+
+    # Les connexions à la base ne doivent pas être partagées avec les processus fils
+    connections.close_all()
+
+    logger.debug("Création de %d PDF sur %d processus..." % (total, nbre_processus))
+    resultats = {}
+    with ProcessPoolExecutor(max_workers=nbre_processus, mp_context=multiprocessing.get_context("fork")) as executor:
+        futures = [executor.submit(Generer_documents, classe_impression, paquet, dict_options, IDmodele, categorie) for paquet in paquets]
+        for future in as_completed(futures):
+            resultats.update(future.result())
+            logger.debug("Création des PDF : %d/%d" % (len(resultats), total))
+            if callback_progression:
+                callback_progression(len(resultats), total)
+
+    # Restitue l'ordre initial des documents
+    return {ID: resultats[ID] for ID in liste_ID}
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2019-2021 Ivan LUCAS.
+#  Noethysweb, application de gestion multi-activités.
+#  Distribué sous licence GNU GPL.
+
+import logging, datetime, re
+logger = logging.getLogger(__name__)
+from django.db import connection
+from django.db.models import Q
+from core.models import Consommation, Prestation, Ouverture, Remplissage, MemoJournee, Deduction, Activite, Inscription, Famille
+
+# Tables dont les index sont contrôlés
+MODELES_CONTROLES = (Consommation, Prestation, Ouverture, Remplissage, MemoJournee, Deduction)
+
+# Expressions repérant un parcours complet de table dans le plan d'exécution de chaque moteur
+REGEX_PARCOURS_COMPLET = {
+    "sqlite": re.compile(r"\bSCAN (?!.*USING (COVERING )?INDEX)(?!.*USING INTEGER PRIMARY KEY)(\w+)"),
+    "postgresql": re.compile(r"Seq Scan on (\w+)"),
+    "mysql": re.compile(r"\b(\w+)\s+\S+\s+ALL\b"),
+}
+
+
+def Get_requetes(date_debut=None, date_fin=None):
+    """ Renvoie les requêtes représentatives de la grille, de la facturation et des statistiques """
+    activite = Activite.objects.order_by("-pk").first()
+    idactivite = activite.pk if activite else 0
+    # Une liste vide rendrait la requête vide sans interroger la base : un ID fictif est alors utilisé
+    liste_idinscriptions = list(Inscription.objects.filter(activite_id=idactivite).values_list("pk", flat=True)[:50]) or [0]
+    liste_idfamilles = list(Famille.objects.order_by("pk").values_list("pk", flat=True)[:50]) or [0]
+    periode = Q(date__gte=date_debut) & Q(date__lte=date_fin)
+    return [
+        ("Grille : consommations des inscriptions", Consommation.objects.filter(periode, inscription__in=liste_idinscriptions)),
+        ("Grille : places de l'activité", Consommation.objects.filter(periode, activite_id=idactivite, etat__in=("reservation", "present", "attente"))),
+        ("Grille : ouvertures", Ouverture.objects.filter(periode, activite_id=idactivite)),
+        ("Grille : remplissage", Remplissage.objects.filter(periode, activite_id=idactivite)),
+        ("Grille : mémos journaliers", MemoJournee.objects.filter(periode, inscription__in=liste_idinscriptions)),
+        ("Facturation : prestations non facturées des familles", Prestation.objects.filter(periode, famille_id__in=liste_idfamilles, facture__isnull=True)),
+        ("Facturation : déductions des familles", Deduction.objects.filter(periode, famille_id__in=liste_idfamilles)),
+        ("Statistiques : prestations de l'activité", Prestation.objects.filter(periode, activite_id=idactivite)),
+        ("Statistiques : consommations de la période", Consommation.objects.filter(periode, activite_id=idactivite).values("date").distinct()),
+    ]
+
+
+def Analyser_requete(queryset=None):
+    """ Renvoie le plan d'exécution d'une requête et les tables parcourues entièrement """
+    plan = queryset.explain()
+    regex = REGEX_PARCOURS_COMPLET.get(connection.vendor, None)
+    tables = sorted({resultat.groups()[-1] for resultat in regex.finditer(plan)}) if regex else []
+    return plan, tables
+
+
+def Get_index_manquants():
+    """ Renvoie les index déclarés dans les modèles mais absents de la base de données """
+    index_manquants = []
+    with connection.cursor() as cursor:
+        for modele in MODELES_CONTROLES:
+            contraintes = connection.introspection.get_constraints(cursor, modele._meta.db_table)
+            colonnes_existantes = [tuple(contrainte["columns"]) for contrainte in contraintes.values() if contrainte["index"] or contrainte["primary_key"] or contrainte["unique"]]
+            for index in modele._meta.indexes:
+                colonnes = tuple(modele._meta.get_field(nom_champ).column for nom_champ in index.fields)
+                # Un index existant commençant par les mêmes colonnes convient également
+                if index.name not in contraintes and not [existant for existant in colonnes_existantes if existant[:len(colonnes)] == colonnes]:
+                    index_manquants.append((modele._meta.db_table, index.name, colonnes))
+    return index_manquants
+
+
+def Analyser(date_debut=None, date_fin=None):
+    """ Rejoue les requêtes représentatives et renvoie un rapport : [(label, tables parcourues entièrement, plan)] """
+    if not date_fin:
+        date_fin = datetime.date.today()
+    if not date_debut:
+        date_debut = date_fin - datetime.timedelta(days=31)
+    rapport = []
+    for label, queryset in Get_requetes(date_debut=date_debut, date_fin=date_fin):
+        plan, tables = Analyser_requete(queryset)
+        if tables:
+            logger.debug("Index : parcours complet de %s pour la requête '%s'." % (", ".join(tables), label))
+        rapport.append((label, tables, plan))
+    return rapport
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2019-2021 Ivan LUCAS.
+#  Noethysweb, application de gestion multi-activités.
+#  Distribué sous licence GNU GPL.
+
+import logging, hashlib, io, os
+logger = logging.getLogger(__name__)
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+from core.utils.utils_images import RESAMPLING_FILTER
+
+# Largeurs (en pixels) des déclinaisons proposées au navigateur dans le srcset des photos des albums
+LARGEURS = (320, 640, 1280)
+
+# Largeur des avatars des individus (affichés au plus en 80px, doublée pour les écrans haute densité)
+LARGEUR_AVATAR = 160
+
+QUALITE = 80
+
+
+def Get_nom(empreinte="", largeur=0):
+    """ Renvoie le nom de la miniature dans le stockage (MINIATURES_REPERTOIRE dans les settings pour le modifier) """
+    repertoire = getattr(settings, "MINIATURES_REPERTOIRE", "miniatures")
+    return "%s/%s/%s_%d.webp" % (repertoire, empreinte[:2], empreinte, largeur)
+
+
+def Calculer_empreinte(fichier=None):
+    """ Calcule l'empreinte SHA1 du contenu d'un fichier : deux photos identiques partagent les mêmes miniatures """
+    empreinte = hashlib.sha1()
+    fichier.seek(0)
+    for chunk in fichier.chunks():
+        empreinte.update(chunk)
+    return empreinte.hexdigest()
+
+
+def Redimensionner(image=None, largeur=0):
+    """ Réduit une image à la largeur donnée en conservant ses proportions (sans jamais l'agrandir) """
+    if image.width <= largeur:
+        return image
+    return image.resize((largeur, max(1, round(image.height * largeur / image.width))), RESAMPLING_FILTER)
+
+
+def Generer(fichier=None, largeurs=LARGEURS, empreinte=None):
+    """ Génère les miniatures WebP manquantes d'une image dans le stockage du fichier d'origine. Renvoie l'empreinte ou None si l'image est illisible """
+    storage = fichier.storage
+    try:
+        with fichier.open("rb"):
+            empreinte = empreinte or Calculer_empreinte(fichier)
+            manquantes = [largeur for largeur in largeurs if not storage.exists(Get_nom(empreinte, largeur))]
+            if not manquantes:
+                return empreinte
+
+            fichier.seek(0)
+            image = Image.open(fichier)
+            # Les JPEG sont directement décodés à une échelle réduite, suffisante pour la plus grande miniature
+            image.draft("RGB", (max(manquantes), max(manquantes)))
+            image = ImageOps.exif_transpose(image)
+            transparence = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+            image = image.convert("RGBA" if transparence else "RGB")
+
+            # Chaque miniature est calculée à partir de la précédente, plus rapide qu'à partir de l'original
+            for largeur in sorted(manquantes, reverse=True):
+                image = Redimensionner(image, largeur)
+                contenu = io.BytesIO()
+                image.save(contenu, format="WEBP", quality=QUALITE, method=4)
+                storage.save(Get_nom(empreinte, largeur), ContentFile(contenu.getvalue()))
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError) as err:
+        logger.warning("Miniatures : impossible de traiter l'image %s : %s" % (fichier.name, err))
+        return None
+    return empreinte
+
+
+def Get_url(fichier=None, empreinte="", largeur=0):
+    return fichier.storage.url(Get_nom(empreinte, largeur))
+
+
+def Get_srcset(fichier=None, empreinte="", largeurs=LARGEURS):
+    """ Renvoie la valeur de l'attribut srcset d'une image """
+    return ", ".join("%s %dw" % (Get_url(fichier, empreinte, largeur), largeur) for largeur in largeurs)
+
+
+def Get_empreinte_nom(nom=""):
+    """ Empreinte des avatars : les noms des photos (uuid) changent à chaque envoi, le fichier n'a donc pas à être relu """
+    return hashlib.sha1(nom.encode()).hexdigest()
+
+
+def Purger(storage=None, empreintes=set()):
+    """ Supprime les miniatures dont l'empreinte n'est plus utilisée. Renvoie le nombre de fichiers supprimés """
+    repertoire = getattr(settings, "MINIATURES_REPERTOIRE", "miniatures")
+    if not storage.exists(repertoire):
+        return 0
+    nbre_fichiers = 0
+    for sous_repertoire in storage.listdir(repertoire)[0]:
+        chemin = "%s/%s" % (repertoire, sous_repertoire)
+        nbre_conserves = 0
+        for nom_fichier in storage.listdir(chemin)[1]:
+            if nom_fichier.split("_")[0] in empreintes:
+                nbre_conserves += 1
+            else:
+                storage.delete("%s/%s" % (chemin, nom_fichier))
+                nbre_fichiers += 1
+        if not nbre_conserves:
+            Supprimer_repertoire(storage, chemin)
+    return nbre_fichiers
+
+
+def Supprimer_repertoire(storage=None, chemin=""):
+    """ Supprime un répertoire vide du stockage (les stockages distants n'ont pas de répertoires) """
+    try:
+        os.rmdir(storage.path(chemin))
+    except (NotImplementedError, OSError):
+        pass
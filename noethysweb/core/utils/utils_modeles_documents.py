@@ -813,6 +813,7 @@ class Modele_doc():
 
         # Importation des objets
         self.objets = json.loads(self.modele.objets)
+        self.objets_fond = json.loads(self.modele.fond.objets) if self.modele.fond else []
 
     def FindObjet(self, champ=""):
         for objet in self.objets:
@@ -831,7 +832,7 @@ class Modele_doc():
         """ Dessine les objets du fond """
         if self.modele.fond:
             # fond = ModeleDocument.objects.get(pk=self.modele.fond_id)
-            for objet in json.loads(self.modele.fond.objets):
+            for objet in self.objets_fond:
                 valeur = self.GetValeur(objet, dict_valeurs)
                 if valeur is not False:
                     ObjetPDF(objet, canvas, valeur=valeur, options=options)
@@ -856,23 +857,8 @@ class Modele_doc():
 
         # -------- TEXTE ----------
         if "texte" in objet.get("categorie", ""):
-            texte = objet.get("text")
-            for nomChamp, valeur in dict_valeurs.items():
-                # Traitement d'une formule
-                texte = utils_resolveur_formule.ResolveurTexte(texte=texte, listeChamps=list(dict_valeurs.keys()), dictValeurs=dict_valeurs)
-
-                # Remplacement des mos-clés par les valeurs
-                if type(nomChamp) == str and nomChamp.startswith("{"):
-                    if not valeur: valeur = ""
-                    if type(valeur) == int: valeur = str(valeur)
-                    if type(valeur) == float: valeur = u"%.02f €" % valeur
-                    if type(valeur) == datetime.date: valeur = utils_dates.ConvertDateToFR(valeur)
-                    if nomChamp in texte:
-                        texte = texte.replace(nomChamp, valeur)
-            # Remplace également les mots-clés non utilisés par des chaînes vides
-            texte = re.sub(r"\{[A-Za-z0-9_-]*?\}", "", texte)
-
-            valeur = texte
+            # Le texte est compilé une seule fois puis fusionné en une seule passe
+            valeur = utils_resolveur_formule.CompilerTexte(objet.get("text") or "").Resoudre(dict_valeurs)
 
         # -------- PHOTO -------
         if objet.get("categorie") == "photo":
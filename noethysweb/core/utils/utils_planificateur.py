@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2019-2021 Ivan LUCAS.
+#  Noethysweb, application de gestion multi-activités.
+#  Distribué sous licence GNU GPL.
+
+import logging, os, datetime, time, threading, importlib, shlex, subprocess
+logger = logging.getLogger(__name__)
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+
+# Un verrou non rafraîchi depuis ce délai (en secondes) est considéré comme abandonné
+DELAI_VERROU = 120
+
+CLE_STATISTIQUES = "planificateur_taches"
+
+# Bornes des champs d'une expression cron : minute, heure, jour du mois, mois, jour de la semaine
+BORNES_CRON = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+
+class Expression_cron():
+    """ Expression cron à 5 champs (*, listes, intervalles et pas : '*/15 8-18 * * 1-5') """
+    def __init__(self, expression=""):
+        self.expression = expression
+        champs = expression.split()
+        if len(champs) != 5:
+            raise ValueError("Expression cron invalide : %s" % expression)
+        self.valeurs = [self.Analyser_champ(champ, mini, maxi) for champ, (mini, maxi) in zip(champs, BORNES_CRON)]
+        # Le dimanche peut être noté 0 ou 7
+        if 7 in self.valeurs[4]:
+            self.valeurs[4].add(0)
+        self.jour_libre = champs[2] == "*"
+        self.jour_semaine_libre = champs[4] == "*"
+
+    def Analyser_champ(self, champ="", mini=0, maxi=59):
+        valeurs = set()
+        for partie in champ.split(","):
+            plage, pas = (partie.split("/") + ["1"])[:2]
+            if plage == "*":
+                debut, fin = mini, maxi
+            elif "-" in plage:
+                debut, fin = (int(valeur) for valeur in plage.split("-"))
+            else:
+                debut = int(plage)
+                fin = maxi if "/" in partie else debut
+            if debut < mini or fin > maxi:
+                raise ValueError("Expression cron invalide : %s" % self.expression)
+            valeurs.update(range(debut, fin + 1, int(pas)))
+        return valeurs
+
+    def Correspond(self, date=None):
+        minutes, heures, jours, mois, jours_semaine = self.valeurs
+        if date.minute not in minutes or date.hour not in heures or date.month not in mois:
+            return False
+        # Comme cron : si le jour du mois et le jour de la semaine sont restreints, l'un des deux suffit
+        jour_ok, jour_semaine_ok = date.day in jours, date.isoweekday() % 7 in jours_semaine
+        if not self.jour_libre and not self.jour_semaine_libre:
+            return jour_ok or jour_semaine_ok
+        return jour_ok and jour_semaine_ok
+
+
+class Tache():
+    """ Tâche planifiée : une fonction (chemin 'module.fonction') ou une commande de gestion (nom sans point) """
+    def __init__(self, expression="", chemin="", args=[], kwargs={}):
+        self.cron = Expression_cron(expression)
+        self.chemin = chemin
+        self.args = args
+        self.kwargs = kwargs
+
+    def Executer(self):
+        if "." not in self.chemin:
+            return call_command(self.chemin, *self.args, **self.kwargs)
+        module, fonction = self.chemin.rsplit(".", 1)
+        return getattr(importlib.import_module(module), fonction)(*self.args, **self.kwargs)
+
+
+def Get_taches():
+    """ Renvoie les tâches de PLANIFICATEUR_TACHES ou, à défaut, de CRONJOBS (même format que django-crontab) """
+    taches = []
+    for definition in getattr(settings, "PLANIFICATEUR_TACHES", None) or getattr(settings, "CRONJOBS", []):
+        expression, chemin = definition[:2]
+        # Les éléments suivants sont les arguments, les arguments nommés et le suffixe de commande du crontab (ignoré)
+        args = next((element for element in definition[2:] if isinstance(element, (list, tuple))), [])
+        kwargs = next((element for element in definition[2:] if isinstance(element, dict)), {})
+        taches.append(Tache(expression=expression, chemin=chemin, args=args, kwargs=kwargs))
+    return taches
+
+
+def Get_lignes_crontab():
+    """ Renvoie les tâches installées dans la crontab système par django-crontab ('python manage.py crontab add') """
+    from django_crontab.app_settings import Settings
+    parametres = Settings(settings)
+    try:
+        sortie = subprocess.run(shlex.split(parametres.CRONTAB_EXECUTABLE) + ["-l"], capture_output=True, text=True).stdout
+    except OSError:
+        # Pas de crontab sur ce système
+        return []
+    return [ligne for ligne in sortie.splitlines() if parametres.CRONTAB_COMMENT in ligne]
+
+
+# --------------------------------- Verrou ----------------------------------
+
+class Verrou():
+    """ Verrou fichier garantissant qu'une seule instance du planificateur exécute les tâches """
+    def __init__(self, chemin=None):
+        self.chemin = chemin or getattr(settings, "PLANIFICATEUR_VERROU", None) or os.path.join(settings.BASE_DIR, "planificateur.lock")
+        self.identifiant = "%d@%s" % (os.getpid(), datetime.datetime.now().isoformat())
+
+    def Acquerir(self):
+        """ Prend le verrou s'il est libre ou abandonné """
+        try:
+            if time.time() - os.path.getmtime(self.chemin) > DELAI_VERROU:
+                logger.warning("Planificateur : verrou abandonné par %s, reprise du verrou." % self.Get_proprietaire())
+                os.remove(self.chemin)
+        except OSError:
+            pass
+        try:
+            descripteur = os.open(self.chemin, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(descripteur, "w") as fichier:
+            fichier.write(self.identifiant)
+        return True
+
+    def Rafraichir(self):
+        """ Signale que l'instance est toujours active. Renvoie False si le verrou a été perdu """
+        if self.Get_proprietaire() != self.identifiant:
+            return False
+        os.utime(self.chemin, None)
+        return True
+
+    def Liberer(self):
+        if self.Get_proprietaire() == self.identifiant:
+            os.remove(self.chemin)
+
+    def Get_proprietaire(self):
+        try:
+            with open(self.chemin, "r") as fichier:
+                return fichier.read()
+        except OSError:
+            return None
+
+
+# ------------------------------ Statistiques -------------------------------
+
+def Enregistrer_execution(chemin="", debut=None, duree=0.0, erreur=None):
+    """ Mémorise la dernière exécution et les durées d'une tâche dans le cache """
+    statistiques = cache.get(CLE_STATISTIQUES) or {}
+    stats = statistiques.setdefault(chemin, {"nbre": 0, "nbre_erreurs": 0, "nbre_chevauchements": 0, "duree_totale": 0.0, "duree_max": 0.0})
+    stats["nbre"] += 1
+    stats["duree_totale"] += duree
+    stats["duree_max"] = max(stats["duree_max"], duree)
+    stats.update({"dernier_debut": debut, "derniere_duree": duree, "derniere_erreur": erreur})
+    stats["nbre_erreurs"] += 1 if erreur else 0
+    cache.set(CLE_STATISTIQUES, statistiques, timeout=None)
+
+
+def Enregistrer_chevauchement(chemin=""):
+    statistiques = cache.get(CLE_STATISTIQUES) or {}
+    stats = statistiques.setdefault(chemin, {"nbre": 0, "nbre_erreurs": 0, "nbre_chevauchements": 0, "duree_totale": 0.0, "duree_max": 0.0})
+    stats["nbre_chevauchements"] += 1
+    cache.set(CLE_STATISTIQUES, statistiques, timeout=None)
+
+
+def Get_statistiques():
+    """ Renvoie les statistiques des tâches {chemin: {nbre, nbre_erreurs, nbre_chevauchements, duree_totale, duree_max, dernier_debut, ...}} """
+    return cache.get(CLE_STATISTIQUES) or {}
+
+
+# ------------------------------ Planificateur ------------------------------
+
+class Planificateur():
+    """ Exécute les tâches planifiées à la minute, chacune dans son propre thread """
+    def __init__(self, taches=None):
+        self.taches = Get_taches() if taches is None else taches
+        self.threads = {}
+
+    def Executer_tache(self, tache=None):
+        debut = datetime.datetime.now()
+        chrono = time.perf_counter()
+        erreur = None
+        logger.debug("Planificateur : lancement de %s..." % tache.chemin)
+        try:
+            tache.Executer()
+        except Exception as err:
+            erreur = str(err)
+            logger.error("Planificateur : erreur lors de l'exécution de %s : %s" % (tache.chemin, err), exc_info=True)
+        finally:
+            # Chaque thread dispose de sa propre connexion à la base
+            connections.close_all()
+        duree = time.perf_counter() - chrono
+        Enregistrer_execution(tache.chemin, debut=debut, duree=duree, erreur=erreur)
+        logger.debug("Planificateur : fin de %s en %.2fs." % (tache.chemin, duree))
+
+    def Lancer(self, tache=None):
+        """ Lance une tâche sauf si son exécution précédente n'est pas terminée """
+        thread = self.threads.get(tache.chemin, None)
+        if thread and thread.is_alive():
+            logger.warning("Planificateur : %s est toujours en cours, exécution ignorée." % tache.chemin)
+            Enregistrer_chevauchement(tache.chemin)
+            return False
+        thread = threading.Thread(target=self.Executer_tache, args=(tache,), name="planificateur_%s" % tache.chemin, daemon=True)
+        self.threads[tache.chemin] = thread
+        thread.start()
+        return True
+
+    def Lancer_taches_dues(self, date=None):
+        """ Lance les tâches dont l'expression correspond à la minute donnée """
+        return [tache for tache in self.taches if tache.cron.Correspond(date) and self.Lancer(tache)]
+
+    def Attendre_fin(self, delai=None):
+        for thread in list(self.threads.values()):
+            thread.join(delai)
+
+    def Boucle(self, verrou=None, arret=None):
+        """ Lance les tâches dues à chaque début de minute jusqu'à l'arrêt demandé ou la perte du verrou """
+        arret = arret or threading.Event()
+        derniere_minute = None
+        while not arret.is_set():
+            minute = datetime.datetime.now().replace(second=0, microsecond=0)
+            if minute != derniere_minute:
+                if verrou and not verrou.Rafraichir():
+                    logger.error("Planificateur : verrou perdu, arrêt de l'instance.")
+                    break
+                self.Lancer_taches_dues(minute)
+                derniere_minute = minute
+            arret.wait(min(60 - datetime.datetime.now().second, 5))
+        self.Attendre_fin()
+
+
+def Demarrer(arret=None):
+    """ Démarre le planificateur si aucune autre instance n'est active. Renvoie False si le verrou est déjà pris """
+    verrou = Verrou()
+    if not verrou.Acquerir():
+        logger.warning("Planificateur : une autre instance est déjà active (%s)." % verrou.Get_proprietaire())
+        return False
+    try:
+        planificateur = Planificateur()
+        logger.debug("Planificateur : démarrage avec %d tâches." % len(planificateur.taches))
+        planificateur.Boucle(verrou=verrou, arret=arret)
+    finally:
+        verrou.Liberer()
+    return True
@@ -3,37 +3,140 @@
 #  Noethysweb, application de gestion multi-activités.
 #  Distribué sous licence GNU GPL.
 
-import re
+import re, datetime, ast
+from core.utils import utils_dates
 
-def ResolveurCalcul(texte="", dictValeurs={}):
-    """ Pour résoudre les calculs """
-    resultat = ""
-    resultatEuros = False
-    # Remplacement des valeurs
-    for motcle, valeur in dictValeurs.items():
-        if motcle in texte:
-            # Conversion de la valeur
+# Opérateurs logiques et de comparaison saisis par l'utilisateur
+REMPLACEMENTS_EXPRESSION = [
+    (re.compile(r"\bET\b"), " and "), (re.compile(r"\bOU\b"), " or "),
+    (re.compile(r"<>"), "!="), (re.compile(r"(?<![<>=!])=(?!=)"), "=="),
+]
+
+# Eléments de syntaxe autorisés dans une expression
+NOEUDS_AUTORISES = (
+    ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.USub, ast.UAdd,
+    ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod,
+    ast.Compare, ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE,
+    ast.IfExp, ast.Call, ast.Name, ast.Attribute, ast.Load, ast.Constant,
+)
+
+
+class Expression():
+    """ Expression analysée et compilée une seule fois, puis évaluée avec un dictionnaire de valeurs """
+    def __init__(self, texte=u"", fonctions={}):
+        self.texte = texte
+        source = texte.replace("\n", " ").strip()
+        for regex, remplacement in REMPLACEMENTS_EXPRESSION:
+            source = regex.sub(remplacement, source)
+        arbre = ast.parse(source, mode="eval")
+        self.Verifier(arbre, fonctions)
+        self.variables = sorted({noeud.id for noeud in ast.walk(arbre) if isinstance(noeud, ast.Name)} - set(fonctions))
+        self.code = compile(arbre, "<formule>", "eval")
+        self.globales = dict(fonctions, __builtins__={})
+
+    def Verifier(self, arbre=None, fonctions={}):
+        """ Refuse tout ce qui n'est pas une variable, une constante, un opérateur ou une fonction autorisée """
+        for noeud in ast.walk(arbre):
+            if not isinstance(noeud, NOEUDS_AUTORISES):
+                raise ValueError("Elément non autorisé dans la formule : %s" % type(noeud).__name__)
+            if isinstance(noeud, ast.Name) and noeud.id.startswith("_"):
+                raise ValueError("Variable non autorisée dans la formule : %s" % noeud.id)
+            if isinstance(noeud, ast.Attribute) and noeud.attr.startswith("_"):
+                raise ValueError("Attribut non autorisé dans la formule : %s" % noeud.attr)
+            if isinstance(noeud, ast.Call) and (not isinstance(noeud.func, ast.Name) or noeud.func.id not in fonctions or noeud.keywords):
+                raise ValueError("Fonction non autorisée dans la formule")
+            if isinstance(noeud, ast.Constant) and not isinstance(noeud.value, (int, float, str, type(None))):
+                raise ValueError("Constante non autorisée dans la formule : %s" % noeud.value)
+            # Une répétition ou un formatage de texte ('x' * 10**9) pourrait épuiser la mémoire
+            if isinstance(noeud, ast.BinOp) and isinstance(noeud.op, (ast.Mult, ast.Mod)) and (self.Est_texte(noeud.left) or self.Est_texte(noeud.right)):
+                raise ValueError("Opération non autorisée sur un texte dans la formule")
+
+    def Est_texte(self, noeud=None):
+        """ Indique si un élément de la formule peut produire un texte """
+        if isinstance(noeud, ast.Constant):
+            return isinstance(noeud.value, str)
+        if isinstance(noeud, ast.BinOp):
+            return self.Est_texte(noeud.left) or self.Est_texte(noeud.right)
+        if isinstance(noeud, ast.IfExp):
+            return self.Est_texte(noeud.body) or self.Est_texte(noeud.orelse)
+        if isinstance(noeud, ast.BoolOp):
+            return any(self.Est_texte(valeur) for valeur in noeud.values)
+        if isinstance(noeud, ast.Call):
+            # Seule la fonction SI renvoie l'un de ses arguments (alors, sinon) : les autres fonctions renvoient une valeur calculée
+            return getattr(noeud.func, "id", None) == "SI" and any(self.Est_texte(argument) for argument in noeud.args[1:])
+        return False
+
+    def Evaluer(self, valeurs={}):
+        """ Calcule l'expression avec les valeurs données pour ses variables """
+        return eval(self.code, self.globales, valeurs)
+
+
+DICT_EXPRESSIONS = {}
+
+def CompilerExpression(texte=u"", fonctions={}):
+    """ Renvoie l'expression compilée d'un texte (mémorisée pour les appels suivants) """
+    key = (texte, tuple(sorted(fonctions.items())))
+    expression = DICT_EXPRESSIONS.get(key)
+    if expression is None:
+        if len(DICT_EXPRESSIONS) > 5000:
+            DICT_EXPRESSIONS.clear()
+        expression = Expression(texte, fonctions)
+        DICT_EXPRESSIONS[key] = expression
+    return expression
+
+
+REGEX_CHAMP_CALCUL = re.compile(r"\{[^{}]*?\}")
+CARACTERES_NON_NUMERIQUES = re.compile(r"[ €a-zA-ZéèÉÈ\-_]")
+
+
+class Calcul():
+    """ Calcul dont les champs {XXX} sont remplacés une seule fois par des variables """
+    def __init__(self, texte=u""):
+        self.champs = {}
+        def Remplacer(match):
+            return self.champs.setdefault(match.group(0), "champ%d" % len(self.champs))
+        self.expression = Expression(REGEX_CHAMP_CALCUL.sub(Remplacer, texte))
+
+    def Resoudre(self, dictValeurs={}):
+        resultatEuros = False
+        valeurs = {}
+        for motcle, variable in self.champs.items():
+            valeur = FormaterValeur(dictValeurs[motcle])
             if "€" in valeur:
                 resultatEuros = True
+            valeur = CARACTERES_NON_NUMERIQUES.sub("", valeur)
+            # Comme lors de la fusion du texte, un champ vide ne donne aucun résultat
+            if not valeur:
+                return ""
+            valeurs[variable] = float(valeur) if "." in valeur else int(valeur)
+        resultat = self.expression.Evaluer(valeurs)
+        if resultatEuros == True:
+            return "%.02f %s" % (resultat, "€")
+        return str(resultat)
 
-            for caract in " €abcdefghijklmnopqrstuvwxyzéè-_":
-                valeur = valeur.replace(caract, "")
-                valeur = valeur.replace(caract.upper(), "")
 
-            # Remplacement des valeurs
-            texte = texte.replace(motcle, valeur)
+DICT_CALCULS = {}
+
+def ResolveurCalcul(texte="", dictValeurs={}):
+    """ Pour résoudre les calculs """
+    calcul = DICT_CALCULS.get(texte)
+    if calcul is None:
+        if len(DICT_CALCULS) > 5000:
+            DICT_CALCULS.clear()
+        # Un texte qui n'est pas un calcul n'est analysé qu'une seule fois
+        try:
+            calcul = Calcul(texte)
+        except:
+            calcul = False
+        DICT_CALCULS[texte] = calcul
+    if not calcul:
+        return ""
 
     # Réalisation du calcul
     try:
-        resultat = eval(texte)
-        if resultatEuros == True:
-            resultat = "%.02f %s" % (resultat, "€")
-        else:
-            resultat = str(resultat)
+        return calcul.Resoudre(dictValeurs)
     except:
-        pass
-
-    return resultat
+        return ""
 
 
 def ResolveurFormule(formule="", listeChamps=[], dictValeurs={}):
@@ -98,4 +201,79 @@ def ResolveurTexte(texte=u"", listeChamps=[], dictValeurs={}):
     for formule in formules:
         solution = ResolveurFormule(formule, listeChamps, dictValeurs)
         texte = texte.replace(formule, solution)
-    return texte
\ No newline at end of file
+    return texte
+
+REGEX_FORMULE = re.compile(r"\[\[.*?\]\]", re.S)
+REGEX_CHAMP = re.compile(r"\{[^{}]*?\}")
+REGEX_CHAMP_INCONNU = re.compile(r"\{[A-Za-z0-9_-]*?\}")
+
+
+def FormaterValeur(valeur=None):
+    """ Convertit la valeur d'un champ en texte pour la fusion """
+    if not valeur: return ""
+    if type(valeur) == int: return str(valeur)
+    if type(valeur) == float: return u"%.02f €" % valeur
+    if type(valeur) == datetime.date: return utils_dates.ConvertDateToFR(valeur)
+    return valeur if isinstance(valeur, str) else str(valeur)
+
+
+class GabaritTexte():
+    """ Texte découpé une seule fois en segments fixes, champs {XXX} et formules [[...]] """
+    def __init__(self, texte=u""):
+        self.texte = texte
+        self.formules = False
+        self.elements = []
+        position = 0
+        for match in REGEX_FORMULE.finditer(texte):
+            self.Decouper_champs(texte[position:match.start()])
+            self.elements.append(("formule", match.group(0)))
+            self.formules = True
+            position = match.end()
+        self.Decouper_champs(texte[position:])
+
+    def Decouper_champs(self, texte=u""):
+        position = 0
+        for match in REGEX_CHAMP.finditer(texte):
+            if match.start() > position:
+                self.elements.append(("texte", texte[position:match.start()]))
+            self.elements.append(("champ", match.group(0)))
+            position = match.end()
+        if position < len(texte):
+            self.elements.append(("texte", texte[position:]))
+
+    def Resoudre(self, dictValeurs={}):
+        """ Remplace en une seule passe les formules et les champs par leurs valeurs """
+        if not dictValeurs:
+            return REGEX_CHAMP_INCONNU.sub("", self.texte)
+        resultat = []
+        for type_element, contenu in self.elements:
+            if type_element == "texte":
+                resultat.append(contenu)
+            elif type_element == "champ":
+                resultat.append(self.Get_champ(contenu, dictValeurs))
+            else:
+                # La solution d'une formule peut elle-même contenir des champs
+                solution = ResolveurFormule(contenu, [], dictValeurs)
+                resultat.append(CompilerTexte(solution).Resoudre(dictValeurs) if "{" in solution else solution)
+        return "".join(resultat)
+
+    def Get_champ(self, champ="", dictValeurs={}):
+        if champ in dictValeurs:
+            return FormaterValeur(dictValeurs[champ])
+        # Les mots-clés non utilisés sont remplacés par des chaînes vides
+        if REGEX_CHAMP_INCONNU.fullmatch(champ):
+            return ""
+        return champ
+
+
+DICT_GABARITS = {}
+
+def CompilerTexte(texte=u""):
+    """ Renvoie le gabarit compilé d'un texte (mémorisé pour les appels suivants) """
+    gabarit = DICT_GABARITS.get(texte)
+    if gabarit is None:
+        if len(DICT_GABARITS) > 5000:
+            DICT_GABARITS.clear()
+        gabarit = GabaritTexte(texte)
+        DICT_GABARITS[texte] = gabarit
+    return gabarit
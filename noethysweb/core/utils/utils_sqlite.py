@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2019-2021 Ivan LUCAS.
+#  Noethysweb, application de gestion multi-activités.
+#  Distribué sous licence GNU GPL.
+
+import logging, time
+logger = logging.getLogger(__name__)
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction, DEFAULT_DB_ALIAS, OperationalError
+
+# Profil de production : le journal WAL permet aux lectures de continuer pendant une écriture
+PRAGMAS_DEFAUT = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 20000,
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64 * 1024,
+    "temp_store": "MEMORY",
+}
+
+# Attente minimale (en secondes) d'un verrou en écriture pour être mémorisée dans les statistiques
+SEUIL_ATTENTE = 0.05
+
+CLE_STATISTIQUES = "sqlite_verrous"
+
+
+def Get_pragmas():
+    """ Renvoie les pragmas appliqués à chaque connexion (SQLITE_PRAGMAS dans les settings pour les modifier, None pour en retirer un) """
+    pragmas = dict(PRAGMAS_DEFAUT, **getattr(settings, "SQLITE_PRAGMAS", {}))
+    return {nom: valeur for nom, valeur in pragmas.items() if valeur is not None}
+
+
+def Configurer_connexion(connection=None):
+    """ Applique les pragmas du profil de production à une nouvelle connexion SQLite """
+    if connection.vendor != "sqlite" or not getattr(settings, "SQLITE_PROFIL_PRODUCTION", True):
+        return
+    with connection.cursor() as cursor:
+        for nom, valeur in Get_pragmas().items():
+            cursor.execute("PRAGMA %s=%s;" % (nom, valeur))
+    if Surveiller_requete not in connection.execute_wrappers:
+        connection.execute_wrappers.append(Surveiller_requete)
+
+
+def Surveiller_requete(execute, sql, params, many, context):
+    """ Comptabilise les requêtes abandonnées parce que la base est restée verrouillée trop longtemps """
+    chrono = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    except OperationalError as err:
+        if "locked" in str(err) or "busy" in str(err):
+            Enregistrer_attente("base verrouillée", time.perf_counter() - chrono, echec=True)
+            logger.warning("Base de données verrouillée après %.1fs : %s" % (time.perf_counter() - chrono, sql[:200]))
+        raise
+
+
+@contextmanager
+def Transaction_ecriture(label="", using=None):
+    """ Transaction courte qui réserve immédiatement le verrou en écriture (BEGIN IMMEDIATE) et mesure l'attente de ce verrou """
+    connection = connections[using or DEFAULT_DB_ALIAS]
+
+    # Hors SQLite ou dans une transaction déjà ouverte, une transaction classique suffit
+    if connection.vendor != "sqlite" or connection.in_atomic_block:
+        with transaction.atomic(using=using):
+            yield
+        return
+
+    # Une transaction différée qui commence par lire peut échouer immédiatement sans attendre
+    # si un autre processus écrit entre-temps : le verrou est donc demandé dès l'ouverture
+    connection.ensure_connection()
+    connection._start_transaction_under_autocommit = lambda: connection.cursor().execute("BEGIN IMMEDIATE")
+    atomic = transaction.atomic(using=using)
+    chrono = time.perf_counter()
+    try:
+        atomic.__enter__()
+    finally:
+        del connection._start_transaction_under_autocommit
+    Enregistrer_attente(label, time.perf_counter() - chrono)
+
+    try:
+        yield
+    except BaseException as err:
+        if not atomic.__exit__(type(err), err, err.__traceback__):
+            raise
+    else:
+        atomic.__exit__(None, None, None)
+
+
+# ------------------------------ Statistiques -------------------------------
+
+def Enregistrer_attente(label="", duree=0.0, echec=False):
+    """ Mémorise une attente de verrou dans le cache partagé entre les processus """
+    if duree < SEUIL_ATTENTE and not echec:
+        return
+    # Statistiques indicatives : deux processus simultanés peuvent perdre une mesure
+    statistiques = cache.get(CLE_STATISTIQUES) or {}
+    stats = statistiques.setdefault(label or "autre", {"nbre": 0, "duree": 0.0, "max": 0.0, "echecs": 0, "derniere": None})
+    stats["nbre"] += 1
+    stats["duree"] += duree
+    stats["max"] = max(stats["max"], duree)
+    stats["echecs"] += 1 if echec else 0
+    stats["derniere"] = time.time()
+    cache.set(CLE_STATISTIQUES, statistiques, timeout=None)
+
+
+def Get_statistiques():
+    """ Renvoie les statistiques des attentes de verrou {label: {nbre, duree, max, echecs, derniere}} """
+    return cache.get(CLE_STATISTIQUES) or {}
+
+
+def Reinitialiser_statistiques():
+    cache.delete(CLE_STATISTIQUES)
+
+
+def Get_etat(using=None):
+    """ Renvoie la valeur actuelle des pragmas de la connexion """
+    connection = connections[using or DEFAULT_DB_ALIAS]
+    etat = {}
+    with connection.cursor() as cursor:
+        for nom in list(PRAGMAS_DEFAUT.keys()) + ["wal_autocheckpoint", "page_size", "page_count", "freelist_count"]:
+            cursor.execute("PRAGMA %s;" % nom)
+            ligne = cursor.fetchone()
+            etat[nom] = ligne[0] if ligne else None
+    return etat
+
+
+def Sonder(nbre=5, pause=0.2, using=None):
+    """ Mesure le temps d'obtention du verrou en écriture sur plusieurs essais (sans rien modifier) """
+    durees = []
+    for index in range(nbre):
+        chrono = time.perf_counter()
+        with Transaction_ecriture(label="sonde", using=using):
+            durees.append(time.perf_counter() - chrono)
+        time.sleep(pause)
+    return durees
@@ -12,7 +12,7 @@ from django.conf import settings
 from django.core.cache import cache
 from core.views.menu import GetMenuPrincipal
 from core.models import Organisateur, Parametre, Utilisateur, PortailMessage, PortailRenseignement, Structure, Activite, Famille, Inscription
-from core.utils import utils_parametres
+from core.utils import utils_parametres, utils_cache, utils_conversations
 from noethysweb.version import GetVersion
 from django.db.models import OuterRef, Subquery
 from django.utils import timezone
@@ -110,10 +110,7 @@ class CustomView(LoginRequiredMixin, UserPassesTestMixin): #, PermissionRequired
         context['version_application'] = cache.get_or_set('version_application', GetVersion())
 
         # Organisateur
-        organisateur = cache.get('organisateur')
-        if not organisateur:
-            organisateur = Organisateur.objects.filter(pk=1).first()
-            cache.set('organisateur', organisateur)
+        organisateur = utils_cache.Get_organisateur()
         context['organisateur'] = organisateur
 
         # Options d'interface
@@ -154,53 +151,10 @@ class CustomView(LoginRequiredMixin, UserPassesTestMixin): #, PermissionRequired
         if context['menu_actif'] is not None:
             context['breadcrumb'] = context['menu_actif'].GetBreadcrumb()
 
-        # Date limite : 3 mois
-        date_limite = timezone.now() - timedelta(days=90)
-
-        # Messages non lus pour toutes les structures de l'utilisateur
-        messages_non_lus = PortailMessage.objects.filter(
-            structure__in=self.request.user.structures.all(),
-            utilisateur__isnull=True,
-            date_lecture__isnull=True
-        )
-
-        dernier_messages_non_lus_ids = (
-            messages_non_lus
-            .values('famille_id', 'structure_id')
-            .annotate(dernier_id=Max('idmessage'))
-            .values_list('dernier_id', flat=True)
-        )
-
-        # Obtenir les couples famille+structure ayant un message non lu
-        couples_non_lus = messages_non_lus.values_list('famille_id', 'structure_id')
-
-        # Dernier message par famille+structure dans les 3 derniers mois
-        dernier_messages = (
-            PortailMessage.objects
-            .filter(
-                structure__in=self.request.user.structures.all(),
-                date_creation__gte=date_limite
-            )
-            # Exclure les couples qui ont un message non lu
-            .exclude(
-                Q(famille_id__in=[f for f, s in couples_non_lus]) &
-                Q(structure_id__in=[s for f, s in couples_non_lus])
-            )
-            .values('famille_id', 'structure_id')
-            .annotate(dernier_id=Max('idmessage'))
-            .values_list('dernier_id', flat=True)
-        )
-
-        # Récupérer les objets complets
-        context["liste_messages_lus"] = PortailMessage.objects.filter(
-            idmessage__in=dernier_messages
-        ).select_related('famille', 'structure').order_by('-date_creation')
-
-        # Messages non lus
-        context["liste_messages_non_lus"] = PortailMessage.objects.filter(
-            idmessage__in=dernier_messages_non_lus_ids
-        ).select_related('famille', 'structure').order_by('-date_creation')
-
+        # Messages du portail : dernier message de chaque conversation (résumés tenus à jour par core.signals)
+        structures = self.request.user.structures.all()
+        context["liste_messages_non_lus"] = utils_conversations.Get_messages_non_lus(structures=structures)
+        context["liste_messages_lus"] = utils_conversations.Get_messages_lus(structures=structures)
 
         # Filtrage
         structures = self.request.user.structures.all()
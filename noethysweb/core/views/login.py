@@ -18,6 +18,7 @@ from django.urls import reverse, reverse_lazy
 
 from core.forms.login import FormLoginUtilisateur
 from core.models import Organisateur, Utilisateur
+from core.utils import utils_cache
 from noethysweb.version import GetVersion
 
 logger = logging.getLogger(__name__)
@@ -35,10 +36,7 @@ class ClassCommuneLogin:
         )
 
         # Organisateur
-        organisateur = cache.get("organisateur")
-        if not organisateur:
-            organisateur = Organisateur.objects.filter(pk=1).first()
-            cache.set("organisateur", organisateur)
+        organisateur = utils_cache.Get_organisateur()
         context["organisateur"] = organisateur
 
         # Recherche de l'image de fond
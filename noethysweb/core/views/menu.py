@@ -6,9 +6,33 @@
 import copy, importlib
 from django.urls import reverse_lazy
 from django.conf import settings
+from core.utils import utils_cache
+
+# Menus déjà construits par ce processus, indexés par utilisateur et jeton de version des permissions
+DICT_MENUS = {}
+# Nombre maximal de menus mémorisés par processus
+MAX_MENUS = 500
 
 
 def GetMenuPrincipal(organisateur=None, user=None):
+    """ Renvoie le menu principal de l'utilisateur, construit une seule fois par version des permissions """
+    if user and not user.is_authenticated:
+        return ConstruireMenuPrincipal(organisateur=organisateur, user=user)
+
+    # Le jeton de version est partagé entre les processus et renouvelé à chaque modification des permissions.
+    # Aléatoire, il ne retombe jamais sur une ancienne version si sa clé est purgée du cache
+    cle = (user.pk if user else None, bool(organisateur), utils_cache.Get_version("menus"))
+    menu = DICT_MENUS.get(cle, None)
+    if not menu:
+        if len(DICT_MENUS) >= MAX_MENUS:
+            DICT_MENUS.clear()
+        menu = ConstruireMenuPrincipal(organisateur=organisateur, user=user)
+        DICT_MENUS[cle] = menu
+    return menu
+
+
+def ConstruireMenuPrincipal(organisateur=None, user=None):
+    """ Construit l'arborescence complète du menu principal selon les permissions de l'utilisateur """
     menu = Menu(titre="", user=user)
 
     # ------------------------------------ Accueil ------------------------------------
@@ -532,6 +556,8 @@ def GetMenuPrincipal(organisateur=None, user=None):
                 suppressions_rubriques.append(rubrique)
         [menu.children.remove(item) for item in suppressions_rubriques]
 
+    # Le menu étant partagé entre les requêtes, il ne conserve plus de référence à l'utilisateur
+    menu.Indexer()
     return menu
 
 
@@ -549,6 +575,7 @@ class Menu():
         self.user = user
         self.toujours_afficher = toujours_afficher
         self.compatible_demo = compatible_demo
+        self.index = None
 
     def __repr__(self):
         return "<Menu '%s'>" % self.titre
@@ -586,7 +613,21 @@ class Menu():
     def HasChildren(self):
         return len(self.children) > 0
 
+    def Indexer(self):
+        """ Crée l'index code -> menu utilisé par Find """
+        self.index = {}
+        def boucle(children):
+            for child in children:
+                child.user = None
+                self.index.setdefault(child.code, child)
+                boucle(child.children)
+        self.user = None
+        boucle(self.children)
+
     def Find(self, code=""):
+        if self.index is not None:
+            return self.index.get(code, None)
+
         def boucle(children):
             for child in children:
                 if child.code == code:
@@ -6,7 +6,7 @@
 import logging
 logger = logging.getLogger(__name__)
 import datetime
-from core.utils import utils_infos_individus, utils_texte, utils_conversion, utils_dates, utils_questionnaires
+from core.utils import utils_impression, utils_infos_individus, utils_texte, utils_conversion, utils_dates, utils_questionnaires
 from core.models import Cotisation, Prestation, Ventilation, Inscription
 from django.db.models import Sum
 from decimal import Decimal
@@ -186,11 +186,8 @@ class Cotisations():
         noms_fichiers = {}
         if mode_email:
             logger.debug("Création des PDF des factures à l'unité...")
-            impression = utils_impression_cotisation.Impression(dict_options=dict_options, IDmodele=dict_options["modele"].pk, generation_auto=False)
-            for IDcotisation, dictCotisation in dict_cotisations.items():
-                logger.debug("Création du PDF de la cotisation ID%d..." % IDcotisation)
-                impression.Generation_document(dict_donnees={IDcotisation: dictCotisation})
-                noms_fichiers[IDcotisation] = {"nom_fichier": impression.Get_nom_fichier(), "valeurs": impression.Get_champs_fusion_pour_email("cotisation", IDcotisation)}
+            noms_fichiers = utils_impression.Generation_documents_lot(classe_impression=utils_impression_cotisation.Impression, dict_documents=dict_cotisations, dict_options=dict_options,
+                                                                     IDmodele=dict_options["modele"].pk, categorie="cotisation")
 
         # Fabrication du PDF global
         nom_fichier = None
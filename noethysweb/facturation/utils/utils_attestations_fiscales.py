@@ -6,7 +6,7 @@
 import logging, json, copy
 logger = logging.getLogger(__name__)
 from core.models import AttestationFiscale, Rattachement
-from core.utils import utils_dates, utils_conversion, utils_impression, utils_infos_individus, utils_questionnaires, utils_texte
+from core.utils import utils_dates, utils_conversion, utils_impression, utils_infos_individus, utils_questionnaires, utils_texte, utils_db
 from facturation.utils import utils_impression_attestation_fiscale
 
 
@@ -33,7 +33,7 @@ class Facturation():
 
     def GetDonneesImpression(self, liste_attestations_fiscales=[], dict_options=None):
         """ Impression des attestations fiscales """
-        attestations_fiscales = AttestationFiscale.objects.select_related('famille', 'lot').filter(pk__in=liste_attestations_fiscales)
+        attestations_fiscales = list(utils_db.Iterer_par_paquets(AttestationFiscale.objects.select_related('famille', 'lot'), "pk", liste_attestations_fiscales))
         if not attestations_fiscales:
             return False
 
@@ -45,7 +45,7 @@ class Facturation():
         infosIndividus = utils_infos_individus.Informations(liste_familles=liste_idfamille)
 
         # Importation des individus
-        dict_individus = {rattachement.individu.pk: rattachement.individu for rattachement in Rattachement.objects.select_related("individu").filter(famille_id__in=liste_idfamille)}
+        dict_individus = {rattachement.individu.pk: rattachement.individu for rattachement in utils_db.Iterer_par_paquets(Rattachement.objects.select_related("individu"), "famille_id", liste_idfamille)}
 
         # Récupération des mots-clés par défaut
         dict_motscles_defaut = utils_impression.Get_motscles_defaut()
@@ -119,11 +119,8 @@ class Facturation():
         noms_fichiers = {}
         if mode_email:
             logger.debug("Création des PDF des attestations à l'unité...")
-            impression = utils_impression_attestation_fiscale.Impression(dict_options=dict_options, IDmodele=dict_options["modele"].pk, generation_auto=False)
-            for IDattestation, dictAttestation in dictAttestations.items():
-                logger.debug("Création du PDF de l'attestation fiscale ID%d..." % IDattestation)
-                impression.Generation_document(dict_donnees={IDattestation: dictAttestation})
-                noms_fichiers[IDattestation] = {"nom_fichier": impression.Get_nom_fichier(), "valeurs": impression.Get_champs_fusion_pour_email("attestation_fiscale", IDattestation)}
+            noms_fichiers = utils_impression.Generation_documents_lot(classe_impression=utils_impression_attestation_fiscale.Impression, dict_documents=dictAttestations, dict_options=dict_options,
+                                                                     IDmodele=dict_options["modele"].pk, categorie="attestation_fiscale")
 
         # Fabrication du PDF global
         nom_fichier = None
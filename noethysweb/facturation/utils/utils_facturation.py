@@ -9,7 +9,7 @@ from decimal import Decimal
 from django.db.models import Q, Sum
 from core.models import Prestation, Ventilation, Deduction, Consommation, Reglement, Agrement, Facture, Quotient, PesPiece, Prelevements, Note
 from core.data import data_codes_etab
-from core.utils import utils_preferences, utils_dates, utils_conversion, utils_impression, utils_infos_individus, utils_questionnaires, utils_texte
+from core.utils import utils_preferences, utils_dates, utils_conversion, utils_impression, utils_infos_individus, utils_questionnaires, utils_texte, utils_db
 from facturation.utils import utils_impression_facture
 from facturation.utils.utils_export_pes import Get_cle_modulo_23
 
@@ -62,10 +62,7 @@ class Facturation():
         """ Recherche des factures à créer """
         logger.debug("Recherche les données de facturation...")
 
-        dictFactures = {}
-        if liste_factures:
-            for facture in Facture.objects.filter(idfacture__in=liste_factures):
-                dictFactures[facture.pk] = facture
+        dictFactures = utils_db.Get_dict_par_paquets(Facture.objects.all(), liste_factures)
 
         # En cas d'intégration des prestations antérieures
         date_debut_temp = date_debut
@@ -73,9 +70,7 @@ class Facturation():
             date_debut_temp = date_anterieure
 
         # Recherche des prestations de la période
-        if liste_factures:
-            conditions = Q(facture_id__in=liste_factures)
-        else:
+        if not liste_factures:
             conditions = (Q(activite__in=liste_activites) | Q(activite=None)) & Q(date__gte=date_debut_temp) & Q(date__lte=date_fin) & Q(categorie__in=categories_prestations)
             # Filtre facture
             if mode == "facture": conditions &= Q(facture_id=None)
@@ -99,32 +94,32 @@ class Facturation():
                     conditions &= ~Q(label__icontains=nom_prestation.strip())
 
         logger.debug("Recherche des prestations des factures...")
-        prestations = Prestation.objects.select_related('famille', 'activite', 'individu', 'tarif', 'categorie_tarif', "tarif__nom_tarif").filter(conditions).order_by("date")
+        prestations = Prestation.objects.select_related('famille', 'activite', 'individu', 'tarif', 'categorie_tarif', "tarif__nom_tarif").order_by("date")
+        if liste_factures:
+            prestations = sorted(utils_db.Iterer_par_paquets(prestations, "facture_id", liste_factures), key=lambda prestation: prestation.date)
+        else:
+            prestations = list(prestations.filter(conditions))
 
         # Créé la liste des familles concernées
-        liste_familles = []
-        liste_familles_has_prestations_activite = []
-        for prestation in prestations:
-            if prestation.famille_id not in liste_familles:
-                liste_familles.append(prestation.famille_id)
-            if prestation.categorie == "consommation" and prestation.famille_id not in liste_familles_has_prestations_activite:
-                liste_familles_has_prestations_activite.append(prestation.famille_id)
+        liste_familles = list({prestation.famille_id: None for prestation in prestations})
+        liste_familles_has_prestations_activite = {prestation.famille_id for prestation in prestations if prestation.categorie == "consommation"}
 
         # Importation des notes à afficher sur la facture
         dict_notes = {}
-        for note in Note.objects.filter(afficher_facture=True, famille_id__in=liste_familles):
+        for note in utils_db.Iterer_par_paquets(Note.objects.filter(afficher_facture=True), "famille_id", liste_familles):
             dict_notes.setdefault(note.famille_id, [])
             dict_notes[note.famille_id].append(note)
 
         # Recherche de la ventilation des prestations
+        logger.debug("Recherche des ventilations des factures...")
+        ventilations = Ventilation.objects.select_related('prestation', 'reglement__payeur', 'reglement__mode', 'reglement__emetteur')
         if liste_factures:
-            conditions = Q(prestation__facture__in=liste_factures)
+            ventilations = utils_db.Iterer_par_paquets(ventilations, "prestation__facture_id", liste_factures)
         else:
             conditions = (Q(prestation__activite__in=liste_activites) | Q(prestation__activite=None)) & Q(prestation__date__gte=date_debut_temp) & Q(prestation__date__lte=date_fin)
             if mode == "facture":
                 conditions &= Q(prestation__facture_id=None)
-        logger.debug("Recherche des ventilations des factures...")
-        ventilations = Ventilation.objects.select_related('prestation', 'reglement__payeur', 'reglement__mode', 'reglement__emetteur').filter(conditions)
+            ventilations = ventilations.filter(conditions)
 
         dictVentilationPrestations = {}
         dictReglements = {}
@@ -158,7 +153,7 @@ class Facturation():
             conditions &= (Q(activite__in=liste_activites) | Q(activite=None)) & Q(date__lte=date_debut)
         if impayes_factures:
             conditions &= Q(facture__isnull=False)
-        prestations_reports = Prestation.objects.filter(conditions, famille_id__in=liste_familles)
+        prestations_reports = list(utils_db.Iterer_par_paquets(Prestation.objects.filter(conditions), "famille_id", liste_familles))
 
         # Recherche de la ventilation des reports
         if not liste_factures:
@@ -166,7 +161,7 @@ class Facturation():
         else:
             conditions = Q()
         logger.debug("Recherche de la ventilation des reports...")
-        ventilations_reports = Ventilation.objects.values('prestation').filter(conditions, famille_id__in=liste_familles).annotate(total=Sum("montant"))
+        ventilations_reports = utils_db.Iterer_par_paquets(Ventilation.objects.values('prestation').filter(conditions).annotate(total=Sum("montant")), "famille_id", liste_familles)
 
         dictVentilationReports = {}
         for ventilation in ventilations_reports:
@@ -174,10 +169,9 @@ class Facturation():
         
         # Recherche des déductions
         if liste_factures:
-            conditions = Q(prestation__facture__in=liste_factures)
+            deductions = utils_db.Iterer_par_paquets(Deduction.objects.all(), "prestation__facture_id", liste_factures)
         else:
-            conditions = Q()
-        deductions = Deduction.objects.filter(conditions)
+            deductions = Deduction.objects.all()
 
         dictDeductions = {}
         for deduction in deductions:
@@ -190,7 +184,7 @@ class Facturation():
         else:
             conditions = Q()
         logger.debug("Recherche des consommations...")
-        consommations = Consommation.objects.filter(conditions, inscription__famille_id__in=liste_familles)
+        consommations = utils_db.Iterer_par_paquets(Consommation.objects.filter(conditions), "inscription__famille_id", liste_familles)
 
         dictConsommations = {}
         for consommation in consommations:
@@ -200,13 +194,13 @@ class Facturation():
 
         # Recherche du solde du compte
         logger.debug("Recherche du total des prestations pour chaque facture...")
-        total_prestations = Prestation.objects.values('famille').filter(famille_id__in=liste_familles).annotate(total=Sum("montant"))
+        total_prestations = utils_db.Iterer_par_paquets(Prestation.objects.values('famille').annotate(total=Sum("montant")), "famille_id", liste_familles)
 
         dict_prestations = {}
         for dict_temp in total_prestations:
             dict_prestations[dict_temp["famille"]] = dict_temp["total"]
         logger.debug("Recherche du total des règlements pour chaque facture...")
-        total_reglements = Reglement.objects.values('famille').filter(famille_id__in=liste_familles).annotate(total=Sum("montant"))
+        total_reglements = utils_db.Iterer_par_paquets(Reglement.objects.values('famille').annotate(total=Sum("montant")), "famille_id", liste_familles)
 
         dict_reglements = {}
         for dict_temp in total_reglements:
@@ -536,15 +530,15 @@ class Facturation():
     def GetDonneesImpression(self, liste_factures=[], dict_options=None):
         """ Impression des factures """
         logger.debug("Recherche toutes les factures...")
-        factures = Facture.objects.select_related("lot").filter(idfacture__in=liste_factures)
+        factures = list(utils_db.Iterer_par_paquets(Facture.objects.select_related("lot"), "idfacture", liste_factures))
         if not factures:
             return False
 
         # Prélèvements
-        dict_prelevements = {prelevement.facture_id: prelevement for prelevement in Prelevements.objects.select_related("lot", "lot__modele__compte", "mandat").filter(facture_id__in=liste_factures)}
+        dict_prelevements = {prelevement.facture_id: prelevement for prelevement in utils_db.Iterer_par_paquets(Prelevements.objects.select_related("lot", "lot__modele__compte", "mandat"), "facture_id", liste_factures)}
 
         # Infos PES ORMC
-        dict_pes = {piece.facture_id: piece for piece in PesPiece.objects.select_related("lot", "lot__modele", "lot__modele__compte", "prelevement_mandat").filter(facture_id__in=liste_factures)}
+        dict_pes = {piece.facture_id: piece for piece in utils_db.Iterer_par_paquets(PesPiece.objects.select_related("lot", "lot__modele", "lot__modele__compte", "prelevement_mandat"), "facture_id", liste_factures)}
 
         # Recherche la liste des familles concernées
         liste_idfamille = [facture.famille_id for facture in factures]
@@ -697,11 +691,8 @@ class Facturation():
         noms_fichiers = {}
         if mode_email:
             logger.debug("Création des PDF des factures à l'unité...")
-            impression = utils_impression_facture.Impression(dict_options=dict_options, IDmodele=dict_options["modele"].pk, generation_auto=False)
-            for IDfacture, dictFacture in dictFactures.items():
-                logger.debug("Création du PDF de la facture ID%d..." % IDfacture)
-                impression.Generation_document(dict_donnees={IDfacture: dictFacture})
-                noms_fichiers[IDfacture] = {"nom_fichier": impression.Get_nom_fichier(), "valeurs": impression.Get_champs_fusion_pour_email("facture", IDfacture)}
+            noms_fichiers = utils_impression.Generation_documents_lot(classe_impression=utils_impression_facture.Impression, dict_documents=dictFactures, dict_options=dict_options,
+                                                                     IDmodele=dict_options["modele"].pk, categorie="facture")
 
         # Fabrication du PDF global
         nom_fichier = None
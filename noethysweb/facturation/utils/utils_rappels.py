@@ -9,7 +9,7 @@ import datetime
 from django.db.models import Q, Sum, Min, Max
 from core.models import Prestation, Ventilation, Famille, Rappel
 from decimal import Decimal
-from core.utils import utils_dates, utils_conversion, utils_impression, utils_infos_individus, utils_questionnaires, utils_texte
+from core.utils import utils_dates, utils_conversion, utils_impression, utils_infos_individus, utils_questionnaires, utils_texte, utils_db
 from facturation.utils import utils_impression_rappel
 
 
@@ -49,8 +49,8 @@ class Facturation():
             if selection_familles["filtre"] == "ABSENT_LOT_FACTURES":
                 conditions &= ~Q(facture__lot=selection_familles["lot_factures"])
 
-        prestations = Prestation.objects.values('famille').filter(conditions).annotate(total=Sum("montant"), date_min=Min("date"), date_max=Max("date"))
-        dict_familles = {famille.pk: famille for famille in Famille.objects.all()} #filter(pk__in=liste_idfamille)} # Modifié pour éviter bug "too many SQL variables"
+        prestations = list(Prestation.objects.values('famille').filter(conditions).annotate(total=Sum("montant"), date_min=Min("date"), date_max=Max("date")))
+        dict_familles = utils_db.Get_dict_par_paquets(Famille.objects.all(), [dict_prestation["famille"] for dict_prestation in prestations])
 
         # Récupération de la ventilation
         conditions = (Q(prestation__activite__in=liste_activites) | Q(prestation__activite=None)) & Q(prestation__date__lte=date_reference)
@@ -116,7 +116,7 @@ class Facturation():
 
     def GetDonneesImpression(self, liste_rappels=[], dict_options=None):
         """ Impression des rappels """
-        rappels = Rappel.objects.select_related('famille', 'lot').filter(pk__in=liste_rappels)
+        rappels = list(utils_db.Iterer_par_paquets(Rappel.objects.select_related('famille', 'lot'), "pk", liste_rappels))
         if not rappels:
             return False
 
@@ -207,11 +207,8 @@ class Facturation():
         noms_fichiers = {}
         if mode_email:
             logger.debug("Création des PDF des rappels à l'unité...")
-            impression = utils_impression_rappel.Impression(dict_options=dict_options, IDmodele=dict_options["modele"].pk, generation_auto=False)
-            for IDrappel, dictRappel in dictRappels.items():
-                logger.debug("Création du PDF du rappel ID%d..." % IDrappel)
-                impression.Generation_document(dict_donnees={IDrappel: dictRappel})
-                noms_fichiers[IDrappel] = {"nom_fichier": impression.Get_nom_fichier(), "valeurs": impression.Get_champs_fusion_pour_email("rappel", IDrappel)}
+            noms_fichiers = utils_impression.Generation_documents_lot(classe_impression=utils_impression_rappel.Impression, dict_documents=dictRappels, dict_options=dict_options,
+                                                                     IDmodele=dict_options["modele"].pk, categorie="rappel")
 
         # Fabrication du PDF global
         nom_fichier = None
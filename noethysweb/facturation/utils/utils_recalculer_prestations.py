@@ -3,23 +3,114 @@
 #  Noethysweb, application de gestion multi-activités.
 #  Distribué sous licence GNU GPL.
 
-import logging
+import logging, os, time, multiprocessing
 logger = logging.getLogger(__name__)
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from django.conf import settings
+from django.db import connection, connections
 from django.db.models import Q, Count
-from core.models import Prestation
+from core.models import Prestation, Inscription
+from core.utils import utils_sqlite
 from consommations.utils.utils_grille_virtuelle import Grille_virtuelle
 
+# Nombre d'inscriptions recalculées dans une même grille virtuelle (les inscriptions d'une famille ne sont jamais séparées)
+TAILLE_PAQUET = 50
 
-def Recalculer(request=None, date_debut=None, date_fin=None):
-    # Recherche les prestations de la période
-    condition = Q(date__gte=date_debut, date__lte=date_fin, categorie="consommation", activite__isnull=False)
-    prestations = Prestation.objects.filter(condition).values("famille_id", "individu_id", "activite_id").annotate(nbre_prestations=Count("idprestation"))
 
-    # Recalcul dans la grille virtuelle
-    logger.debug("Lancement procédure de recalcul des prestations %s > %s ..." % (date_debut, date_fin))
-    for prestation in prestations:
-        logger.debug("Recalculer des prestations : famille ID%d | individu ID%d | activite ID%d" % (prestation["famille_id"], prestation["individu_id"], prestation["activite_id"]))
-        grille = Grille_virtuelle(request=request, idfamille=prestation["famille_id"], idindividu=prestation["individu_id"], idactivite=prestation["activite_id"], date_min=date_debut, date_max=date_fin)
+def Get_paquets(inscriptions=[]):
+    """ Regroupe les inscriptions par activité puis en paquets de familles complètes : [(IDactivite, [IDinscription, ...]), ...] """
+    dict_familles = {}
+    for inscription in inscriptions:
+        dict_familles.setdefault(inscription.activite_id, {}).setdefault(inscription.famille_id, []).append(inscription.pk)
+
+    paquets = []
+    for idactivite, familles in dict_familles.items():
+        paquet = []
+        for idfamille, liste_idinscriptions in familles.items():
+            paquet.extend(liste_idinscriptions)
+            if len(paquet) >= TAILLE_PAQUET:
+                paquets.append((idactivite, paquet))
+                paquet = []
+        if paquet:
+            paquets.append((idactivite, paquet))
+    return paquets
+
+
+def Recalculer_paquet(request=None, idactivite=None, liste_idinscriptions=[], date_debut=None, date_fin=None):
+    """ Recalcule et enregistre les prestations d'un paquet d'inscriptions d'une activité dans une seule transaction d'écriture """
+    chrono = time.time()
+    inscriptions = Inscription.objects.select_related("individu", "activite", "groupe", "famille", "categorie_tarif").filter(pk__in=liste_idinscriptions).order_by("pk")
+    # Le verrou en écriture est réservé avant la lecture de la grille : une transaction différée
+    # échouerait immédiatement ("database is locked") si un autre processus écrivait entre-temps
+    with utils_sqlite.Transaction_ecriture(label="recalcul"):
+        grille = Grille_virtuelle(request=request, idactivite=idactivite, date_min=date_debut, date_max=date_fin, inscriptions=inscriptions)
         grille.Recalculer_tout()
         grille.Enregistrer()
-    logger.debug("Fin de la procédure de recalcul des prestations.")
+    logger.debug("Recalcul des prestations : activité ID%d | %d inscriptions en %.2fs" % (idactivite, len(liste_idinscriptions), time.time() - chrono))
+    return len(liste_idinscriptions)
+
+
+def Recalculer_paquets(request=None, paquets=[], date_debut=None, date_fin=None):
+    """ Recalcule une liste de paquets et renvoie le nombre d'inscriptions traitées et le nombre d'erreurs """
+    nbre_inscriptions, nbre_erreurs = 0, 0
+    for idactivite, liste_idinscriptions in paquets:
+        try:
+            nbre_inscriptions += Recalculer_paquet(request=request, idactivite=idactivite, liste_idinscriptions=liste_idinscriptions, date_debut=date_debut, date_fin=date_fin)
+        except Exception as err:
+            nbre_erreurs += 1
+            logger.error("Erreur lors du recalcul des prestations de l'activité ID%d (inscriptions %s) : %s" % (idactivite, liste_idinscriptions, err), exc_info=True)
+    return nbre_inscriptions, nbre_erreurs
+
+
+def Get_nbre_processus(nbre_processus=None, nbre_paquets=0):
+    """ Renvoie le nombre de processus à utiliser """
+    # SQLite n'accepte qu'une écriture à la fois : les processus s'attendraient mutuellement
+    if connection.vendor == "sqlite" or "fork" not in multiprocessing.get_all_start_methods():
+        return 1
+    if not nbre_processus:
+        nbre_processus = getattr(settings, "RECALCUL_NBRE_PROCESSUS", None) or os.cpu_count() or 1
+    return max(min(nbre_processus, nbre_paquets), 1)
+
+
+def Recalculer(request=None, date_debut=None, date_fin=None, idactivite=None, selections=None, nbre_processus=None):
+    """ Recalcule les prestations de la période. selections = [{"idfamille": 1, "idindividu": 2}, ...] pour limiter à certains individus de l'activité """
+    chrono = time.time()
+
+    if selections is not None:
+        # Individus sélectionnés de l'activité
+        triplets = {(int(selection["idfamille"]), int(selection["idindividu"]), int(idactivite)) for selection in selections}
+    else:
+        # Recherche les prestations de la période
+        condition = Q(date__gte=date_debut, date__lte=date_fin, categorie="consommation", activite__isnull=False)
+        if idactivite:
+            condition &= Q(activite_id=idactivite)
+        prestations = Prestation.objects.filter(condition).values("famille_id", "individu_id", "activite_id").annotate(nbre_prestations=Count("idprestation"))
+        triplets = {(prestation["famille_id"], prestation["individu_id"], prestation["activite_id"]) for prestation in prestations}
+
+    # Recherche des inscriptions correspondantes
+    conditions = Q(activite__in={triplet[2] for triplet in triplets})
+    if selections is not None:
+        conditions &= Q(famille__in={triplet[0] for triplet in triplets}, individu__in={triplet[1] for triplet in triplets})
+    inscriptions = [inscription for inscription in Inscription.objects.filter(conditions).order_by("activite", "famille", "individu", "pk")
+                    if (inscription.famille_id, inscription.individu_id, inscription.activite_id) in triplets]
+    paquets = Get_paquets(inscriptions)
+
+    # Les paquets sont répartis sur plusieurs processus uniquement sans request (tâche planifiée ou commande)
+    nbre_processus = Get_nbre_processus(nbre_processus, len(paquets)) if not request else 1
+    logger.debug("Lancement procédure de recalcul des prestations %s > %s : %d inscriptions en %d paquets sur %d processus..." % (date_debut, date_fin, len(inscriptions), len(paquets), nbre_processus))
+
+    if nbre_processus > 1:
+        # Les connexions à la base ne doivent pas être partagées avec les processus fils
+        connections.close_all()
+        nbre_inscriptions, nbre_erreurs = 0, 0
+        with ProcessPoolExecutor(max_workers=nbre_processus, mp_context=multiprocessing.get_context("fork")) as executor:
+            futures = [executor.submit(Recalculer_paquets, None, [paquet], date_debut, date_fin) for paquet in paquets]
+            for future in as_completed(futures):
+                resultat = future.result()
+                nbre_inscriptions += resultat[0]
+                nbre_erreurs += resultat[1]
+    else:
+        nbre_inscriptions, nbre_erreurs = Recalculer_paquets(request=request, paquets=paquets, date_debut=date_debut, date_fin=date_fin)
+
+    logger.debug("Fin de la procédure de recalcul des prestations : %d inscriptions en %.2fs (%d erreurs)." % (nbre_inscriptions, time.time() - chrono, nbre_erreurs))
+    return {"nbre_inscriptions": nbre_inscriptions, "nbre_paquets": len(paquets), "nbre_erreurs": nbre_erreurs}
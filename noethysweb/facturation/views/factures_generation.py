@@ -10,7 +10,7 @@ from django.shortcuts import render
 from django.template import Template, RequestContext
 from core.models import Activite, Facture, Prestation, LotFactures, FiltreListe, ModeleImpression, PrefixeFacture
 from core.views.base import CustomView
-from core.utils import utils_dates, utils_parametres
+from core.utils import utils_dates, utils_parametres, utils_sqlite
 from facturation.utils import utils_facturation, utils_impression_facture
 from facturation.forms.factures_generation import Formulaire, Calc_prochain_numero
 
@@ -152,48 +152,50 @@ def Generation_factures(request):
     liste_factures_generees = []
     liste_id_factures = []
     dict_reports = {}
-    for dict_facture in liste_factures:
-        if dict_facture["IDfamille"] in liste_factures_cochees:
-            # Recherche de la régie associée
-            regie = None
-            if dict_facture["liste_activites"]:
-                regie = dict_regies.get(dict_facture["liste_activites"][0], None)
-
-            # Enregistrement de la facture
-            facture = Facture.objects.create(
-                prefixe=form.cleaned_data["prefixe"],
-                numero=numero,
-                famille_id=dict_facture["IDfamille"],
-                date_edition=form.cleaned_data["date_emission"],
-                date_echeance=form.cleaned_data["date_echeance"],
-                activites=";".join([str(x) for x in dict_facture["liste_activites"]]),
-                individus=";".join([str(x) for x in dict_facture["individus"].keys()]),
-                date_debut=form.cleaned_data["periode"].split(";")[0],
-                date_fin=form.cleaned_data["periode"].split(";")[1],
-                total=dict_facture["total"],
-                regle=dict_facture["ventilation"],
-                solde=dict_facture["solde"],
-                solde_actuel=dict_facture["solde"],
-                lot=form.cleaned_data["lot_factures"],
-                prestations=";".join(form.cleaned_data["categories"]),
-                regie=regie,
-                date_limite_paiement=form.cleaned_data["date_limite_paiement"],
-                modelimp=form.cleaned_data["modelimp"],
-            )
-            liste_factures_generees.append(facture)
-            liste_id_factures.append(facture.pk)
-            dict_reports[facture.pk] = {
-                "total_reports": dict_facture["total_reports"],
-                "solde_avec_reports": dict_facture["solde_avec_reports"],
-            }
-            numero += 1
-
-            # Insertion du IDfacture dans les prestations
-            liste_prestations_modifiees = []
-            for prestation in dict_facture["listePrestations"]:
-                prestation.facture = facture
-                liste_prestations_modifiees.append(prestation)
-            Prestation.objects.bulk_update(liste_prestations_modifiees, ["facture"])
+    # Les factures et leurs prestations sont enregistrées dans une seule transaction d'écriture
+    with utils_sqlite.Transaction_ecriture(label="generation_factures"):
+        for dict_facture in liste_factures:
+            if dict_facture["IDfamille"] in liste_factures_cochees:
+                # Recherche de la régie associée
+                regie = None
+                if dict_facture["liste_activites"]:
+                    regie = dict_regies.get(dict_facture["liste_activites"][0], None)
+
+                # Enregistrement de la facture
+                facture = Facture.objects.create(
+                    prefixe=form.cleaned_data["prefixe"],
+                    numero=numero,
+                    famille_id=dict_facture["IDfamille"],
+                    date_edition=form.cleaned_data["date_emission"],
+                    date_echeance=form.cleaned_data["date_echeance"],
+                    activites=";".join([str(x) for x in dict_facture["liste_activites"]]),
+                    individus=";".join([str(x) for x in dict_facture["individus"].keys()]),
+                    date_debut=form.cleaned_data["periode"].split(";")[0],
+                    date_fin=form.cleaned_data["periode"].split(";")[1],
+                    total=dict_facture["total"],
+                    regle=dict_facture["ventilation"],
+                    solde=dict_facture["solde"],
+                    solde_actuel=dict_facture["solde"],
+                    lot=form.cleaned_data["lot_factures"],
+                    prestations=";".join(form.cleaned_data["categories"]),
+                    regie=regie,
+                    date_limite_paiement=form.cleaned_data["date_limite_paiement"],
+                    modelimp=form.cleaned_data["modelimp"],
+                )
+                liste_factures_generees.append(facture)
+                liste_id_factures.append(facture.pk)
+                dict_reports[facture.pk] = {
+                    "total_reports": dict_facture["total_reports"],
+                    "solde_avec_reports": dict_facture["solde_avec_reports"],
+                }
+                numero += 1
+
+                # Insertion du IDfacture dans les prestations
+                liste_prestations_modifiees = []
+                for prestation in dict_facture["listePrestations"]:
+                    prestation.facture = facture
+                    liste_prestations_modifiees.append(prestation)
+                Prestation.objects.bulk_update(liste_prestations_modifiees, ["facture"])
 
     # Importation des factures générées
     id_min, id_max = min(liste_id_factures), max(liste_id_factures)
@@ -12,7 +12,7 @@ from core.views.base import CustomView
 from core.utils import utils_dates
 from core.models import Prestation
 from facturation.forms.recalculer_prestations import Formulaire
-from consommations.utils.utils_grille_virtuelle import Grille_virtuelle
+from facturation.utils import utils_recalculer_prestations
 
 
 def Recalculer(request):
@@ -23,13 +23,11 @@ def Recalculer(request):
     idactivite = request.POST.get("idactivite")
 
     # Traitement
-    logger.debug("Lancement procédure de recalcul des prestations...")
-    for selection in selections:
-        logger.debug("Recalcul des prestations pour %s..." % selection["0"])
-        grille = Grille_virtuelle(request=request, idfamille=selection["idfamille"], idindividu=selection["idindividu"], idactivite=idactivite, date_min=date_debut, date_max=date_fin)
-        grille.Recalculer_tout()
-        grille.Enregistrer()
-    logger.debug("Fin de la procédure de recalcul des prestations.")
+    resultat = utils_recalculer_prestations.Recalculer(request=request, date_debut=date_debut, date_fin=date_fin, idactivite=idactivite, selections=selections)
+
+    # Les erreurs d'un paquet n'interrompent pas le recalcul des autres mais doivent être signalées
+    if resultat["nbre_erreurs"]:
+        return JsonResponse({"erreur": "Le recalcul a échoué pour %d groupe(s) d'inscriptions sur %d (%d inscriptions recalculées). Consultez le journal des erreurs." % (resultat["nbre_erreurs"], resultat["nbre_paquets"], resultat["nbre_inscriptions"])}, status=401)
 
     return JsonResponse({"resultat": True})
 
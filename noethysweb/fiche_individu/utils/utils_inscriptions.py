@@ -6,7 +6,7 @@
 import logging
 logger = logging.getLogger(__name__)
 import datetime
-from core.utils import utils_infos_individus, utils_texte, utils_conversion, utils_dates, utils_questionnaires
+from core.utils import utils_impression, utils_infos_individus, utils_texte, utils_conversion, utils_dates, utils_questionnaires
 from core.models import Inscription
 from django.db.models import Sum
 from decimal import Decimal
@@ -105,11 +105,8 @@ class Inscriptions():
         noms_fichiers = {}
         if mode_email:
             logger.debug("Création des PDF des inscriptions à l'unité...")
-            impression = utils_impression_inscription.Impression(dict_options=dict_options, IDmodele=dict_options["modele"].pk, generation_auto=False)
-            for IDinscription, dictInscription in dict_inscriptions.items():
-                logger.debug("Création du PDF de l'inscription ID%d..." % IDinscription)
-                impression.Generation_document(dict_donnees={IDinscription: dictInscription})
-                noms_fichiers[IDinscription] = {"nom_fichier": impression.Get_nom_fichier(), "valeurs": impression.Get_champs_fusion_pour_email("inscription", IDinscription)}
+            noms_fichiers = utils_impression.Generation_documents_lot(classe_impression=utils_impression_inscription.Impression, dict_documents=dict_inscriptions, dict_options=dict_options,
+                                                                     IDmodele=dict_options["modele"].pk, categorie="inscription")
 
         # Fabrication du PDF global
         nom_fichier = None
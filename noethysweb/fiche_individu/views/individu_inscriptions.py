@@ -14,6 +14,7 @@ from core.views.mydatatableview import MyDatatable, columns, helpers
 from core.views import crud
 from core.models import Inscription, Prestation, Groupe, CategorieTarif, Consommation, Ouverture, Tarif, Facture, Deduction, Ventilation
 from core.utils import utils_dates
+from consommations.utils import utils_places
 from fiche_individu.forms.individu_inscriptions import Formulaire
 from fiche_individu.views.individu import Onglet
 from individus.utils import utils_forfaits
@@ -314,6 +315,7 @@ class Modifier(Page, crud.Modifier):
                     conso.groupe = form.cleaned_data["groupe"]
                     nouvelles_conso.append(conso)
                 Consommation.objects.bulk_update(nouvelles_conso, ["groupe"], batch_size=50)
+                utils_places.Actualiser_consommations(nouvelles_conso)
 
             # Changement des tarifs
             if "tarifs" in form.changed_data and consommations: #A MODIFIER
@@ -8,6 +8,7 @@ logger = logging.getLogger(__name__)
 from core.models import Vacance, Activite, Ouverture, CombiTarif, TarifLigne, Tarif, Inscription, Consommation, Quotient, \
                         Prestation, Unite, CategorieTarif, Aide, CombiAide, Deduction
 from core.utils import utils_dates
+from consommations.utils import utils_places
 from django.contrib import messages
 import datetime, decimal
 
@@ -325,6 +326,7 @@ class Forfaits():
                                 )
                                 liste_ajouts.append(conso)
                             Consommation.objects.bulk_create(liste_ajouts)
+                            utils_places.Actualiser_consommations(liste_ajouts)
 
                             # Message
                             messages.add_message(self.request, messages.SUCCESS, "Application du forfait '%s'" % label_forfait)
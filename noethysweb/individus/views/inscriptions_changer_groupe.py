@@ -11,6 +11,7 @@ from core.views.mydatatableview import MyDatatable, columns, helpers
 from core.views import crud
 from core.models import Inscription, Consommation, Ouverture
 from core.utils import utils_dates
+from consommations.utils import utils_places
 from individus.forms.inscriptions_changer_groupe import Formulaire_activite, Formulaire_options
 
 
@@ -69,6 +70,7 @@ def Appliquer(request):
             conso.inscription = dict_nouvelles_inscriptions[conso.inscription_id]
             nouvelles_conso.append(conso)
         Consommation.objects.bulk_update(nouvelles_conso, ["groupe", "inscription"], batch_size=50)
+        utils_places.Actualiser_consommations(nouvelles_conso)
 
     logger.debug("Application des modifications terminée.")
     return JsonResponse({"success": True})
@@ -12,6 +12,7 @@ from core.views.mydatatableview import MyDatatable, columns, helpers
 from core.views import crud
 from core.models import Inscription, Consommation, Ouverture
 from core.utils import utils_dates
+from consommations.utils import utils_places
 from individus.forms.inscriptions_modifier import Formulaire_activite, Formulaire_options
 
 
@@ -93,6 +94,7 @@ def Appliquer(request):
             conso.groupe = form.cleaned_data["groupe"]
             nouvelles_conso.append(conso)
         Consommation.objects.bulk_update(nouvelles_conso, ["groupe"], batch_size=50)
+        utils_places.Actualiser_consommations(nouvelles_conso)
 
     # Changement de la catégorie de tarif
     if form.cleaned_data["modifier_categorie_tarif"] and consommations:
@@ -5,7 +5,7 @@
 
 import logging, datetime
 logger = logging.getLogger(__name__)
-from core.utils import utils_infos_individus, utils_questionnaires
+from core.utils import utils_impression, utils_infos_individus, utils_questionnaires
 from core.models import Location
 from locations.utils import utils_impression_location
 
@@ -91,11 +91,8 @@ class Locations():
         noms_fichiers = {}
         if mode_email:
             logger.debug("Création des PDF des factures à l'unité...")
-            impression = utils_impression_location.Impression(dict_options=dict_options, IDmodele=dict_options["modele"].pk, generation_auto=False)
-            for IDlocation, dictLocation in dict_locations.items():
-                logger.debug("Création du PDF de la location ID%d..." % IDlocation)
-                impression.Generation_document(dict_donnees={IDlocation: dictLocation})
-                noms_fichiers[IDlocation] = {"nom_fichier": impression.Get_nom_fichier(), "valeurs": impression.Get_champs_fusion_pour_email("location", IDlocation)}
+            noms_fichiers = utils_impression.Generation_documents_lot(classe_impression=utils_impression_location.Impression, dict_documents=dict_locations, dict_options=dict_options,
+                                                                     IDmodele=dict_options["modele"].pk, categorie="location")
 
         # Fabrication du PDF global
         nom_fichier = None
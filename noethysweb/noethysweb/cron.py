@@ -23,6 +23,12 @@ def Sauvegarder_db():
     call_command("dbbackup", "--encrypt", "--clean", verbosity=1)
     logger.debug("Fin de la sauvegarde db")
 
+def Sauvegarder_db_sqlite():
+    """ Sauvegarde de la base SQLite sans bloquer l'application """
+    logger.debug("%s : Lancement de la sauvegarde de la base SQLite..." % datetime.datetime.now())
+    call_command("backup_database")
+    logger.debug("Fin de la sauvegarde de la base SQLite")
+
 def Sauvegarder_media():
     """ Sauvegarde du répertoire media """
     logger.debug("%s : Lancement de mediabackup..." % datetime.datetime.now())
@@ -58,3 +64,15 @@ def Recalculer_prestations_mois_precedent():
     logger.debug("%s : Recalculer les prestations du mois précédent..." % datetime.datetime.now())
     from dateutil.relativedelta import relativedelta
     call_command("recalculer_prestations", mois=format(datetime.date.today() - relativedelta(months=1), "%Y-%m"))
+
+def Envoyer_emails_programmes():
+    logger.debug("%s : Envoi des emails programmés..." % datetime.datetime.now())
+    call_command("envoyer_emails")
+
+def Actualiser_completude_familles():
+    logger.debug("%s : Précalcul de la complétude des dossiers des familles..." % datetime.datetime.now())
+    call_command("maj_completude_familles")
+
+def Generer_miniatures_photos():
+    logger.debug("%s : Génération des miniatures des photos..." % datetime.datetime.now())
+    call_command("maj_miniatures_photos", purger=True)
@@ -51,6 +51,24 @@ AUTH_USER_MODEL = 'core.Utilisateur'
 DUREE_VALIDITE_MDP = 60*60*24*30
 CORRECTEUR_JOURS_RETROACTION = 30
 
+# EMAILS
+# Si True, les envois de l'éditeur d'emails sont placés dans une file d'attente
+# traitée par la commande envoyer_emails (cron ou service dédié)
+EMAILS_ENVOI_DIFFERE = False
+
+# CACHE
+# Cache partagé entre tous les processus (workers gunicorn, cron...) pour que les
+# invalidations soient visibles partout. Remplaçable par Memcached ou Redis dans settings_production.
+# Répertoire modifiable avec la variable d'environnement CACHE_REPERTOIRE (ignoré par git par défaut)
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.environ.get("CACHE_REPERTOIRE", default=os.path.join(BASE_DIR, "..", "cache")),
+        "TIMEOUT": 3600,
+        "OPTIONS": {"MAX_ENTRIES": 5000},
+    }
+}
+
 # CONFIGURATION ACCUEIL
 CONFIG_ACCUEIL_DEFAUT = [
     [[8, "notes"], [4, "messages"]],
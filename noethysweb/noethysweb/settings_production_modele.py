@@ -63,6 +63,16 @@ DATABASES = {
     }
 }
 
+#########################################################################################
+# SQLITE : Un profil de production est appliqué à chaque connexion (journal WAL,
+# synchronous=NORMAL, busy_timeout de 20s, mmap et cache de pages). Les valeurs peuvent
+# être modifiées ci-dessous (None pour ne pas appliquer un pragma). La commande
+# "diagnostic_sqlite" affiche la configuration et les attentes de verrou en écriture.
+#########################################################################################
+
+# SQLITE_PROFIL_PRODUCTION = True
+# SQLITE_PRAGMAS = {"busy_timeout": 30000, "mmap_size": 1024 * 1024 * 1024}
+
 #########################################################################################
 # SAUVEGARDES : Permet de générer et envoyer des sauvegardes chiffrées des données
 # vers un répertoire du serveur ou vers Dropbox.
@@ -87,6 +97,16 @@ DATABASES = {
 # DBBACKUP_STORAGE = "storages.backends.dropbox.DropBoxStorage"
 # DBBACKUP_STORAGE_OPTIONS = {"oauth2_access_token": "XXXX", "app_key": "XXXX", "app_secret": "XXXX", "oauth2_refresh_token": "XXXX"}
 
+#########################################################################################
+# SAUVEGARDES SQLITE : Copies de la base effectuées sans bloquer l'application
+# (commande "backup_database"), compressées en zstd si le module zstandard est
+# installé (sinon gzip). Une copie identique à la précédente n'est pas stockée deux fois.
+#########################################################################################
+
+# SAUVEGARDE_DB_REPERTOIRE = "/var/sauvegardes/sacadoc/"
+# SAUVEGARDE_DB_COMPRESSION = "gzip"
+# SAUVEGARDE_DB_RETENTION = {"horaire": 24, "quotidienne": 7, "hebdomadaire": 4}
+
 #########################################################################################
 # STOCKAGE DE DOCUMENTS
 # Indiquer le type de stockage souhaité pour chaque information :
@@ -101,16 +121,60 @@ DATABASES = {
 # STORAGE_PHOTO = "django.core.files.storage.FileSystemStorage"
 # STORAGE_PIECE_COLLABORATEUR = "django.core.files.storage.FileSystemStorage"
 
+# Les miniatures WebP des photos sont enregistrées dans le même stockage que les photos, dans ce répertoire :
+# MINIATURES_REPERTOIRE = "miniatures"
+
 # Si l'un des champs ci-dessus utilise Dropbox, renseignez le token Dropbox ci-dessous :
 # DROPBOX_OAUTH2_TOKEN = "XXXXXXXXXXXXXXX"
 # DROPBOX_OAUTH2_REFRESH_TOKEN = "XXXXXXXXXXXXXXX"
 # DROPBOX_APP_KEY = "XXXXXXXXXXXXXXX"
 # DROPBOX_APP_SECRET = "XXXXXXXXXXXXXXX"
 
+#########################################################################################
+# CACHE : Cache partagé entre les processus (par défaut : fichiers dans le répertoire "cache",
+# ou dans celui indiqué par la variable d'environnement CACHE_REPERTOIRE).
+# Pour de meilleures performances, utilisez un serveur Memcached ou Redis local.
+#########################################################################################
+
+# CACHES = {"default": {"BACKEND": "django.core.cache.backends.memcached.PyMemcacheCache", "LOCATION": "127.0.0.1:11211"}}
+# CACHES = {"default": {"BACKEND": "django_redis.cache.RedisCache", "LOCATION": "redis://127.0.0.1:6379/1"}}
+
+#########################################################################################
+# EMAILS : Envoi différé des emails de l'éditeur d'emails
+# Nécessite d'exécuter régulièrement la commande "envoyer_emails" (voir CRONJOBS ci-dessous)
+# ou de lancer "python manage.py envoyer_emails --boucle" comme service.
+#########################################################################################
+
+# EMAILS_ENVOI_DIFFERE = True
+
+#########################################################################################
+# IMPRESSIONS : Nombre de processus utilisés pour créer les PDF à l'unité
+# (envoi des factures, rappels, attestations... par email). Par défaut : 1 (pas de répartition).
+# Chaque processus est un fork du worker web pendant la requête : à réserver aux serveurs
+# disposant de coeurs libres. Ignoré à l'intérieur d'une transaction.
+#########################################################################################
+
+# IMPRESSION_NBRE_PROCESSUS = 2
+
+#########################################################################################
+# RECALCUL DES PRESTATIONS : Nombre de processus utilisés par la commande
+# "recalculer_prestations" (PostgreSQL ou MySQL uniquement, toujours 1 avec SQLite).
+# Par défaut : nombre de coeurs.
+#########################################################################################
+
+# RECALCUL_NBRE_PROCESSUS = 4
+
 #########################################################################################
 # CRONTAB (tâches planifiées)
 # Décommentez les lignes ci-dessous pour activer les tâches automatisées
-# et modifiez si besoin les horaires de déclenchement et le path python :
+# et modifiez si besoin les horaires de déclenchement et le path python.
+# Les tâches sont exécutées par le service "python manage.py planificateur" (une seule
+# instance active grâce à un verrou, durées visibles avec "planificateur --etat").
+# Les modifications de CRONJOBS sont prises en compte au redémarrage du planificateur.
+# Pour passer du crontab système au planificateur, supprimez d'abord les tâches installées
+# avec "python manage.py crontab remove" (le planificateur refuse de démarrer sinon).
+# Pour utiliser le crontab système à la place : "python manage.py crontab add" (à relancer
+# après chaque modification de CRONJOBS) et ne pas démarrer le planificateur.
 #########################################################################################
 
 # CRONTAB_PYTHON_EXECUTABLE = "/usr/bin/python3.9"
@@ -123,6 +187,10 @@ DATABASES = {
 #     ("45 23 * * *", "noethysweb.cron.Traiter_attentes", ">> " + os.path.join(BASE_DIR, "debug_cron.log")), # Pour traiter les réservations en attente
 #     ("50 23 * * *", "noethysweb.cron.Corriger_anomalies", ">> " + os.path.join(BASE_DIR, "debug_cron.log")), # Pour corriger les anomalies
 #     ("00 03 * * *", "noethysweb.cron.Generer_taches", ">> " + os.path.join(BASE_DIR, "debug_cron.log")), # Pour générer les tâches récurrentes
+#     ("* * * * *", "noethysweb.cron.Envoyer_emails_programmes", ">> " + os.path.join(BASE_DIR, "debug_cron.log")), # Pour envoyer les emails programmés
+#     ("05 * * * *", "noethysweb.cron.Sauvegarder_db_sqlite", ">> " + os.path.join(BASE_DIR, "debug_cron.log")), # Pour sauvegarder la base SQLite toutes les heures
+#     ("15 03 * * *", "noethysweb.cron.Actualiser_completude_familles", ">> " + os.path.join(BASE_DIR, "debug_cron.log")), # Pour précalculer la complétude des dossiers des familles
+#     ("30 03 * * *", "noethysweb.cron.Generer_miniatures_photos", ">> " + os.path.join(BASE_DIR, "debug_cron.log")), # Pour générer les miniatures des photos manquantes et purger les inutilisées
 # ]
 
 #########################################################################################
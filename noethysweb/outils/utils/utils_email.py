@@ -3,7 +3,7 @@
 #  Noethysweb, application de gestion multi-activités.
 #  Distribué sous licence GNU GPL.
 
-import logging, time, re, datetime, mimetypes, json, os
+import logging, time, re, datetime, mimetypes, json, os, queue, threading
 logger = logging.getLogger(__name__)
 from django.urls import reverse_lazy, reverse
 from django.conf import settings
@@ -13,9 +13,12 @@ from django.core.cache import cache
 from django.core.mail import EmailMultiAlternatives
 from django.db.models import Q
 from django.contrib import messages
+from email import encoders
+from email.mime.base import MIMEBase
 from email.mime.image import MIMEImage
-from core.models import Mail, Organisateur, Famille
-from core.utils import utils_dates, utils_historique, utils_texte
+from concurrent.futures import ThreadPoolExecutor
+from core.models import Mail, Organisateur, Famille, Destinataire
+from core.utils import utils_dates, utils_historique, utils_texte, utils_sqlite
 
 
 class Validation_adresse():
@@ -27,77 +30,119 @@ class Validation_adresse():
         return re.search(self.regex, adresse)
 
 
-def Envoyer_model_mail(idmail=None, request=None):
-    # Stoppe l'envoi si mode démo activé
-    if settings.MODE_DEMO:
-        messages.add_message(request, messages.ERROR, "Vous ne pouvez pas envoyer d'emails en mode démo.")
-        return
+class Message(EmailMultiAlternatives):
+    """ Message dont le contenu MIME n'est construit qu'une seule fois """
+    def message(self):
+        if not hasattr(self, "_message_mime"):
+            self._message_mime = super(Message, self).message()
+        return self._message_mime
+
+
+class Pool_connexions():
+    """ Ensemble de connexions ouvertes vers le serveur de messagerie, partagées entre plusieurs threads d'envoi """
+    def __init__(self, adresse_exp=None, nbre_connexions=None):
+        self.adresse_exp = adresse_exp
+        self.nbre_connexions = nbre_connexions or Get_nbre_connexions(adresse_exp)
+        self.connexions = []
+        self.disponibles = queue.Queue()
+
+    def Ouvrir(self):
+        for index in range(self.nbre_connexions):
+            connexion = Get_connexion(self.adresse_exp)
+            try:
+                connexion.open()
+            except Exception:
+                # La première connexion est obligatoire, les suivantes sont facultatives
+                if not self.connexions:
+                    raise
+                logger.warning("Pool de connexions limité à %d connexion(s)." % len(self.connexions))
+                break
+            self.connexions.append(connexion)
+            self.disponibles.put(connexion)
+
+    def Fermer(self):
+        for connexion in self.connexions:
+            try:
+                connexion.close()
+            except Exception as err:
+                logger.error("Erreur lors de la fermeture d'une connexion de messagerie : %s" % err)
+        self.connexions = []
+
+    def Envoyer(self, message=None):
+        """ Envoie un message avec la première connexion disponible """
+        connexion = self.disponibles.get()
+        try:
+            message.connection = connexion
+            return message.send()
+        except Exception as err:
+            return err
+        finally:
+            self.disponibles.put(connexion)
+
+
+def Get_nbre_connexions(adresse_exp=None):
+    """ Nombre de connexions simultanées autorisées pour une adresse d'expédition """
+    try:
+        return max(int(adresse_exp.Get_parametre("nbre_connexions") or 1), 1)
+    except ValueError:
+        return 1
 
-    # Importation de l'email
-    mail = Mail.objects.prefetch_related('destinataires', 'pieces_jointes').select_related("adresse_exp").get(pk=idmail)
 
+def Get_backend(adresse_exp=None):
+    """ Renvoie le backend et ses paramètres pour une adresse d'expédition """
     # Backend CONSOLE (Par défaut)
     backend = 'django.core.mail.backends.console.EmailBackend'
     backend_kwargs = {}
 
     # Backend SMTP
-    if mail.adresse_exp.moteur == "smtp":
+    if adresse_exp.moteur == "smtp":
         backend = 'django.core.mail.backends.smtp.EmailBackend'
         backend_kwargs = {
-            "host": mail.adresse_exp.hote, "port": mail.adresse_exp.port, "username": mail.adresse_exp.utilisateur,
-            "password": mail.adresse_exp.motdepasse,
-            "use_tls": mail.adresse_exp.use_tls, #"use_ssl": mail.adresse_exp.use_ssl,
+            "host": adresse_exp.hote, "port": adresse_exp.port, "username": adresse_exp.utilisateur,
+            "password": adresse_exp.motdepasse,
+            "use_tls": adresse_exp.use_tls, #"use_ssl": adresse_exp.use_ssl,
         }
 
     # Backend MAILJET
-    if mail.adresse_exp.moteur == "mailjet":
+    if adresse_exp.moteur == "mailjet":
         backend = 'anymail.backends.mailjet.EmailBackend'
         backend_kwargs = {
-            "api_key": mail.adresse_exp.Get_parametre("api_key"),
-            "secret_key": mail.adresse_exp.Get_parametre("api_secret"),
+            "api_key": adresse_exp.Get_parametre("api_key"),
+            "secret_key": adresse_exp.Get_parametre("api_secret"),
         }
 
     # Backend BREVO
-    if mail.adresse_exp.moteur == "brevo":
+    if adresse_exp.moteur == "brevo":
         backend = 'anymail.backends.sendinblue.EmailBackend'
         backend_kwargs = {
-            "api_key": mail.adresse_exp.Get_parametre("api_key"),
+            "api_key": adresse_exp.Get_parametre("api_key"),
         }
 
-    # Recherche si envoi par lot activé
-    nbre_mails_lot = mail.adresse_exp.Get_parametre("nbre_mails")
-    duree_pause = mail.adresse_exp.Get_parametre("duree_pause")
+    return backend, backend_kwargs
 
-    # Création de la connexion
-    connection = djangomail.get_connection(backend=backend, fail_silently=False, **backend_kwargs)
-    try:
-        connection.open()
-    except Exception as err:
-        messages.add_message(request, messages.ERROR, "Connexion impossible au serveur de messagerie : %s" % err)
-        return
 
+def Get_connexion(adresse_exp=None):
+    """ Création d'une connexion au serveur de messagerie """
+    backend, backend_kwargs = Get_backend(adresse_exp)
+    return djangomail.get_connection(backend=backend, fail_silently=False, **backend_kwargs)
+
+
+def Get_valeurs_defaut(mail=None, utilisateur=None, url_portail=""):
+    """ Valeurs de fusion communes à tous les destinataires """
     # Chargement de la signature de l'utilisateur
     signature = ""
     if "{UTILISATEUR_SIGNATURE}" in mail.html:
-        if request.user.signature:
-            signature = request.user.signature.html
+        if utilisateur and utilisateur.signature:
+            signature = utilisateur.signature.html
         else:
-            messages.add_message(request, messages.ERROR, "Vous avez demandé à intéger une signature d'emails alors que votre profil utilisateur n'est associé à aucune signature.")
-            return
+            raise ValueError("Vous avez demandé à intéger une signature d'emails alors que votre profil utilisateur n'est associé à aucune signature.")
 
     # Récupération de l'organisateur
     organisateur = cache.get('organisateur', None)
     if not organisateur:
         organisateur = cache.get_or_set('organisateur', Organisateur.objects.filter(pk=1).first())
 
-    # Récupération de l'URL du portail
-    try:
-        url_portail = request.build_absolute_uri(reverse("portail_accueil")) if request else settings.ALLOWED_HOSTS[1]
-    except:
-        url_portail = ""
-
-    # Valeurs de fusion par défaut
-    valeurs_defaut = {
+    return {
         "{ORGANISATEUR_NOM}": organisateur.nom,
         "{ORGANISATEUR_RUE}": organisateur.rue,
         "{ORGANISATEUR_CP}": organisateur.cp,
@@ -106,116 +151,229 @@ def Envoyer_model_mail(idmail=None, request=None):
         "{ORGANISATEUR_MAIL}": organisateur.mail,
         "{ORGANISATEUR_SITE}": organisateur.site,
         "{URL_PORTAIL}": url_portail,
-        "{UTILISATEUR_NOM_COMPLET}": request.user.get_full_name() if request else "",
-        "{UTILISATEUR_NOM}": request.user.last_name if request else "",
-        "{UTILISATEUR_PRENOM}": request.user.first_name if request else "",
+        "{UTILISATEUR_NOM_COMPLET}": utilisateur.get_full_name() if utilisateur else "",
+        "{UTILISATEUR_NOM}": utilisateur.last_name if utilisateur else "",
+        "{UTILISATEUR_PRENOM}": utilisateur.first_name if utilisateur else "",
         "{UTILISATEUR_SIGNATURE}": signature,
         "{DATE_LONGUE}": utils_dates.DateComplete(datetime.date.today()),
         "{DATE_COURTE}": utils_dates.ConvertDateToFR(datetime.date.today()),
     }
 
-    # Récupère la liste des destinataires
+
+def Get_url_portail(request=None):
+    """ Récupération de l'URL du portail """
+    try:
+        return request.build_absolute_uri(reverse("portail_accueil")) if request else settings.ALLOWED_HOSTS[1]
+    except:
+        return ""
+
+
+def Get_destinataires(mail=None):
+    """ Récupère la liste des destinataires en fonction de la sélection du mail """
     condition = ~Q(resultat_envoi="ok") if "NON_ENVOYE" in mail.selection else Q()
     destinataires = mail.destinataires.filter(condition)
 
     # Sélection d'une quantité de mails à envoyer
     if mail.selection.startswith("NON_ENVOYE_"):
         destinataires = destinataires[:int(mail.selection.replace("NON_ENVOYE_", ""))]
+    return destinataires
 
-    # Envoi de chaque mail
-    index_lot = 1
-    liste_envois_succes = []
-    for destinataire in destinataires:
-        html = mail.html
-        objet = mail.objet
-        if objet == None:
-            objet = ""
 
-        # Remplacement des mots-clés
-        try:
-            valeurs = json.loads(destinataire.valeurs)
-        except:
-            valeurs = {}
-        valeurs.update(valeurs_defaut)
-        for motcle, valeur in valeurs.items():
-            if isinstance(valeur, float):
-                valeur = str(valeur)
-            html = html.replace(motcle, valeur or "")
-            objet = objet.replace(motcle, valeur or "")
-
-        # Recherche les images intégrées
-        images = re.findall('src="([^"]+)"', html)
-
-        # Remplacement des liens des images intégrées
-        index = 0
-        for image in images:
-            html = html.replace(image, "cid:image%d" % index)
-            index += 1
-
-        # Ajout du lien de désinscription
-        if mail.adresse_exp.lien_desinscription and destinataire.famille_id and len(destinataires) > 1 and request:
-            html += "<br><hr><p style='font-size: 12px;'>Si vous ne souhaitez plus recevoir nos mails groupés, cliquez sur le lien suivant : <a href='%s'>Désinscription</a></p>" % Generation_lien_desinscription(request=request, idfamille=destinataire.famille_id, adresse=destinataire.adresse)
-
-        # Création du message
-        message = EmailMultiAlternatives(subject=objet, body=utils_texte.Textify(html), from_email=mail.adresse_exp.adresse, to=[destinataire.adresse], connection=connection)
-        message.mixed_subtype = 'related'
-        message.attach_alternative(html, "text/html")
-
-        # Création des images intégrées
-        index = 0
-        for image in images:
-            try:
-                if "http" in image:
-                    image = os.path.join("media", image.split("media/")[1])
-                fp = open(settings.BASE_DIR + image, 'rb')
-                msg_img = MIMEImage(fp.read())
-                fp.close()
-                msg_img.add_header("Content-ID", "<image%d>" % index)
-                msg_img.add_header('Content-Disposition', 'inline', filename="image%d" % index)
-                message.attach(msg_img)
-                index += 1
-            except Exception as err:
-                logger.error("Erreur sur l'insertion d'une image intégrée dans un email : %s" % err)
+def Fusionner(texte="", valeurs={}):
+    """ Remplacement des mots-clés dans un texte """
+    for motcle, valeur in valeurs.items():
+        if isinstance(valeur, float):
+            valeur = str(valeur)
+        texte = texte.replace(motcle, valeur or "")
+    return texte
 
-        # Rattachement des pièces jointes
+
+def Creation_piece_jointe(nom="", contenu=b"", mimetype=None):
+    """ Création d'une partie MIME encodée, réutilisable dans plusieurs messages """
+    maintype, subtype = (mimetype or "application/octet-stream").split("/", 1)
+    piece = MIMEBase(maintype, subtype)
+    piece.set_payload(contenu)
+    encoders.encode_base64(piece)
+    try:
+        nom.encode("ascii")
+    except UnicodeEncodeError:
+        nom = ("utf-8", "", nom)
+    piece.add_header("Content-Disposition", "attachment", filename=nom)
+    return piece
+
+
+class Contenu_mail():
+    """ Contenu commun à tous les destinataires d'un mail : les valeurs par défaut sont fusionnées,
+        les images intégrées et les pièces jointes sont lues et encodées une seule fois """
+    def __init__(self, mail=None, valeurs_defaut={}):
+        self.mail = mail
+        self.images = {}
+        self.verrou = threading.Lock()
+        self.objet = Fusionner(mail.objet or "", valeurs_defaut)
+        self.html = self.Integrer_images(Fusionner(mail.html or "", valeurs_defaut))
+
+        # Chargement des pièces jointes
+        self.pieces_jointes = []
         for piece in mail.pieces_jointes.all():
             with open(settings.MEDIA_ROOT + "/" + piece.fichier.name, "rb") as f:
                 contenu_fichier = f.read()
-            message.attach(piece.nom, contenu_fichier, mimetypes.guess_type(piece.fichier.name)[0])
+            self.pieces_jointes.append(Creation_piece_jointe(piece.nom, contenu_fichier, mimetypes.guess_type(piece.fichier.name)[0]))
+
+    def Integrer_images(self, html=""):
+        """ Remplace les liens des images intégrées par leur identifiant dans le message """
+        for image in set(re.findall('src="([^"]+)"', html)):
+            cid = self.Get_image(image)
+            if cid:
+                html = html.replace(image, "cid:%s" % cid)
+        return html
+
+    def Get_image(self, image=""):
+        """ Charge une image intégrée si elle n'est pas déjà en cache et renvoie son Content-ID """
+        with self.verrou:
+            if image not in self.images:
+                cid = "image%d" % len(self.images)
+                try:
+                    chemin = os.path.join("media", image.split("media/")[1]) if "http" in image else image
+                    with open(settings.BASE_DIR + chemin, "rb") as fp:
+                        msg_img = MIMEImage(fp.read())
+                    msg_img.add_header("Content-ID", "<%s>" % cid)
+                    msg_img.add_header("Content-Disposition", "inline", filename=cid)
+                    self.images[image] = (cid, msg_img)
+                except Exception as err:
+                    logger.error("Erreur sur l'insertion d'une image intégrée dans un email : %s" % err)
+                    self.images[image] = (None, None)
+            return self.images[image][0]
+
+    def Get_images(self, html=""):
+        """ Renvoie les parties MIME des images utilisées dans le html """
+        return [msg_img for cid, msg_img in self.images.values() if cid and '"cid:%s"' % cid in html]
+
+
+def Creation_message(contenu=None, destinataire=None, connection=None, url_desinscription=None):
+    """ Création du message d'un destinataire """
+    mail = contenu.mail
+
+    # Remplacement des mots-clés propres au destinataire
+    try:
+        valeurs = json.loads(destinataire.valeurs)
+    except:
+        valeurs = {}
+    html = Fusionner(contenu.html, valeurs)
+    objet = Fusionner(contenu.objet, valeurs)
 
-        # Rattachement des documents joints
-        for document in destinataire.documents.all():
-            with open(settings.MEDIA_ROOT + "/" + document.fichier.name, "rb") as f:
-                contenu_fichier = f.read()
-            message.attach(document.nom, contenu_fichier, mimetypes.guess_type(document.fichier.name)[0])
+    # Recherche d'éventuelles images apportées par les valeurs du destinataire
+    if any('src="' in valeur for valeur in valeurs.values() if isinstance(valeur, str)):
+        html = contenu.Integrer_images(html)
 
-        # Envoie le mail
-        try:
-            resultat = message.send()
-        except Exception as err:
-            resultat = err
+    # Ajout du lien de désinscription
+    if url_desinscription:
+        html += "<br><hr><p style='font-size: 12px;'>Si vous ne souhaitez plus recevoir nos mails groupés, cliquez sur le lien suivant : <a href='%s'>Désinscription</a></p>" % url_desinscription
 
-        # Mémorise le résultat de l'envoi dans la DB
+    # Création du message
+    message = Message(subject=objet, body=utils_texte.Textify(html), from_email=mail.adresse_exp.adresse, to=[destinataire.adresse], connection=connection)
+    message.mixed_subtype = 'related'
+    message.attach_alternative(html, "text/html")
+
+    # Rattachement des images intégrées et des pièces jointes déjà encodées
+    for msg_img in contenu.Get_images(html):
+        message.attach(msg_img)
+    for piece in contenu.pieces_jointes:
+        message.attach(piece)
+
+    # Rattachement des documents joints
+    for document in destinataire.documents.all():
+        with open(settings.MEDIA_ROOT + "/" + document.fichier.name, "rb") as f:
+            contenu_fichier = f.read()
+        message.attach(document.nom, contenu_fichier, mimetypes.guess_type(document.fichier.name)[0])
+
+    return message, objet
+
+
+def Envoyer_lot(contenu=None, envois=[], pool=None, utilisateur=None):
+    """ Envoie un lot de mails via le pool de connexions. envois = liste de (destinataire, url_desinscription) """
+    if not envois:
+        return []
+
+    def Preparer(envoi):
+        destinataire, url_desinscription = envoi
+        message, objet = Creation_message(contenu=contenu, destinataire=destinataire, url_desinscription=url_desinscription)
+        # Construction anticipée du contenu MIME
+        message.message()
+        return message, objet
+
+    # Préparation des messages et envoi en parallèle sur les connexions du pool
+    with ThreadPoolExecutor(max_workers=pool.nbre_connexions + 1) as executor:
+        messages_prets = list(executor.map(Preparer, envois))
+        resultats = list(executor.map(pool.Envoyer, [message for message, objet in messages_prets]))
+
+    # Mémorise les résultats des envois dans la DB
+    liste_destinataires, liste_historiques, liste_succes = [], [], []
+    for (destinataire, url_desinscription), (message, objet), resultat in zip(envois, messages_prets, resultats):
         destinataire.date_envoi = datetime.datetime.now()
-        destinataire.resultat_envoi = "ok" if resultat == 1 else resultat
-        destinataire.save()
-
+        destinataire.resultat_envoi = "ok" if resultat == 1 else str(resultat)[:300]
+        liste_destinataires.append(destinataire)
         if resultat == 1:
-            liste_envois_succes.append(destinataire)
+            liste_succes.append(destinataire)
+            liste_historiques.append({"titre": "Envoi d'un email", "detail": objet, "utilisateur": utilisateur, "famille_id": destinataire.famille_id,
+                                      "individu_id": destinataire.individu_id, "collaborateur_id": destinataire.collaborateur_id, "objet": "Email",
+                                      "idobjet": contenu.mail.pk, "classe": "Mail"})
+    with utils_sqlite.Transaction_ecriture(label="emails"):
+        Destinataire.objects.bulk_update(liste_destinataires, ["date_envoi", "resultat_envoi"])
+        utils_historique.Ajouter_plusieurs(liste_historiques)
+    return liste_succes
 
-            # Mémorise l'envoi dans l'historique
-            utils_historique.Ajouter(titre="Envoi d'un email", detail=objet, utilisateur=request.user if request else None, famille=destinataire.famille_id,
-                                     individu=destinataire.individu_id, collaborateur=destinataire.collaborateur_id, objet="Email", idobjet=mail.pk, classe="Mail")
 
-        # Pause si envoi par lot activé
-        if nbre_mails_lot and len(destinataires) > 1:
-            if index_lot >= int(nbre_mails_lot):
-                logger.info(f"Pause de {duree_pause} secondes après le lot {index_lot}")
-                time.sleep(int(duree_pause))
-                index_lot = 0
-            index_lot += 1
+def Envoyer_model_mail(idmail=None, request=None):
+    # Stoppe l'envoi si mode démo activé
+    if settings.MODE_DEMO:
+        messages.add_message(request, messages.ERROR, "Vous ne pouvez pas envoyer d'emails en mode démo.")
+        return
 
-    connection.close()
+    # Importation de l'email
+    mail = Mail.objects.prefetch_related('destinataires', 'pieces_jointes').select_related("adresse_exp").get(pk=idmail)
+
+    # Recherche si envoi par lot activé
+    nbre_mails_lot = mail.adresse_exp.Get_parametre("nbre_mails")
+    duree_pause = mail.adresse_exp.Get_parametre("duree_pause")
+
+    # Création des connexions
+    pool = Pool_connexions(mail.adresse_exp)
+    try:
+        pool.Ouvrir()
+    except Exception as err:
+        messages.add_message(request, messages.ERROR, "Connexion impossible au serveur de messagerie : %s" % err)
+        return
+
+    # Les connexions sont fermées quelle que soit l'issue de l'envoi
+    try:
+        # Valeurs de fusion par défaut
+        utilisateur = request.user if request else None
+        try:
+            contenu = Contenu_mail(mail=mail, valeurs_defaut=Get_valeurs_defaut(mail=mail, utilisateur=utilisateur, url_portail=Get_url_portail(request)))
+        except ValueError as err:
+            messages.add_message(request, messages.ERROR, str(err))
+            return
+
+        # Récupère la liste des destinataires
+        destinataires = list(Get_destinataires(mail).prefetch_related("documents"))
+
+        envois = []
+        for destinataire in destinataires:
+            url_desinscription = None
+            if mail.adresse_exp.lien_desinscription and destinataire.famille_id and len(destinataires) > 1 and request:
+                url_desinscription = Generation_lien_desinscription(request=request, idfamille=destinataire.famille_id, adresse=destinataire.adresse)
+            envois.append((destinataire, url_desinscription))
+
+        # Envoi des mails par lot
+        taille_lot = int(nbre_mails_lot) if nbre_mails_lot and len(destinataires) > 1 else len(envois)
+        liste_envois_succes = []
+        for index in range(0, len(envois), taille_lot or 1):
+            if index:
+                logger.info(f"Pause de {duree_pause} secondes après le lot {index}")
+                time.sleep(int(duree_pause))
+            liste_envois_succes.extend(Envoyer_lot(contenu=contenu, envois=envois[index:index + taille_lot], pool=pool, utilisateur=utilisateur))
+    finally:
+        pool.Fermer()
     return liste_envois_succes
 
 
@@ -264,9 +422,11 @@ def Envoyer_mail_test(request=None, dict_options={}):
     return "Message envoyé avec succès." if resultat else resultat
 
 
-def Generation_lien_desinscription(request=None, idfamille=None, adresse=None):
+def Generation_lien_desinscription(request=None, idfamille=None, adresse=None, url_base=None):
     """ Génère un lien de désinscription aux mails groupés pour les emails """
     valeur = signing.dumps({"pk": str(idfamille), "mail": adresse})
+    if url_base:
+        return url_base.rstrip("/") + reverse("desinscription", args=[valeur])
     url = request.build_absolute_uri(reverse("desinscription", args=[valeur]))
     return url
 
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2019-2021 Ivan LUCAS.
+#  Noethysweb, application de gestion multi-activités.
+#  Distribué sous licence GNU GPL.
+
+import logging, os, datetime, time, json, gzip, shutil, hashlib, sqlite3, tempfile
+logger = logging.getLogger(__name__)
+from django.conf import settings
+from django.core.cache import cache
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Nombre de pages copiées à chaque étape : le verrou en lecture est relâché entre deux étapes
+PAGES_PAR_ETAPE = 1024
+
+# Pause entre deux étapes (en secondes) pour laisser passer les écritures de l'application
+PAUSE_ETAPE = 0.005
+
+# Taille des blocs lus et écrits lors de la compression
+TAILLE_BLOC = 1024 * 1024
+
+# Rétention par défaut : nombre de sauvegardes conservées par palier
+RETENTION_DEFAUT = {"horaire": 24, "quotidienne": 7, "hebdomadaire": 4}
+
+# Octets de l'en-tête SQLite modifiés à chaque transaction même sans changement de données (compteurs)
+OCTETS_COMPTEURS = ((24, 28), (92, 100))
+
+NOM_CATALOGUE = "catalogue.json"
+EXTENSIONS = {"zstd": ".sqlite3.zst", "gzip": ".sqlite3.gz"}
+
+
+def Get_chemin_base():
+    """ Renvoie le chemin de la base SQLite ou None si la base n'est pas une base SQLite """
+    db_config = settings.DATABASES.get("default", {})
+    if db_config.get("ENGINE") != "django.db.backends.sqlite3":
+        return None
+    return db_config.get("NAME")
+
+
+def Get_repertoire():
+    """ Renvoie le répertoire des sauvegardes de la base """
+    repertoire = getattr(settings, "SAUVEGARDE_DB_REPERTOIRE", None) or os.path.join(os.path.dirname(Get_chemin_base() or settings.BASE_DIR), "sauvegardes_db")
+    os.makedirs(repertoire, exist_ok=True)
+    return repertoire
+
+
+def Get_compression():
+    """ Renvoie la compression utilisée : zstd si le module zstandard est installé, sinon gzip """
+    compression = getattr(settings, "SAUVEGARDE_DB_COMPRESSION", None)
+    if compression == "zstd" and not zstandard:
+        logger.warning("Sauvegarde de la base : le module zstandard n'est pas installé, utilisation de gzip.")
+        compression = "gzip"
+    return compression or ("zstd" if zstandard else "gzip")
+
+
+# ------------------------------- Catalogue ---------------------------------
+
+def Get_catalogue():
+    """ Renvoie la liste des sauvegardes [{"date", "empreinte", "fichier", "taille_base", "taille"}, ...] de la plus récente à la plus ancienne """
+    chemin = os.path.join(Get_repertoire(), NOM_CATALOGUE)
+    if not os.path.isfile(chemin):
+        return []
+    with open(chemin, "r", encoding="utf-8") as fichier:
+        catalogue = json.load(fichier)
+    return sorted(catalogue, key=lambda sauvegarde: sauvegarde["date"], reverse=True)
+
+
+def Enregistrer_catalogue(catalogue=[]):
+    """ Enregistre le catalogue de façon atomique """
+    chemin = os.path.join(Get_repertoire(), NOM_CATALOGUE)
+    with open(chemin + ".tmp", "w", encoding="utf-8") as fichier:
+        json.dump(catalogue, fichier, indent=1)
+    os.replace(chemin + ".tmp", chemin)
+
+
+def Get_date(sauvegarde={}):
+    return datetime.datetime.strptime(sauvegarde["date"], "%Y-%m-%dT%H:%M:%S")
+
+
+def Get_chemin(sauvegarde={}):
+    return os.path.join(Get_repertoire(), sauvegarde["fichier"])
+
+
+# -------------------------------- Création ---------------------------------
+
+class Copie_interrompue(Exception):
+    pass
+
+
+def Copier_base(chemin_source=None, chemin_dest=None):
+    """ Copie la base page par page avec l'API de sauvegarde de SQLite : les écritures ne sont pas bloquées pendant la copie """
+    chrono = time.time()
+    source = sqlite3.connect(chemin_source, timeout=getattr(settings, "SAUVEGARDE_DB_TIMEOUT", 30))
+    destination = sqlite3.connect(chemin_dest)
+
+    # La copie repart du début quand une autre connexion écrit dans la base : au-delà d'un certain
+    # nombre de redémarrages, la base est copiée en une seule étape pour garantir que la sauvegarde aboutit
+    etat = {"restant": None, "redemarrages": 0}
+
+    def Progression(status, remaining, total):
+        if etat["restant"] is not None and remaining > etat["restant"]:
+            etat["redemarrages"] += 1
+            if etat["redemarrages"] > getattr(settings, "SAUVEGARDE_DB_REDEMARRAGES_MAX", 20):
+                raise Copie_interrompue()
+        etat["restant"] = remaining
+
+    try:
+        try:
+            source.backup(destination, pages=PAGES_PAR_ETAPE, progress=Progression, sleep=PAUSE_ETAPE)
+        except Copie_interrompue:
+            logger.warning("Sauvegarde de la base : trop d'écritures pendant la copie, copie en une seule étape.")
+            source.backup(destination)
+    finally:
+        destination.close()
+        source.close()
+    logger.debug("Sauvegarde de la base : copie effectuée en %.2fs (%d redémarrages)." % (time.time() - chrono, etat["redemarrages"]))
+
+
+def Calculer_empreinte(chemin=None):
+    """ Calcule l'empreinte du contenu de la copie, sans les compteurs de l'en-tête """
+    empreinte = hashlib.sha256()
+    with open(chemin, "rb") as fichier:
+        bloc = bytearray(fichier.read(TAILLE_BLOC))
+        for debut, fin in OCTETS_COMPTEURS:
+            bloc[debut:fin] = bytes(fin - debut)
+        while bloc:
+            empreinte.update(bloc)
+            bloc = fichier.read(TAILLE_BLOC)
+    return empreinte.hexdigest()
+
+
+def Compresser(chemin_source=None, chemin_dest=None, compression="gzip"):
+    """ Compresse un fichier par blocs, sans le charger en mémoire """
+    with open(chemin_source, "rb") as source, open(chemin_dest, "wb") as destination:
+        if compression == "zstd":
+            with zstandard.ZstdCompressor(level=3, threads=-1).stream_writer(destination, closefd=False) as flux:
+                shutil.copyfileobj(source, flux, TAILLE_BLOC)
+        else:
+            with gzip.GzipFile(fileobj=destination, mode="wb", compresslevel=6) as flux:
+                shutil.copyfileobj(source, flux, TAILLE_BLOC)
+
+
+def Decompresser(chemin_source=None, chemin_dest=None):
+    """ Décompresse une sauvegarde pour la restaurer """
+    with open(chemin_source, "rb") as source, open(chemin_dest, "wb") as destination:
+        if chemin_source.endswith(EXTENSIONS["zstd"]):
+            with zstandard.ZstdDecompressor().stream_reader(source) as flux:
+                shutil.copyfileobj(flux, destination, TAILLE_BLOC)
+        else:
+            with gzip.GzipFile(fileobj=source, mode="rb") as flux:
+                shutil.copyfileobj(flux, destination, TAILLE_BLOC)
+
+
+def Creer_sauvegarde(purger=True):
+    """ Crée une sauvegarde de la base et renvoie son entrée dans le catalogue ou None si la sauvegarde est impossible """
+    chemin_base = Get_chemin_base()
+    if not chemin_base or not os.path.isfile(chemin_base):
+        logger.debug("La sauvegarde automatique n'est supportée que pour SQLite.")
+        return None
+
+    # Une seule sauvegarde à la fois
+    if not cache.add("sauvegarde_db_en_cours", True, timeout=getattr(settings, "SAUVEGARDE_DB_DELAI_MAX", 3600)):
+        logger.warning("Sauvegarde de la base : une sauvegarde est déjà en cours.")
+        return None
+
+    try:
+        repertoire = Get_repertoire()
+        compression = Get_compression()
+        date = datetime.datetime.now().replace(microsecond=0)
+        with tempfile.TemporaryDirectory(dir=repertoire) as rep_temp:
+            chemin_copie = os.path.join(rep_temp, "copie.sqlite3")
+            Copier_base(chemin_base, chemin_copie)
+
+            # Une copie identique à une sauvegarde existante n'est pas stockée une deuxième fois
+            empreinte = Calculer_empreinte(chemin_copie)
+            catalogue = Get_catalogue()
+            doublon = next((sauvegarde for sauvegarde in catalogue if sauvegarde["empreinte"] == empreinte and os.path.isfile(Get_chemin(sauvegarde))), None)
+            if doublon:
+                fichier = doublon["fichier"]
+                logger.debug("Sauvegarde de la base : contenu identique à la sauvegarde du %s." % doublon["date"])
+            else:
+                fichier = "db_%s_%s%s" % (date.strftime("%Y%m%d_%H%M%S"), empreinte[:12], EXTENSIONS[compression])
+                Compresser(chemin_copie, os.path.join(rep_temp, fichier), compression)
+                os.replace(os.path.join(rep_temp, fichier), os.path.join(repertoire, fichier))
+
+            sauvegarde = {"date": date.isoformat(), "empreinte": empreinte, "fichier": fichier,
+                          "taille_base": os.path.getsize(chemin_copie), "taille": os.path.getsize(os.path.join(repertoire, fichier))}
+        catalogue.insert(0, sauvegarde)
+        Enregistrer_catalogue(catalogue)
+        logger.debug("Sauvegarde de la base terminée : %s (%d octets)." % (fichier, sauvegarde["taille"]))
+    finally:
+        cache.delete("sauvegarde_db_en_cours")
+
+    if purger:
+        Purger()
+    return sauvegarde
+
+
+def Get_derniere_sauvegarde(age_max=None):
+    """ Renvoie la dernière sauvegarde, éventuellement seulement si elle a moins de age_max secondes """
+    for sauvegarde in Get_catalogue():
+        if os.path.isfile(Get_chemin(sauvegarde)):
+            if age_max is None or (datetime.datetime.now() - Get_date(sauvegarde)).total_seconds() <= age_max:
+                return sauvegarde
+            return None
+    return None
+
+
+# -------------------------------- Rétention --------------------------------
+
+def Get_sauvegardes_conservees(catalogue=[], retention={}):
+    """ Renvoie les sauvegardes conservées : la plus récente de chacune des dernières heures, journées et semaines """
+    paliers = [
+        ("horaire", lambda date: (date.date(), date.hour)),
+        ("quotidienne", lambda date: date.date()),
+        ("hebdomadaire", lambda date: date.isocalendar()[:2]),
+    ]
+    conservees = {sauvegarde["date"] for sauvegarde in catalogue[:1]}
+    for palier, Get_periode in paliers:
+        periodes = set()
+        # Le catalogue est trié de la plus récente à la plus ancienne
+        for sauvegarde in catalogue:
+            periode = Get_periode(Get_date(sauvegarde))
+            if periode not in periodes and len(periodes) < retention.get(palier, 0):
+                periodes.add(periode)
+                conservees.add(sauvegarde["date"])
+    return [sauvegarde for sauvegarde in catalogue if sauvegarde["date"] in conservees]
+
+
+def Purger():
+    """ Applique la rétention et supprime les fichiers qui ne sont plus utilisés par aucune sauvegarde """
+    retention = dict(RETENTION_DEFAUT, **getattr(settings, "SAUVEGARDE_DB_RETENTION", {}))
+    catalogue = Get_catalogue()
+    conservees = Get_sauvegardes_conservees(catalogue, retention)
+    Enregistrer_catalogue(conservees)
+
+    fichiers_utilises = {sauvegarde["fichier"] for sauvegarde in conservees}
+    nbre_fichiers = 0
+    for fichier in {sauvegarde["fichier"] for sauvegarde in catalogue} - fichiers_utilises:
+        chemin = os.path.join(Get_repertoire(), fichier)
+        if os.path.isfile(chemin):
+            os.remove(chemin)
+            nbre_fichiers += 1
+    logger.debug("Purge des sauvegardes de la base : %d sauvegardes retirées, %d fichiers supprimés." % (len(catalogue) - len(conservees), nbre_fichiers))
+    return nbre_fichiers
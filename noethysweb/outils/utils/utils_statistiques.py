@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2019-2021 Ivan LUCAS.
+#  Noethysweb, application de gestion multi-activités.
+#  Distribué sous licence GNU GPL.
+
+import logging, datetime, hashlib, json
+logger = logging.getLogger(__name__)
+import numpy as np
+from core.models import Consommation, Inscription, Individu, Famille, Rattachement, Scolarite, Quotient
+from core.utils import utils_cache, utils_db
+
+# Durée de mémorisation des données extraites pour une même sélection (en secondes)
+DELAI_CACHE = 600
+
+
+def Factoriser(valeurs=[]):
+    """ Remplace des valeurs quelconques par des codes entiers : renvoie (codes, labels) """
+    dict_codes = {}
+    codes = np.fromiter((dict_codes.setdefault(valeur, len(dict_codes)) for valeur in valeurs), dtype=np.int64, count=len(valeurs))
+    return codes, list(dict_codes.keys())
+
+
+def Compter(groupes=None, ids=None, nbre_groupes=0):
+    """ Renvoie le nombre d'ids distincts par groupe (tableaux d'entiers positifs de même longueur) """
+    if not len(ids):
+        return np.zeros(nbre_groupes, dtype=np.int64)
+    base = int(ids.max()) + 1
+    cles = np.unique(groupes.astype(np.int64) * base + ids)
+    return np.bincount(cles // base, minlength=nbre_groupes)
+
+
+def Joindre(cles=None, cles_table=None, valeurs_table=None):
+    """ Jointure : renvoie pour chaque valeur associée de la table (triée par clé) l'index de la ligne d'origine et la valeur """
+    debuts = np.searchsorted(cles_table, cles, side="left")
+    nbres = np.searchsorted(cles_table, cles, side="right") - debuts
+    index_lignes = np.repeat(np.arange(len(cles)), nbres)
+    decalages = np.arange(len(index_lignes)) - np.repeat(np.cumsum(nbres) - nbres, nbres)
+    return index_lignes, valeurs_table[np.repeat(debuts, nbres) + decalages]
+
+
+def Tableau_entiers(valeurs=[]):
+    return np.fromiter(valeurs, dtype=np.int64, count=len(valeurs))
+
+
+class Donnees():
+    """ Individus présents ou inscrits d'une sélection, extraits une seule fois en colonnes numpy puis mémorisés """
+    def __init__(self, activites=[], presents=None, etats=[]):
+        self.activites = sorted({activite.pk for activite in activites})
+        self.noms_activites = {activite.pk: activite.nom for activite in activites}
+        self.presents = presents
+        self.etats = sorted(etats or [])
+        # La version permet de rendre obsolètes toutes les données mémorisées (utils_cache.Invalider_categorie("statistiques"))
+        self.cle = "statistiques_v%s_%s" % (utils_cache.Get_version("statistiques"), hashlib.md5(json.dumps([self.activites, self.presents, self.etats], default=str).encode()).hexdigest())
+
+    def Get(self, partie="", fonction=None, *args):
+        """ Renvoie une partie des données depuis le cache ou l'extrait """
+        cle = "%s_%s" % (self.cle, "_".join([partie] + [str(arg) for arg in args]))
+        return utils_cache.Get(cle, lambda: fonction(*args), timeout=DELAI_CACHE)
+
+    # ------------------------------- Extractions ---------------------------------
+
+    def Extraire_lignes(self, date_debut=None, date_fin=None):
+        """ Lignes (individu, activité, date) des consommations ou des inscriptions """
+        if self.presents:
+            lignes = list(Consommation.objects.filter(activite__in=self.activites, date__gte=date_debut, date__lte=date_fin, etat__in=self.etats, individu__isnull=False).values_list("individu_id", "activite_id", "date").distinct())
+        else:
+            lignes = [(idindividu, idactivite, None) for idindividu, idactivite in Inscription.objects.filter(activite__in=self.activites, individu__isnull=False).values_list("individu_id", "activite_id").distinct()]
+        return {
+            "individus": Tableau_entiers([ligne[0] for ligne in lignes]),
+            "activites": Tableau_entiers([ligne[1] for ligne in lignes]),
+            "dates": Tableau_entiers([ligne[2].toordinal() if ligne[2] else 0 for ligne in lignes]),
+        }
+
+    def Extraire_individus(self):
+        """ Caractéristiques des individus de la sélection, dans l'ordre des ID """
+        ids = self.Get_ids_individus()
+        individus = sorted(utils_db.Iterer_par_paquets(Individu.objects.values_list("pk", "civilite", "date_naiss", "ville_resid", "categorie_travail__nom"), "pk", ids.tolist()))
+        dates_naiss = [individu[2] for individu in individus]
+        return {
+            "ids": Tableau_entiers([individu[0] for individu in individus]),
+            "civilites": Tableau_entiers([individu[1] or 0 for individu in individus]),
+            "annees_naiss": Tableau_entiers([date.year if date else 0 for date in dates_naiss]),
+            "jours_naiss": Tableau_entiers([date.month * 100 + date.day if date else 0 for date in dates_naiss]),
+            "villes": Factoriser([individu[3] for individu in individus]),
+            "categories_travail": Factoriser([individu[4] for individu in individus]),
+        }
+
+    def Extraire_rattachements(self, date_debut=None, date_fin=None):
+        """ Rattachements (individu, famille) des individus des lignes de la période, triés par individu """
+        ids_individus = np.unique(self.Get_lignes(date_debut, date_fin)["individus"])
+        rattachements = sorted(utils_db.Iterer_par_paquets(Rattachement.objects.values_list("individu_id", "famille_id").distinct(), "individu_id", ids_individus.tolist()), key=lambda rattachement: (rattachement[0], rattachement[1] or 0))
+        return {
+            "individus": Tableau_entiers([rattachement[0] for rattachement in rattachements]),
+            "familles": Tableau_entiers([rattachement[1] or 0 for rattachement in rattachements]),
+        }
+
+    def Extraire_familles(self):
+        """ Caisses des familles de la sélection """
+        familles = list(utils_db.Iterer_par_paquets(Famille.objects.values_list("pk", "caisse__nom"), "pk", self.Get_ids_familles().tolist()))
+        return {"ids": Tableau_entiers([famille[0] for famille in familles]), "caisses": Factoriser([famille[1] for famille in familles])}
+
+    def Extraire_inscriptions(self):
+        """ Toutes les inscriptions (individu, famille) des individus de la sélection """
+        inscriptions = list(utils_db.Iterer_par_paquets(Inscription.objects.values_list("individu_id", "famille_id").distinct(), "individu_id", self.Get_ids_individus().tolist()))
+        return {"individus": Tableau_entiers([inscription[0] for inscription in inscriptions]), "familles": Tableau_entiers([inscription[1] or 0 for inscription in inscriptions])}
+
+    def Extraire_scolarites(self, date_reference=None):
+        """ Scolarités (individu, école, niveau) à une date """
+        return list(utils_db.Iterer_par_paquets(Scolarite.objects.filter(date_debut__lte=date_reference, date_fin__gte=date_reference).values_list("individu_id", "ecole__nom", "niveau__nom"), "individu_id", self.Get_ids_individus().tolist()))
+
+    def Extraire_quotients(self):
+        """ Dernier quotient familial de chaque famille sur la période """
+        quotients = Quotient.objects.order_by("date_debut")
+        if self.presents:
+            quotients = quotients.filter(date_debut__lte=self.presents[1], date_fin__gte=self.presents[0])
+        return {idfamille: quotient for idfamille, quotient in utils_db.Iterer_par_paquets(quotients.values_list("famille_id", "quotient"), "famille_id", self.Get_ids_familles().tolist())}
+
+    # ------------------------------- Colonnes ---------------------------------
+
+    def Get_lignes(self, date_debut=None, date_fin=None):
+        if not self.presents:
+            return self.Get("lignes", self.Extraire_lignes)
+        date_debut, date_fin = date_debut or self.presents[0], date_fin or self.presents[1]
+        return self.Get("lignes", self.Extraire_lignes, date_debut, date_fin)
+
+    def Get_ids_individus(self):
+        return np.unique(self.Get_lignes()["individus"])
+
+    def Get_individus(self):
+        return self.Get("individus", self.Extraire_individus)
+
+    def Get_rattachements(self, date_debut=None, date_fin=None):
+        # Les périodes comparatives contiennent des individus absents de la période principale
+        periode = [date for date in (date_debut, date_fin) if date]
+        return self.Get("rattachements", self.Extraire_rattachements, *periode)
+
+    def Get_lignes_familles(self, lignes=None, date_debut=None, date_fin=None):
+        """ Lignes des individus (extraites pour la période donnée) multipliées par leurs familles de rattachement : (index des lignes, familles) """
+        rattachements = self.Get_rattachements(date_debut, date_fin)
+        index_lignes, familles = Joindre(lignes["individus"], rattachements["individus"], rattachements["familles"])
+        avec_famille = familles > 0
+        return index_lignes[avec_famille], familles[avec_famille]
+
+    def Get_ids_familles(self):
+        return np.unique(self.Get_lignes_familles(self.Get_lignes())[1])
+
+    # ------------------------------- Résultats : individus ---------------------------------
+
+    def Nbre_individus(self):
+        return len(self.Get_ids_individus())
+
+    def Par_activite(self, familles=False):
+        """ Nombre d'individus ou de familles par nom d'activité, du plus grand au plus petit """
+        lignes = self.Get_lignes()
+        index_lignes, ids = self.Get_lignes_familles(lignes) if familles else (np.arange(len(lignes["individus"])), lignes["individus"])
+        codes, noms = Factoriser([self.noms_activites.get(idactivite) for idactivite in lignes["activites"][index_lignes].tolist()])
+        nbres = Compter(codes, ids, len(noms))
+        return sorted(zip(noms, nbres.tolist()), key=lambda item: -item[1])
+
+    def Par_date(self, familles=False):
+        """ Nombre d'individus ou de familles par date """
+        lignes = self.Get_lignes()
+        index_lignes, ids = self.Get_lignes_familles(lignes) if familles else (np.arange(len(lignes["individus"])), lignes["individus"])
+        dates, codes = np.unique(lignes["dates"][index_lignes], return_inverse=True)
+        nbres = Compter(codes, ids, len(dates))
+        return [(datetime.date.fromordinal(int(date)), int(nbre)) for date, nbre in zip(dates, nbres)]
+
+    def Par_periode(self, periodes=[], familles=False):
+        """ Nombre d'individus ou de familles sur chaque période comparative (une seule extraction pour toutes les périodes) """
+        if not periodes:
+            return []
+        date_debut = min(periode["date_debut"] for periode in periodes)
+        date_fin = max(periode["date_fin"] for periode in periodes)
+        lignes = self.Get_lignes(date_debut, date_fin)
+        index_lignes, ids = self.Get_lignes_familles(lignes, date_debut, date_fin) if familles else (np.arange(len(lignes["individus"])), lignes["individus"])
+        dates = lignes["dates"][index_lignes]
+        resultats = []
+        for periode in periodes:
+            masque = (dates >= periode["date_debut"].toordinal()) & (dates <= periode["date_fin"].toordinal())
+            resultats.append(len(np.unique(ids[masque])))
+        return resultats
+
+    def Par_civilite(self):
+        individus = self.Get_individus()
+        civilites, nbres = np.unique(individus["civilites"], return_counts=True)
+        return list(zip(civilites.tolist(), nbres.tolist()))
+
+    def Par_caracteristique(self, caracteristique=""):
+        """ Nombre d'individus par valeur d'une caractéristique factorisée (ville, catégorie de travail) """
+        codes, labels = self.Get_individus()[caracteristique]
+        nbres = np.bincount(codes, minlength=len(labels))
+        return list(zip(labels, nbres.tolist()))
+
+    def Ages(self, today=None):
+        """ Nombre d'individus par âge (None = date de naissance inconnue) """
+        if not today:
+            today = datetime.date.today()
+        individus = self.Get_individus()
+        connus = individus["annees_naiss"] > 0
+        ages = today.year - individus["annees_naiss"][connus] - ((today.month * 100 + today.day) < individus["jours_naiss"][connus])
+        valeurs, nbres = np.unique(ages, return_counts=True)
+        dict_ages = dict(zip(valeurs.tolist(), nbres.tolist()))
+        if not connus.all():
+            dict_ages[None] = int((~connus).sum())
+        return dict_ages
+
+    def Annees_naissance(self):
+        annees = self.Get_individus()["annees_naiss"]
+        valeurs, nbres = np.unique(annees[annees > 0], return_counts=True)
+        return list(zip(valeurs.tolist(), nbres.tolist()))
+
+    def Par_scolarite(self, date_reference=None, champ="ecole"):
+        """ Nombre d'individus par école ou par niveau à une date, du plus petit au plus grand """
+        scolarites = self.Get("scolarites", self.Extraire_scolarites, date_reference)
+        if champ == "niveau":
+            scolarites = [(idindividu, niveau) for idindividu, ecole, niveau in scolarites if niveau is not None]
+        else:
+            scolarites = [(idindividu, ecole) for idindividu, ecole, niveau in scolarites]
+        codes, labels = Factoriser([scolarite[1] for scolarite in scolarites])
+        nbres = Compter(codes, Tableau_entiers([scolarite[0] for scolarite in scolarites]), len(labels))
+        return sorted(zip(labels, nbres.tolist()), key=lambda item: item[1])
+
+    # ------------------------------- Résultats : familles ---------------------------------
+
+    def Nbre_familles(self):
+        return len(self.Get_ids_familles())
+
+    def Par_caisse(self):
+        familles = self.Get("familles", self.Extraire_familles)
+        codes, labels = familles["caisses"]
+        nbres = np.bincount(codes, minlength=len(labels))
+        return sorted(zip(labels, nbres.tolist()), key=lambda item: -item[1])
+
+    def Composition(self):
+        """ Nombre de familles par nombre de membres présents ou inscrits """
+        # Individus de la sélection ayant au moins un rattachement
+        ids_individus = np.unique(self.Get_rattachements()["individus"])
+        inscriptions = self.Get("inscriptions", self.Extraire_inscriptions)
+        masque = np.isin(inscriptions["individus"], ids_individus)
+        familles, codes = np.unique(inscriptions["familles"][masque], return_inverse=True)
+        nbres_membres = Compter(codes, inscriptions["individus"][masque], len(familles))
+        # Les individus sans aucune inscription forment un groupe à part
+        nbre_sans_inscription = len(np.setdiff1d(ids_individus, inscriptions["individus"]))
+        if nbre_sans_inscription:
+            nbres_membres = np.append(nbres_membres, nbre_sans_inscription)
+        valeurs, nbres = np.unique(nbres_membres, return_counts=True)
+        return list(zip(valeurs.tolist(), nbres.tolist()))
+
+    def Par_tranche_qf(self, tranches=[]):
+        """ Nombre de familles par tranche de QF : {tranche: nbre, None: autres} """
+        dict_quotients = self.Get("quotients", self.Extraire_quotients)
+        quotients = np.array([float(dict_quotients.get(idfamille) or 0) for idfamille in self.Get_ids_familles().tolist()], dtype=np.float64)
+        trouves = np.zeros(len(quotients), dtype=bool)
+        dict_tranches = {None: 0}
+        for tranche in tranches:
+            masque = (quotients != 0) & (quotients >= tranche[0]) & (quotients <= tranche[1])
+            dict_tranches[tranche] = int(masque.sum())
+            trouves |= masque
+        dict_tranches[None] = int((~trouves).sum())
+        return dict_tranches
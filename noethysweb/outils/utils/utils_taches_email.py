@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+#  Copyright (c) 2019-2021 Ivan LUCAS.
+#  Noethysweb, application de gestion multi-activités.
+#  Distribué sous licence GNU GPL.
+
+import logging, datetime, json, time
+logger = logging.getLogger(__name__)
+from django.db.models import Q
+from core.models import TacheEnvoiMail, Mail, Destinataire
+from outils.utils import utils_email
+
+# Nombre de mails envoyés entre deux enregistrements de la progression
+TAILLE_LOT = 50
+# Nombre maximal de tentatives de connexion avant abandon de la tâche
+MAX_TENTATIVES = 6
+# Délai (en secondes) au-delà duquel une tâche en cours sans nouvelles est considérée comme interrompue
+DELAI_INTERRUPTION = 600
+# Champs de progression enregistrés à chaque libération de la tâche
+CHAMPS_PROGRESSION = ("date_debut", "nbre_traites", "nbre_succes", "nbre_echecs", "tentatives")
+
+
+def Programmer_envoi(idmail=None, request=None):
+    """ Place l'envoi d'un mail dans la file d'attente des envois différés """
+    mail = Mail.objects.select_related("adresse_exp").get(pk=idmail)
+    liste_iddestinataires = [destinataire.pk for destinataire in utils_email.Get_destinataires(mail)]
+    tache = TacheEnvoiMail.objects.create(
+        mail=mail,
+        utilisateur=request.user if request else None,
+        destinataires=json.dumps(liste_iddestinataires),
+        nbre_total=len(liste_iddestinataires),
+        url_base=request.build_absolute_uri("/") if request else None,
+        url_portail=utils_email.Get_url_portail(request),
+    )
+    logger.debug("Envoi du mail ID%d programmé pour %d destinataires (tâche ID%d)." % (mail.pk, len(liste_iddestinataires), tache.pk))
+    return tache
+
+
+def Get_tache_en_cours(idmail=None):
+    """ Renvoie la dernière tâche non terminée d'un mail """
+    return TacheEnvoiMail.objects.filter(mail_id=idmail, statut__in=("attente", "en_cours")).order_by("-pk").first()
+
+
+def Reserver_tache():
+    """ Réserve la prochaine tâche disponible pour ce processus """
+    maintenant = datetime.datetime.now()
+    conditions = Q(statut="attente") & (Q(date_prochaine_tentative__isnull=True) | Q(date_prochaine_tentative__lte=maintenant))
+    # Reprise des tâches interrompues (crash du worker par exemple)
+    conditions |= Q(statut="en_cours", date_maj__lt=maintenant - datetime.timedelta(seconds=DELAI_INTERRUPTION))
+    for tache in TacheEnvoiMail.objects.filter(conditions).order_by("date_creation"):
+        # La mise à jour conditionnelle garantit qu'un seul processus obtient la tâche
+        if TacheEnvoiMail.objects.filter(pk=tache.pk, statut=tache.statut, date_maj=tache.date_maj).update(statut="en_cours", date_maj=maintenant):
+            tache.refresh_from_db()
+            return tache
+    return None
+
+
+def Get_quota(adresse_exp=None):
+    """ Renvoie le nombre de mails encore autorisés pour l'adresse d'expédition et la date de fin de la pause éventuelle """
+    nbre_mails_lot = adresse_exp.Get_parametre("nbre_mails")
+    duree_pause = adresse_exp.Get_parametre("duree_pause")
+    if not nbre_mails_lot or not duree_pause:
+        return TAILLE_LOT, None
+
+    # Recherche les envois réalisés par cette adresse pendant la durée de la pause
+    debut_fenetre = datetime.datetime.now() - datetime.timedelta(seconds=int(duree_pause))
+    envois = Destinataire.objects.filter(mail__adresse_exp=adresse_exp, date_envoi__gte=debut_fenetre).order_by("date_envoi").values_list("date_envoi", flat=True)
+    nbre_envois = len(envois)
+    if nbre_envois < int(nbre_mails_lot):
+        return min(int(nbre_mails_lot) - nbre_envois, TAILLE_LOT), None
+    return 0, envois[0] + datetime.timedelta(seconds=int(duree_pause))
+
+
+def Liberer_tache(tache=None, statut="attente", **kwargs):
+    """ Enregistre l'état de la tâche et la rend éventuellement disponible pour un autre passage. Renvoie False si la tâche a été annulée entre-temps """
+    kwargs.update(statut=statut, date_maj=datetime.datetime.now())
+    for nom, valeur in kwargs.items():
+        setattr(tache, nom, valeur)
+    progression = {nom: getattr(tache, nom) for nom in CHAMPS_PROGRESSION}
+    # La mise à jour conditionnelle n'écrase jamais une annulation demandée pendant l'envoi d'un lot
+    if TacheEnvoiMail.objects.filter(pk=tache.pk).exclude(statut="annule").update(**dict(progression, **kwargs)):
+        return True
+    # Tâche annulée : seule la progression des envois déjà réalisés est conservée
+    TacheEnvoiMail.objects.filter(pk=tache.pk).update(**progression)
+    tache.statut = "annule"
+    logger.debug("Tâche d'envoi ID%d annulée pendant l'envoi." % tache.pk)
+    return False
+
+
+def Annuler_tache(tache=None):
+    """ Annule une tâche sans modifier la progression enregistrée par le worker """
+    maintenant = datetime.datetime.now()
+    return TacheEnvoiMail.objects.filter(pk=tache.pk, statut__in=("attente", "en_cours")).update(statut="annule", date_fin=maintenant, date_maj=maintenant)
+
+
+def Executer_tache(tache=None):
+    """ Envoie les mails d'une tâche par lots en respectant les limites de l'adresse d'expédition """
+    mail = Mail.objects.prefetch_related("pieces_jointes").select_related("adresse_exp").get(pk=tache.mail_id)
+    if not tache.date_debut:
+        tache.date_debut = datetime.datetime.now()
+
+    if not mail.adresse_exp:
+        Liberer_tache(tache, statut="erreur", erreur="Aucune adresse d'expédition n'a été sélectionnée.", date_fin=datetime.datetime.now())
+        return
+
+    # Valeurs de fusion par défaut, images intégrées et pièces jointes
+    try:
+        contenu = utils_email.Contenu_mail(mail=mail, valeurs_defaut=utils_email.Get_valeurs_defaut(mail=mail, utilisateur=tache.utilisateur, url_portail=tache.url_portail or ""))
+    except ValueError as err:
+        Liberer_tache(tache, statut="erreur", erreur=str(err), date_fin=datetime.datetime.now())
+        return
+
+    # Création des connexions
+    pool = utils_email.Pool_connexions(mail.adresse_exp)
+    try:
+        pool.Ouvrir()
+    except Exception as err:
+        tache.tentatives += 1
+        if tache.tentatives >= MAX_TENTATIVES:
+            Liberer_tache(tache, statut="erreur", erreur="Connexion impossible au serveur de messagerie : %s" % err, date_fin=datetime.datetime.now())
+        else:
+            # Nouvelle tentative avec un délai croissant (1, 2, 4, 8... minutes)
+            delai = 60 * 2 ** (tache.tentatives - 1)
+            logger.warning("Tâche d'envoi ID%d : connexion impossible (%s). Nouvelle tentative dans %d secondes." % (tache.pk, err, delai))
+            Liberer_tache(tache, erreur=str(err), date_prochaine_tentative=datetime.datetime.now() + datetime.timedelta(seconds=delai))
+        return
+
+    liste_iddestinataires = json.loads(tache.destinataires or "[]")
+    try:
+        while tache.nbre_traites < len(liste_iddestinataires):
+            # Vérifie que la tâche n'a pas été annulée entre deux lots
+            if TacheEnvoiMail.objects.filter(pk=tache.pk, statut="annule").exists():
+                return
+
+            # Respect de la limite d'envoi de l'adresse d'expédition
+            quota, date_reprise = Get_quota(mail.adresse_exp)
+            if not quota:
+                Liberer_tache(tache, date_prochaine_tentative=date_reprise)
+                return
+
+            lot = liste_iddestinataires[tache.nbre_traites:tache.nbre_traites + quota]
+            # Les destinataires déjà traités par cette tâche (avant une interruption) sont ignorés
+            envois = []
+            for destinataire in Destinataire.objects.prefetch_related("documents").filter(pk__in=lot).exclude(date_envoi__gte=tache.date_creation):
+                url_desinscription = None
+                if mail.adresse_exp.lien_desinscription and destinataire.famille_id and tache.nbre_total > 1 and tache.url_base:
+                    url_desinscription = utils_email.Generation_lien_desinscription(idfamille=destinataire.famille_id, adresse=destinataire.adresse, url_base=tache.url_base)
+                envois.append((destinataire, url_desinscription))
+            nbre_succes = len(utils_email.Envoyer_lot(contenu=contenu, envois=envois, pool=pool, utilisateur=tache.utilisateur))
+
+            # Mémorise la progression
+            tache.nbre_succes += nbre_succes
+            tache.nbre_echecs += len(envois) - nbre_succes
+            tache.nbre_traites += len(lot)
+            tache.tentatives = 0
+            if not Liberer_tache(tache, statut="en_cours", date_prochaine_tentative=None):
+                return
+
+    finally:
+        pool.Fermer()
+
+    if Liberer_tache(tache, statut="termine", date_fin=datetime.datetime.now()):
+        logger.debug("Tâche d'envoi ID%d terminée : %d envois réussis, %d échecs." % (tache.pk, tache.nbre_succes, tache.nbre_echecs))
+
+
+def Traiter_taches(boucle=False, intervalle=10):
+    """ Traite les tâches d'envoi en attente. Si boucle=True, attend de nouvelles tâches indéfiniment """
+    nbre_taches = 0
+    while True:
+        tache = Reserver_tache()
+        if tache:
+            try:
+                Executer_tache(tache)
+            except Exception as err:
+                logger.error("Erreur dans la tâche d'envoi ID%d : %s" % (tache.pk, err), exc_info=True)
+                Liberer_tache(tache, statut="erreur", erreur=str(err), date_fin=datetime.datetime.now())
+            nbre_taches += 1
+        elif boucle:
+            time.sleep(intervalle)
+        else:
+            return nbre_taches
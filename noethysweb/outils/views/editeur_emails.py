@@ -4,6 +4,7 @@
 #  Distribué sous licence GNU GPL.
 
 import json
+from django.conf import settings
 from django.urls import reverse_lazy
 from django.http import JsonResponse, HttpResponseRedirect
 from django.db.models import Q, Count
@@ -12,7 +13,7 @@ from core.views import crud
 from core.models import ModeleEmail, Mail, PieceJointe, Destinataire, Famille, Individu, Collaborateur, Contact, SignatureEmail, Rattachement
 from core.utils import utils_texte
 from outils.forms.editeur_emails import Formulaire
-from outils.utils import utils_email
+from outils.utils import utils_email, utils_taches_email
 
 
 def Get_modele_email(request):
@@ -72,6 +73,10 @@ class Page(crud.Page):
         if nbre_envois_echec: intro_envois.append("%d envois en échec" % nbre_envois_echec) if nbre_envois_echec > 1 else intro_envois.append("1 envoi en échec")
         context['intro_envoi'] = utils_texte.Convert_liste_to_texte_virgules(intro_envois)
 
+        # Envoi différé en cours
+        context['tache_envoi'] = utils_taches_email.Get_tache_en_cours(self.Get_idmail()) if self.Get_idmail() else None
+        context['envoi_differe'] = settings.EMAILS_ENVOI_DIFFERE
+
         return context
 
     def Get_idmail(self):
@@ -143,9 +148,22 @@ class Page(crud.Page):
                 messages.add_message(request, messages.ERROR, "Vous devez saisir un objet")
             elif not form.cleaned_data.get("html"):
                 messages.add_message(request, messages.ERROR, "Vous devez saisir un texte")
+            elif settings.EMAILS_ENVOI_DIFFERE:
+                if utils_taches_email.Get_tache_en_cours(mail.pk):
+                    messages.add_message(request, messages.ERROR, "Un envoi de ce message est déjà en cours")
+                else:
+                    tache = utils_taches_email.Programmer_envoi(idmail=mail.pk, request=request)
+                    messages.add_message(request, messages.INFO, "L'envoi a été programmé pour %d destinataire(s). Vous pouvez suivre sa progression sur cette page." % tache.nbre_total)
             else:
                 utils_email.Envoyer_model_mail(idmail=mail.pk, request=request)
 
+        # Annuler l'envoi différé
+        if action == "annuler_envoi":
+            tache = utils_taches_email.Get_tache_en_cours(mail.pk)
+            if tache:
+                utils_taches_email.Annuler_tache(tache)
+                messages.add_message(request, messages.INFO, "L'envoi programmé a été annulé")
+
         return HttpResponseRedirect(reverse_lazy("editeur_emails", kwargs={'pk': mail.pk}))
 
 
@@ -10,6 +10,7 @@ from django.http import JsonResponse
 from django.template.defaultfilters import truncatechars, striptags
 from core.views import crud
 from core.models import PortailMessage, Structure, Famille, Activite, Inscription, Individu
+from core.utils import utils_conversations
 from outils.forms.messagerie_portail import Formulaire, Envoi_notification_message
 from django.db.models import OuterRef, Subquery
 from django.utils import timezone
@@ -26,6 +27,7 @@ def Marquer_lu(request):
         message.update(date_lecture=datetime.datetime.now())
     else:
         message.update(date_lecture=None)
+    utils_conversations.Actualiser_conversations(message)
     return JsonResponse({"succes": True})
 
 
@@ -57,6 +59,7 @@ class Page(crud.Page):
         # Indiquer que les messages de la discussion ouverte sont lus
         if messages_non_lus and self.get_idfamille():
             messages_non_lus.filter(famille_id=self.get_idfamille(), structure_id=self.get_idstructure()).update(date_lecture=datetime.datetime.now())
+            utils_conversations.Actualiser_conversation(idfamille=self.get_idfamille(), idstructure=self.get_idstructure())
 
         # Envoi famille
         activites_accessibles = Activite.objects.filter(structure__in=self.request.user.structures.all())
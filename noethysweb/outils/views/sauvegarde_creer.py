@@ -12,25 +12,45 @@ from django.core.management import call_command
 from core.views.base import CustomView
 from core.utils import utils_gnupg
 from dbbackup.storage import get_storage, utils
-import os
 from django.http import FileResponse, Http404
 from django.conf import settings
 from django.contrib.admin.views.decorators import staff_member_required
+from outils.utils import utils_sauvegarde_db
 
-@staff_member_required
 
 def Sauvegarder_db(request):
-        db_path = settings.DATABASES['default']['NAME']
+    """ Créer une sauvegarde de la base de données """
+    if not utils_sauvegarde_db.Get_chemin_base():
+        return JsonResponse({"erreur": "La sauvegarde de la base n'est disponible que pour SQLite"}, status=401)
+    try:
+        sauvegarde = utils_sauvegarde_db.Creer_sauvegarde()
+    except Exception as err:
+        return JsonResponse({"erreur": str(err)}, status=401)
+    if not sauvegarde:
+        return JsonResponse({"erreur": "Une sauvegarde est déjà en cours"}, status=401)
+    return JsonResponse({"success": True})
 
-        if not os.path.exists(db_path):
-            raise Http404("Base introuvable")
 
-        response = FileResponse(
-            open(db_path, 'rb'),
-            as_attachment=True,
-            filename="sauvegarde_db.sqlite3"
-        )
-        return response
+@staff_member_required
+def Telecharger_db(request):
+    """ Télécharger une copie cohérente de la base de données """
+    if not utils_sauvegarde_db.Get_chemin_base():
+        raise Http404("Base introuvable")
+
+    # Une sauvegarde récente est réutilisée, sinon une nouvelle copie est créée
+    sauvegarde = utils_sauvegarde_db.Get_derniere_sauvegarde(age_max=getattr(settings, "SAUVEGARDE_DB_DELAI_TELECHARGEMENT", 300))
+    if not sauvegarde:
+        sauvegarde = utils_sauvegarde_db.Creer_sauvegarde() or utils_sauvegarde_db.Get_derniere_sauvegarde()
+    if not sauvegarde:
+        raise Http404("Sauvegarde introuvable")
+
+    extension = sauvegarde["fichier"][sauvegarde["fichier"].index("."):]
+    nom_fichier = "sauvegarde_db_%s%s" % (utils_sauvegarde_db.Get_date(sauvegarde).strftime("%Y%m%d_%H%M%S"), extension)
+    return FileResponse(open(utils_sauvegarde_db.Get_chemin(sauvegarde), "rb"), as_attachment=True, filename=nom_fichier)
+
+
+def Get_liste_fichiers_db():
+    return [utils_sauvegarde_db.Get_date(sauvegarde) for sauvegarde in utils_sauvegarde_db.Get_catalogue()]
 
 
 def Sauvegarder_media(request):
@@ -45,8 +65,11 @@ def Sauvegarder_media(request):
 
 def Get_liste_sauvegardes(request):
     mode = request.POST.get("mode")
-    storage = get_storage()
-    liste_fichiers = [utils.filename_to_date(nom_fichier) for nom_fichier in storage.list_backups(content_type=mode)]
+    if mode == "db" and utils_sauvegarde_db.Get_chemin_base():
+        liste_fichiers = Get_liste_fichiers_db()
+    else:
+        storage = get_storage()
+        liste_fichiers = [utils.filename_to_date(nom_fichier) for nom_fichier in storage.list_backups(content_type=mode)]
     html = """
         {% if fichiers %}
             <p>Dernières sauvegardes :</p>
@@ -78,6 +101,6 @@ class View(CustomView, TemplateView):
 
         # Récupération de la liste des dernières sauvegardes
         storage = get_storage()
-        context["fichiers_db"] = [utils.filename_to_date(nom_fichier) for nom_fichier in storage.list_backups(content_type="db")]
+        context["fichiers_db"] = Get_liste_fichiers_db() if utils_sauvegarde_db.Get_chemin_base() else [utils.filename_to_date(nom_fichier) for nom_fichier in storage.list_backups(content_type="db")]
         context["fichiers_media"] = [utils.filename_to_date(nom_fichier) for nom_fichier in storage.list_backups(content_type="media")]
         return context
@@ -6,9 +6,10 @@
 from django.urls import reverse_lazy, reverse
 from core.views.base import CustomView
 from django.db.models import Q, Count, F
-from core.models import Activite, Consommation, Inscription, Famille, Individu, Vacance, Scolarite, LISTE_MOIS, Historique, TarifLigne, Quotient
+from core.models import Activite, Consommation, Vacance, LISTE_MOIS, Historique
 from django.views.generic import TemplateView
 from outils.forms.statistiques import Formulaire
+from outils.utils import utils_statistiques
 from core.utils import utils_dates
 import json, random, datetime, calendar, operator
 from django.db.models import Max, Min
@@ -155,43 +156,34 @@ class View(CustomView, TemplateView):
                 presents = None
 
 
-            # ================================ INDIVIDUS ====================================
-
-            if rubrique.startswith("individus"):
-                if presents:
-                    condition = Q(consommation__activite__in=liste_activites, consommation__date__gte=presents[0], consommation__date__lte=presents[1], consommation__etat__in=parametres["etats"])
-                else:
-                    condition = Q(inscription__activite__in=liste_activites)
+            # Données des individus et des familles (extraites en colonnes et mémorisées)
+            donnees = utils_statistiques.Donnees(activites=liste_activites, presents=presents, etats=parametres["etats"])
 
 
             # ---------------------------- INDIVIDUS : Nombre -------------------------------
             if rubrique == "individus_nombre":
 
                 # Texte : Nombre d'individus total
-                data.append(Texte(texte="%d individus %s." % (Individu.objects.filter(condition).distinct().count(), "présents" if presents else "inscrits")))
+                data.append(Texte(texte="%d individus %s." % (donnees.Nbre_individus(), "présents" if presents else "inscrits")))
 
                 # Tableau : Répartition des individus par activité
-                individus = Individu.objects.filter(condition).values_list("%s__activite__nom" % ("consommation" if presents else "inscription")).annotate(nbre=Count("idindividu", distinct=True)).order_by("-nbre")
                 data.append(Tableau(
                     titre="Répartition du nombre d'individus par activité",
                     colonnes=["Activité", "Nombre d'individus"],
-                    lignes=[(item[0], item[1]) for item in individus]
+                    lignes=donnees.Par_activite()
                 ))
 
                 # Chart : Evolution du nombre d'individus - comparatif par période
                 if presents:
                     liste_periodes= Calcule_periodes_comparatives(parametres, presents, liste_activites)
                     if liste_periodes:
-                        liste_labels, liste_valeurs = [], []
-                        for dict_periode in liste_periodes:
-                            condition_temp = Q(consommation__activite__in=liste_activites, consommation__date__gte=dict_periode["date_debut"], consommation__date__lte=dict_periode["date_fin"], consommation__etat__in=parametres["etats"])
-                            liste_labels.append(dict_periode["label"])
-                            liste_valeurs.append(Individu.objects.filter(condition_temp).distinct().count())
-                        data.append(Histogramme(titre="Evolution du nombre des individus", type_chart="bar", labels=liste_labels, valeurs=liste_valeurs))
+                        data.append(Histogramme(titre="Evolution du nombre des individus", type_chart="bar",
+                            labels=[dict_periode["label"] for dict_periode in liste_periodes],
+                            valeurs=donnees.Par_periode(liste_periodes)))
 
                 # Chart : Nombre d'individus par date
                 if presents:
-                    individus = Individu.objects.filter(condition).values_list('consommation__date').annotate(nbre=Count('idindividu', distinct=True)).order_by('consommation__date')
+                    individus = donnees.Par_date()
                     data.append(Histogramme(
                         titre="Nombre individus par date", type_chart="line",
                         labels=[utils_dates.ConvertDateToFR(date) for date, nbre in individus],
@@ -203,11 +195,10 @@ class View(CustomView, TemplateView):
             # ---------------------------- INDIVIDUS : Genre -------------------------------
             if rubrique == "individus_genre":
 
-                individus = Individu.objects.filter(condition).values_list("civilite").annotate(nbre=Count("idindividu", distinct=True))
                 resultats = {"M": 0, "F": 0}
-                for item in individus:
-                    if item[0] in (1, 4): resultats["M"] += item[1]
-                    if item[0] in (2, 3, 5): resultats["F"] += item[1]
+                for civilite, nbre in donnees.Par_civilite():
+                    if civilite in (1, 4): resultats["M"] += nbre
+                    if civilite in (2, 3, 5): resultats["F"] += nbre
 
                 # Tableau : Répartition par genre
                 data.append(Tableau(
@@ -234,11 +225,7 @@ class View(CustomView, TemplateView):
                     today = None
 
                 # Calcul des âges
-                dict_ages = {}
-                for individu in Individu.objects.filter(condition).distinct():
-                    age = individu.Get_age(today)
-                    dict_ages.setdefault(age, 0)
-                    dict_ages[age] += 1
+                dict_ages = donnees.Ages(today)
                 liste_ages = [(age, nbre) for age, nbre in dict_ages.items() if age]
                 liste_ages = sorted(liste_ages, key=operator.itemgetter(0))
 
@@ -260,13 +247,7 @@ class View(CustomView, TemplateView):
                 ))
 
                 # Calcul des années de naissance
-                annees_naiss = {}
-                for individu in Individu.objects.filter(condition).distinct():
-                    if individu.date_naiss:
-                        annees_naiss.setdefault(individu.date_naiss.year, 0)
-                        annees_naiss[individu.date_naiss.year] += 1
-                liste_annees_naiss = [(annee, nbre) for annee, nbre in annees_naiss.items()]
-                liste_annees_naiss.sort()
+                liste_annees_naiss = donnees.Annees_naissance()
 
                 # Tableau : Répartition par année de naissance
                 data.append(Tableau(
@@ -285,11 +266,7 @@ class View(CustomView, TemplateView):
             if rubrique == "individus_coordonnees":
 
                 # Tableau : Répartition des individus par ville de résidence
-                villes = {}
-                for ville, nbre in Individu.objects.filter(condition).values_list("ville_resid").annotate(nbre=Count("idindividu", distinct=True)).order_by("ville_resid"):
-                    villes.setdefault(ville, 0)
-                    villes[ville] += nbre
-                liste_villes = [(ville, nbre) for ville, nbre in villes.items()]
+                liste_villes = sorted(donnees.Par_caracteristique("villes"), key=lambda item: (item[0] is not None, item[0] or ""))
 
                 data.append(Tableau(
                     titre="Répartition des individus par ville de résidence",
@@ -309,12 +286,10 @@ class View(CustomView, TemplateView):
             if rubrique == "individus_scolarite":
 
                 date_reference = presents[0] if presents else datetime.date.today()
-                nbre_individus_total = Individu.objects.filter(condition).distinct().count()
+                nbre_individus_total = donnees.Nbre_individus()
 
                 # Recherche de l'école des individus
-
-                condition_temp = Q(scolarite__date_debut__lte=date_reference, scolarite__date_fin__gte=date_reference)
-                individus = list(Individu.objects.filter(condition, condition_temp).values_list("scolarite__ecole__nom").annotate(nbre=Count("idindividu", distinct=True)).order_by("nbre"))
+                individus = donnees.Par_scolarite(date_reference, champ="ecole")
                 nbre_individus_avec_scolarite = 0
                 for item in individus:
                     nbre_individus_avec_scolarite += item[1]
@@ -337,8 +312,7 @@ class View(CustomView, TemplateView):
                 ))
 
                 # Recherche du niveau des individus
-                condition_temp = Q(scolarite__date_debut__lte=date_reference, scolarite__date_fin__gte=date_reference, scolarite__niveau__nom__isnull=False)
-                individus = list(Individu.objects.filter(condition, condition_temp).values_list("scolarite__niveau__nom").annotate(nbre=Count("idindividu", distinct=True)).order_by("nbre"))
+                individus = donnees.Par_scolarite(date_reference, champ="niveau")
                 nbre_individus_avec_scolarite = 0
                 for item in individus:
                     nbre_individus_avec_scolarite += item[1]
@@ -365,7 +339,7 @@ class View(CustomView, TemplateView):
             if rubrique == "individus_profession":
 
                 # Tableau : Répartition des individus par catégorie socio-professionnelle
-                individus = Individu.objects.filter(condition).values_list("categorie_travail__nom").annotate(nbre=Count("idindividu", distinct=True)).order_by("-nbre")
+                individus = sorted(donnees.Par_caracteristique("categories_travail"), key=lambda item: -item[1])
                 data.append(Tableau(
                     titre="Répartition des individus par catégorie socio-professionnelle",
                     colonnes=["Catégorie", "Nombre d'individus"],
@@ -381,42 +355,30 @@ class View(CustomView, TemplateView):
 
 
 
-            # ================================ FAMILLES ====================================
-
-            if rubrique.startswith("familles"):
-                if presents:
-                    condition = Q(rattachement__individu__consommation__activite__in=liste_activites, rattachement__individu__consommation__date__gte=presents[0], rattachement__individu__consommation__date__lte=presents[1], rattachement__individu__consommation__etat__in=parametres["etats"])
-                else:
-                    condition = Q(rattachement__individu__inscription__activite__in=liste_activites)
-
             # ---------------------------- FAMILLES : Nombre -------------------------------
             if rubrique == "familles_nombre":
 
                 # Texte : Nombre d'individus total
-                data.append(Texte(texte="%d familles dont au moins un membre est %s." % (Famille.objects.filter(condition).distinct().count(), "présent" if presents else "inscrit")))
+                data.append(Texte(texte="%d familles dont au moins un membre est %s." % (donnees.Nbre_familles(), "présent" if presents else "inscrit")))
 
                 # Tableau : Répartition des familles par activité
-                familles = Famille.objects.filter(condition).values_list("rattachement__individu__%s__activite__nom" % ("consommation" if presents else "inscription")).annotate(nbre=Count("idfamille", distinct=True)).order_by("-nbre")
                 data.append(Tableau(
                     titre="Répartition du nombre de familles par activité",
                     colonnes=["Activité", "Nombre de familles"],
-                    lignes=[(item[0], item[1]) for item in familles]
+                    lignes=donnees.Par_activite(familles=True)
                 ))
 
                 # Chart : Evolution du nombre de familles - comparatif par période
                 if presents:
                     liste_periodes= Calcule_periodes_comparatives(parametres, presents, liste_activites)
                     if liste_periodes:
-                        liste_labels, liste_valeurs = [], []
-                        for dict_periode in liste_periodes:
-                            condition_temp = Q(rattachement__individu__consommation__activite__in=liste_activites, rattachement__individu__consommation__date__gte=dict_periode["date_debut"], rattachement__individu__consommation__date__lte=dict_periode["date_fin"], rattachement__individu__consommation__etat__in=parametres["etats"])
-                            liste_labels.append(dict_periode["label"])
-                            liste_valeurs.append(Famille.objects.filter(condition_temp).distinct().count())
-                        data.append(Histogramme(titre="Evolution du nombre des familles", type_chart="bar", labels=liste_labels, valeurs=liste_valeurs))
+                        data.append(Histogramme(titre="Evolution du nombre des familles", type_chart="bar",
+                            labels=[dict_periode["label"] for dict_periode in liste_periodes],
+                            valeurs=donnees.Par_periode(liste_periodes, familles=True)))
 
                 # Chart : Nombre de familles par date
                 if presents:
-                    familles = Famille.objects.filter(condition).values_list('rattachement__individu__consommation__date').annotate(nbre=Count('idfamille', distinct=True)).order_by('rattachement__individu__consommation__date')
+                    familles = donnees.Par_date(familles=True)
                     data.append(Histogramme(
                         titre="Nombre familles par date", type_chart="line",
                         labels=[utils_dates.ConvertDateToFR(date) for date, nbre in familles],
@@ -427,7 +389,7 @@ class View(CustomView, TemplateView):
             # ---------------------------- FAMILLES : Caisse -------------------------------
             if rubrique == "familles_caisse":
 
-                familles = Famille.objects.filter(condition).values_list("caisse__nom").annotate(nbre=Count("idfamille", distinct=True)).order_by("-nbre")
+                familles = donnees.Par_caisse()
 
                 # Tableau : Répartition des familles par caisse
                 data.append(Tableau(
@@ -446,12 +408,7 @@ class View(CustomView, TemplateView):
             # ---------------------------- FAMILLES : Composition -------------------------------
 
             if rubrique == "familles_composition":
-                familles = Individu.objects.filter(condition).values_list("inscription__famille").annotate(nbre=Count("idindividu", distinct=True)).order_by("nbre")
-                dict_familles = {}
-                for item in familles:
-                    dict_familles.setdefault(item[1], 0)
-                    dict_familles[item[1]] += 1
-                familles = [(key, valeur) for key, valeur in dict_familles.items()]
+                familles = donnees.Composition()
 
                 # Tableau : Composition des familles
                 data.append(Tableau(titre="Composition des familles",
@@ -468,30 +425,16 @@ class View(CustomView, TemplateView):
             if rubrique == "familles_qf":
 
                 # Récupération des tranches de qf
-                dict_tranches = {None: 0}
+                tranches = []
                 try:
                     for tranche in parametres["tranches_qf"].split(";"):
                         qf_min, qf_max = tranche.split("-")
-                        dict_tranches[(int(qf_min), int(qf_max))] = 0
+                        tranches.append((int(qf_min), int(qf_max)))
                 except:
                     data.append(Texte("Erreur : Les tranches de QF saisies semblent erronées."))
 
-                # Recherche des qf des familles
-                familles = Famille.objects.filter(condition).distinct()
-                condition_qf = Q(famille__in=familles, date_debut__lte=presents[1], date_fin__gte=presents[0]) if presents else Q(famille__in=familles)
-                dict_quotients = {quotient.famille_id: quotient.quotient for quotient in Quotient.objects.filter(condition_qf).order_by("date_debut")}
-
-                # Regroupement des qf par tranche
-                for famille in familles:
-                    quotient = dict_quotients.get(famille.pk, None)
-                    found = False
-                    if quotient:
-                        for tranche, nbre in dict_tranches.items():
-                            if tranche and tranche[0] <= quotient <= tranche[1]:
-                                dict_tranches[tranche] += 1
-                                found = True
-                    if not found:
-                        dict_tranches[None] += 1
+                # Regroupement des qf des familles par tranche
+                dict_tranches = donnees.Par_tranche_qf(tranches)
 
                 def Formate_tranche(tranche):
                     return "%d - %d" % tranche if tranche else "Autre ou inconnu"
@@ -21,6 +21,7 @@ class Formulaire(FormulaireBase, ModelForm):
     envoi_lot = forms.ChoiceField(label="Envoi par lot", choices=[("oui", "Activé"), ("non", "Désactivé")], initial="non", required=False, help_text="L'envoi par lot est recommandé si votre fournisseur de messagerie impose des limites d'envoi. Par exemple, Gmail permet d'envoyer uniquement 60 mails par minute.")
     nbre_mails = forms.IntegerField(label="Nombre de mails par lot", initial=50, min_value=0,required=False, help_text="Saisissez le nombre de mails à envoyer avant la pause.")
     duree_pause = forms.IntegerField(label="Durée de la pause (secondes)", initial=60, min_value=0, required=False, help_text="Saisissez le nombre de secondes de pause à appliquer entre chaque envoi de lot.")
+    nbre_connexions = forms.IntegerField(label="Connexions simultanées", initial=1, min_value=1, max_value=10, required=False, help_text="Saisissez le nombre de connexions ouvertes simultanément pour les envois groupés (1 par défaut). Vérifiez les limites imposées par votre fournisseur de messagerie.")
 
     class Meta:
         model = AdresseMail
@@ -54,6 +55,8 @@ class Formulaire(FormulaireBase, ModelForm):
             self.fields['envoi_lot'].initial = "oui"
             self.fields['nbre_mails'].initial = int(parametres["nbre_mails"])
             self.fields['duree_pause'].initial = int(parametres["duree_pause"])
+        if "nbre_connexions" in parametres:
+            self.fields['nbre_connexions'].initial = int(parametres["nbre_connexions"])
 
         # Affichage
         self.helper.layout = Layout(
@@ -78,6 +81,7 @@ class Formulaire(FormulaireBase, ModelForm):
                 Field('envoi_lot'),
                 Field('nbre_mails'),
                 Field('duree_pause'),
+                Field('nbre_connexions'),
             ),
             Fieldset("Options",
                 Field("lien_desinscription"),
@@ -132,6 +136,9 @@ class Formulaire(FormulaireBase, ModelForm):
             parametres.append("nbre_mails==%d" % int(self.cleaned_data["nbre_mails"]))
             parametres.append("duree_pause==%d" % int(self.cleaned_data["duree_pause"]))
 
+        if self.cleaned_data["moteur"] != "console" and (self.cleaned_data["nbre_connexions"] or 1) > 1:
+            parametres.append("nbre_connexions==%d" % int(self.cleaned_data["nbre_connexions"]))
+
         if self.cleaned_data["moteur"] == "mailjet":
             parametres.append("api_key==%s" % self.cleaned_data["cle_api"])
             parametres.append("api_secret==%s" % self.cleaned_data["cle_secrete"])
@@ -170,6 +177,7 @@ function On_change_moteur() {
     $('#div_id_envoi_lot').hide();
     $('#div_id_nbre_mails').hide();
     $('#div_id_duree_pause').hide();
+    $('#div_id_nbre_connexions').hide();
 
     if($(this).val() == 'smtp') {
         $('#div_id_adresse').show();
@@ -182,6 +190,7 @@ function On_change_moteur() {
         $('#div_id_use_tls').show();
         $('#div_id_accuse').show();
         $('#div_id_envoi_lot').show();
+        $('#div_id_nbre_connexions').show();
         $("#id_envoi_lot").trigger("change");
     }
     
@@ -190,11 +199,13 @@ function On_change_moteur() {
         $('#div_id_nom_adresse').show();
         $('#div_id_cle_api').show();
         $('#div_id_cle_secrete').show();
+        $('#div_id_nbre_connexions').show();
     }
 
     if($(this).val() == 'brevo') {
         $('#div_id_adresse').show();
         $('#div_id_cle_api').show();
+        $('#div_id_nbre_connexions').show();
     }
 
 
@@ -143,7 +143,7 @@ class Consulter(Page, crud.Liste):
                     <a href="%s" data-toggle="lightbox" data-title="%s" data-gallery="gallery">
                         <img class="img-fluid img-thumbnail" style="max-height: 100px;" src="%s">
                     </a>
-                """ % (instance.fichier.url, instance.titre or "Sans titre", instance.fichier.url)
+                """ % (instance.Get_url_apercu(), instance.titre or "Sans titre", instance.Get_url_miniature())
             return ""
 
         def Get_actions_speciales(self, instance, *args, **kwargs):
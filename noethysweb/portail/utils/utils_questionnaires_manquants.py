@@ -38,33 +38,45 @@ def est_question_complétée(reponse):
 
     return False
 
-def Get_question_individu(individu):
+def Get_questions_manquantes_individus(individus=[]):
     """
-    Retourne la liste des questions non complétées pour l'individu.
+    Retourne un dict {IDindividu: [questions non complétées]} pour une liste d'individus,
+    en un nombre fixe de requêtes quel que soit le nombre d'individus et de questions.
     """
-    # Activités de l'individu
-    inscriptions = Inscription.objects.filter(individu=individu)
-    activite_ids = inscriptions.values_list('activite', flat=True).distinct()
-    activites = Activite.objects.filter(idactivite__in=activite_ids, structure__visible=True)
+    idindividus = [individu.pk for individu in individus]
+
+    # Activités visibles de chaque individu
+    dict_activites = {}
+    for idindividu, idactivite in Inscription.objects.filter(individu_id__in=idindividus, activite__structure__visible=True).values_list("individu_id", "activite_id").distinct():
+        dict_activites.setdefault(idindividu, set()).add(idactivite)
 
-    # Toutes les questions
-    questions = QuestionnaireQuestion.objects.filter(
+    # Toutes les questions de ces activités
+    toutes_activites = set().union(*dict_activites.values()) if dict_activites else set()
+    questions = list(QuestionnaireQuestion.objects.filter(
         categorie="individu",
         visible_portail=True,
-        activite__in=activites
-    ).order_by("ordre")
+        activite__in=toutes_activites
+    ).order_by("ordre"))
+
+    # Première réponse de chaque individu à chaque question
+    dict_reponses = {}
+    for reponse in QuestionnaireReponse.objects.select_related("question").filter(individu_id__in=idindividus, question__in=questions).order_by("pk"):
+        dict_reponses.setdefault((reponse.individu_id, reponse.question_id), reponse)
 
     # Filtrage des questions non complétées
-    questions_non_complétées = []
-    for question in questions:
-        reponse = QuestionnaireReponse.objects.filter(
-            individu=individu,
-            question=question
-        ).first()
-        if not reponse or not est_question_complétée(reponse):
-            questions_non_complétées.append(question)
+    resultats = {}
+    for idindividu in idindividus:
+        activites = dict_activites.get(idindividu, set())
+        resultats[idindividu] = [question for question in questions if question.activite_id in activites
+                                 and not est_question_complétée(dict_reponses.get((idindividu, question.pk), None))]
+    return resultats
+
 
-    return questions_non_complétées
+def Get_question_individu(individu):
+    """
+    Retourne la liste des questions non complétées pour l'individu.
+    """
+    return Get_questions_manquantes_individus([individu])[individu.pk]
 
 
 def Get_questions_manquantes_famille(famille):
@@ -77,15 +89,16 @@ def Get_questions_manquantes_famille(famille):
 
     result = {}
 
-    rattachements = Rattachement.objects.select_related('individu').filter(
+    rattachements = list(Rattachement.objects.select_related('individu').filter(
         famille=famille,
         individu__deces=False
-    )
+    ))
+    questions_individus = Get_questions_manquantes_individus([rattachement.individu for rattachement in rattachements])
 
     for rattachement in rattachements:
         individu = rattachement.individu
 
-        questions_manquantes = Get_question_individu(individu)
+        questions_manquantes = questions_individus[individu.pk]
 
         result[individu.pk] = {
             "individu": individu,
@@ -94,4 +107,4 @@ def Get_questions_manquantes_famille(famille):
             "nbre": len(questions_manquantes),
         }
 
-    return result
\ No newline at end of file
+    return result
@@ -11,13 +11,12 @@ from django.utils.translation import gettext as _
 from django.views.generic import TemplateView
 
 from core.models import Article, Consommation, Inscription, Lecture, PortailMessage
-from cotisations.utils import utils_cotisations_manquantes
+from core.utils import utils_completude
 from individus.utils import (
     utils_assurances,
-    utils_pieces_manquantes,
     utils_vaccinations,
 )
-from portail.utils import utils_approbations, utils_renseignements_manquants, utils_questionnaires_manquants, utils_sondages_manquants
+from portail.utils import utils_approbations
 from portail.views.base import CustomView
 
 
@@ -36,34 +35,16 @@ class Accueil(CustomView, TemplateView):
         context = super(Accueil, self).get_context_data(**kwargs)
         context['page_titre'] = _("Accueil")
 
-        # Pièces manquantes
-        context['nbre_pieces_manquantes'] = len(utils_pieces_manquantes.Get_pieces_manquantes(famille=self.request.user.famille, only_invalides=True, exclure_individus=self.request.user.famille.individus_masques.all()))
-
-        # Renseignements manquants
-        renseignements_manquants = utils_renseignements_manquants.Get_renseignements_manquants(famille=self.request.user.famille)
-        context['nbre_renseignements_manquants'] = renseignements_manquants['nbre']
-        context['premier_rattachement_manquant_id'] = renseignements_manquants['premier_rattachement_id']
-        context['page_cible_renseignements'] = renseignements_manquants['page_cible']
-
-        # Questionnaires manquants (par individu)
-        questions_manquantes_famille = utils_questionnaires_manquants.Get_questions_manquantes_famille(famille=self.request.user.famille)
-        # Mise dans le contexte (pour affichage détaillé si besoin)
-        context['questions_manquantes_famille'] = questions_manquantes_famille
-        nbre_questionnaires_manquants = 0
-        premier_questionnaire_manquant_id = None
-
-        for data in questions_manquantes_famille.values():
-            if data["nbre"] > 0:
-                nbre_questionnaires_manquants += data["nbre"]
-
-                if premier_questionnaire_manquant_id is None:
-                    premier_questionnaire_manquant_id = data["rattachement"].pk
-
-        context['nbre_questionnaires_manquants'] = nbre_questionnaires_manquants
-        context['premier_questionnaire_manquant_id'] = premier_questionnaire_manquant_id
+        # Complétude du dossier (pièces, renseignements, questionnaires, adhésions et sondages manquants)
+        completude = utils_completude.Get_completude(famille=self.request.user.famille)
+        context['nbre_pieces_manquantes'] = completude.nbre_pieces
+        context['nbre_renseignements_manquants'] = completude.nbre_renseignements
+        context['premier_rattachement_manquant_id'] = completude.idrattachement_renseignements
+        context['page_cible_renseignements'] = completude.page_renseignements
+        context['nbre_questionnaires_manquants'] = completude.nbre_questionnaires
+        context['premier_questionnaire_manquant_id'] = completude.idrattachement_questionnaires
         context['page_cible_questionnaires'] = 'questionnaires'
 
-
         # Messages non lus
         context['nbre_messages_non_lus'] = len(PortailMessage.objects.filter(famille=self.request.user.famille, utilisateur__isnull=False, date_lecture__isnull=True))
 
@@ -88,10 +69,10 @@ class Accueil(CustomView, TemplateView):
 
         # Adhésions manquantes
         if context["parametres_portail"].get("cotisations_afficher_page", False):
-            context["cotisations_manquantes"] = utils_cotisations_manquantes.Get_cotisations_manquantes(famille=self.request.user.famille, exclure_individus=self.request.user.famille.individus_masques.all())
+            context["nbre_cotisations_manquantes"] = completude.nbre_cotisations
 
         # Sondages manquants
-        context["nbre_sondages_manquants"] = len(utils_sondages_manquants.Get_sondages_manquants(famille=self.request.user.famille))
+        context["nbre_sondages_manquants"] = completude.nbre_sondages
 
             # Articles
         conditions = Q(structure__visible=True) & Q(statut="publie") & Q(date_debut__lte=datetime.datetime.now()) & (Q(date_fin__isnull=True) | Q(date_fin__gte=datetime.datetime.now()))
@@ -13,7 +13,7 @@ from django.shortcuts import redirect
 from portail.views.menu import GetMenuPrincipal
 from noethysweb.version import GetVersion
 from core.models import Organisateur, Parametre, PortailMessage, Famille, Structure
-from core.utils import utils_parametres, utils_portail, utils_historique
+from core.utils import utils_parametres, utils_portail, utils_historique, utils_cache
 from django.db.models import OuterRef, Subquery
 from django.utils import timezone
 from datetime import timedelta
@@ -54,10 +54,7 @@ class CustomView(LoginRequiredMixin, UserPassesTestMixin):
         context['version_application'] = cache.get_or_set('version_application', GetVersion())
 
         # Organisateur
-        organisateur = cache.get('organisateur')
-        if not organisateur:
-            organisateur = Organisateur.objects.filter(pk=1).first()
-            cache.set('organisateur', organisateur)
+        organisateur = utils_cache.Get_organisateur()
         context['organisateur'] = organisateur
 
         # Paramètres du portail
@@ -13,7 +13,7 @@ from django.contrib.auth.models import update_last_login
 from noethysweb.version import GetVersion
 from portail.forms.login import FormLoginFamille
 from core.models import Organisateur, ImageFond
-from core.utils import utils_portail, utils_historique
+from core.utils import utils_portail, utils_historique, utils_cache
 
 
 class ClassCommuneLogin:
@@ -27,10 +27,7 @@ class ClassCommuneLogin:
         context['version_application'] = cache.get_or_set('version_application', GetVersion())
 
         # Organisateur
-        organisateur = cache.get('organisateur')
-        if not organisateur:
-            organisateur = Organisateur.objects.filter(pk=1).first()
-            cache.set('organisateur', organisateur)
+        organisateur = utils_cache.Get_organisateur()
         context['organisateur'] = organisateur
 
         # Paramètres du portail
@@ -0,0 +1,68 @@
+import datetime
+
+import pytest
+
+from consommations.utils.utils_impression_etat_global import FONCTIONS_FORMULE
+from core.utils import utils_resolveur_formule
+
+
+def Evaluer(formule="", **valeurs):
+    return utils_resolveur_formule.Expression(formule, FONCTIONS_FORMULE).Evaluer(valeurs)
+
+
+@pytest.mark.parametrize("formule", [
+    "debut.__class__",
+    "debut.__dict__",
+    "__import__('os')",
+    "__builtins__",
+    "_variable",
+    "[x for x in (1, 2)]",
+    "(lambda: 1)()",
+    "open('fichier')",
+    "HEURE(*unite1)",
+    "SI(**unite1)",
+    "b'octets'",
+])
+def test_elements_non_autorises(formule):
+    with pytest.raises((ValueError, SyntaxError)):
+        utils_resolveur_formule.Expression(formule, FONCTIONS_FORMULE)
+
+
+def test_import_refuse():
+    with pytest.raises(SyntaxError):
+        utils_resolveur_formule.Expression("import os", FONCTIONS_FORMULE)
+
+
+def test_operateurs_logiques():
+    assert Evaluer("unite1 ET unite2", unite1=True, unite2=False) is False
+    assert Evaluer("unite1 OU unite2", unite1=False, unite2=True) is True
+    assert Evaluer("unite1 = 2 ET unite2 <> 3", unite1=2, unite2=4) is True
+
+
+def test_si():
+    assert Evaluer("SI(duree > HEURE('2h'), 1, 0)", duree=datetime.timedelta(hours=3)) == 1
+    assert Evaluer("SI(unite1 OU unite2, duree)", unite1=None, unite2=None, duree=datetime.timedelta(hours=3)) == datetime.timedelta(0)
+
+
+def test_arithmetique_heure():
+    assert Evaluer("HEURE('1h30') * 2") == datetime.timedelta(hours=3)
+    assert Evaluer("2 * HEURE('0h45')") == datetime.timedelta(minutes=90)
+    assert Evaluer("duree - HEURE('0h30')", duree=datetime.timedelta(hours=2)) == datetime.timedelta(hours=1, minutes=30)
+
+
+@pytest.mark.parametrize("formule", [
+    "'x' * 1000000000",
+    "1000000000 * 'x'",
+    "('x' + 'y') * 10",
+    "SI(unite1, 'x', 'y') * 10",
+    "(unite1 OU 'x') * 10",
+    "'%s' % unite1",
+])
+def test_repetition_texte_refusee(formule):
+    with pytest.raises(ValueError):
+        utils_resolveur_formule.Expression(formule, FONCTIONS_FORMULE)
+
+
+def test_calcul_champs():
+    assert utils_resolveur_formule.ResolveurCalcul("{A} * {B}", {"{A}": 2, "{B}": 3}) == "6"
+    assert utils_resolveur_formule.ResolveurCalcul("{A} + 1", {"{A}": ""}) == ""
@@ -0,0 +1,38 @@
+import datetime
+
+import pytest
+
+from core.models import Activite, Consommation, Famille, Individu, Rattachement, Structure, Unite
+from core.utils import utils_cache
+from outils.utils import utils_statistiques
+
+
+@pytest.mark.django_db
+def test_familles_par_periode_avec_individus_hors_periode_principale():
+    # Les données mémorisées par une exécution précédente ne doivent pas être réutilisées
+    utils_cache.Invalider_categorie("statistiques")
+    structure = Structure.objects.create(nom="Structure")
+    activite = Activite.objects.create(nom="Accueil", structure=structure, date_debut=datetime.date(2023, 1, 1), date_fin=datetime.date(2024, 12, 31))
+    unite = Unite.objects.create(nom="Journée", activite=activite, ordre=1)
+
+    def Creer_present(nom="", dates=[]):
+        famille = Famille.objects.create(nom=nom)
+        individu = Individu.objects.create(nom=nom, prenom="Enfant")
+        Rattachement.objects.create(famille=famille, individu=individu, categorie=2)
+        for date in dates:
+            Consommation.objects.create(individu=individu, activite=activite, unite=unite, date=date, etat="present")
+
+    # Présent sur les deux périodes
+    Creer_present("DUPONT", [datetime.date(2023, 1, 10), datetime.date(2024, 1, 10)])
+    # Présent uniquement sur la période comparative
+    Creer_present("MARTIN", [datetime.date(2023, 1, 15)])
+
+    donnees = utils_statistiques.Donnees(activites=[activite], presents=(datetime.date(2024, 1, 1), datetime.date(2024, 1, 31)), etats=["present"])
+    periodes = [
+        {"date_debut": datetime.date(2023, 1, 1), "date_fin": datetime.date(2023, 1, 31)},
+        {"date_debut": datetime.date(2024, 1, 1), "date_fin": datetime.date(2024, 1, 31)},
+    ]
+    assert donnees.Par_periode(periodes) == [2, 1]
+    assert donnees.Par_periode(periodes, familles=True) == [2, 1]
+    # Les familles de la période principale ne sont pas affectées par les périodes comparatives
+    assert donnees.Nbre_familles() == 1